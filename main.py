@@ -1,14 +1,37 @@
 from datetime import datetime
 
+import numpy as np
 import streamlit as st
 from streamlit_folium import st_folium
 from streamlit_js_eval import get_geolocation
 
+from src.config import MAP_CLUSTERING, MAP_TILES_URL, ROUTE_DATA_SOURCE
 from src.constants import CATEGORIES as categories
-from src.data_loader import load_data
-from src.llm_utils import generate_enhanced_fallback_explanation, generate_route_explanation
-from src.map_utils import create_interactive_map
+from src.constants import (
+    DEFAULT_CATEGORIES,
+    MAP_CLUSTER_MIN_OBJECTS,
+    MAP_MARKERS_RADIUS,
+    POPULAR_POINTS,
+    ROUTE_MODES,
+)
+from src.data_loader import (
+    load_catalog_legs,
+    load_data,
+    load_data_version,
+    load_leg_matrix,
+    load_marker_clusters,
+    load_pedestrian_graph,
+    load_route_area,
+    load_spatial_index,
+    sync_dataset_version,
+)
+from src.llm_utils import generate_enhanced_fallback_explanation, start_route_explanation
+from src.map_utils import create_base_map, create_cluster_layer, create_route_layer, create_tiles_map
+from src.marker_clusters import viewport_bounds
+from src.route_cache import route_cache
 from src.routing import generate_route_description, plan_route
+from src.scoring import route_reach
+from src.tracing import span, start_metrics_server
 from src.utils import generate_yandex_maps_url, apply_chat_style, chat_response
 
 
@@ -16,7 +39,7 @@ def _init_state():
     if "start_position" not in st.session_state:
         st.session_state.start_position = (56.326887, 44.005986)
     if "selected_categories" not in st.session_state:
-        st.session_state.selected_categories = [1, 2, 7]
+        st.session_state.selected_categories = list(DEFAULT_CATEGORIES)
     if "route_built" not in st.session_state:
         st.session_state.route_built = False
     if "current_route" not in st.session_state:
@@ -27,8 +50,148 @@ def _init_state():
         st.session_state.explanation_generating = False
     if "used_llm_route_explanation" not in st.session_state:
         st.session_state.used_llm_route_explanation = False
+    if "explanation_job" not in st.session_state:
+        st.session_state.explanation_job = None
     if "getting_location" not in st.session_state:
         st.session_state.getting_location = False
+    if "last_map_click" not in st.session_state:
+        st.session_state.last_map_click = None
+
+
+def _route_planner(df, index, graph, selected_categories, total_time, search_radius, route_mode):
+    """
+    Функция без аргументов, строящая маршрут для текущих настроек (её вызывает кэш
+    маршрутов). В режиме postgis окрестность старта загружается из БД один раз.
+    """
+    start = st.session_state.start_position
+    area = []
+
+    def plan():
+        if ROUTE_DATA_SOURCE == "postgis":
+            if not area:
+                area.append(load_route_area(start, route_reach(search_radius, total_time), selected_categories))
+            return plan_route(
+                start,
+                selected_categories,
+                total_time,
+                area[0],
+                search_radius,
+                leg_matrix=load_leg_matrix(),
+                router=graph,
+                mode=route_mode,
+            )
+        return plan_route(
+            start,
+            selected_categories,
+            total_time,
+            df,
+            search_radius,
+            index=index,
+            leg_matrix=load_catalog_legs(),
+            router=graph,
+            mode=route_mode,
+        )
+
+    return plan
+
+
+def _stream_explanation(job, box, placeholder):
+    """
+    Дописывает текст фоновой генерации в пузырь чата, пока она не закончится.
+    Вызывается в конце скрипта: карта и детали маршрута к этому моменту уже
+    отрисованы. Если пользователь перезапустит скрипт, генерация продолжится,
+    а следующий запуск подхватит уже полученный текст.
+    """
+    while not job.wait(0.1):
+        with placeholder.container():
+            chat_response(job.text + " ▌", True)
+
+    if job.error:
+        box.error(f"❌ Ошибка Yandex GPT: {job.error}")
+    if not job.used_llm:
+        box.warning("⚠️ Yandex GPT временно недоступен, используем стандартное описание")
+    st.session_state.route_explanation = job.text
+    st.session_state.used_llm_route_explanation = job.used_llm
+    st.session_state.explanation_generating = False
+    st.session_state.explanation_job = None
+    with placeholder.container():
+        chat_response(job.text, job.used_llm)
+
+
+def _use_clusters(index, selected_categories) -> bool:
+    if MAP_CLUSTERING == "off" or index is None:
+        return False
+    if MAP_CLUSTERING == "on":
+        return True
+    return int(np.isin(index.arrays.category_ids, selected_categories).sum()) >= MAP_CLUSTER_MIN_OBJECTS
+
+
+def _render_map(df, index, graph, selected_categories, search_radius, route, height):
+    """
+    Карта с объектами и маршрутом. Если задан MAP_TILES_URL (по умолчанию — при
+    профиле compose "tiles"), объекты подгружает браузер векторными тайлами
+    (src.tile_server). Иначе обычный каталог рисуется
+    одним кэшируемым слоем маркеров, а большой — кластерами только для видимой
+    области: st_folium возвращает bounds и zoom, и при панорамировании
+    перестраивается лишь слой объектов.
+    """
+    start = st.session_state.start_position
+    with span("create_interactive_map") as build:
+        route_layer = create_route_layer(start, search_radius, route, router=graph)
+        hidden_ids = [point["object"]["id"] for point in route or ()]
+        returned_objects = ["last_clicked"]
+
+        if MAP_TILES_URL:
+            build.set(layer="tiles")
+            map_obj = create_tiles_map(
+                selected_categories, start[0], start[1], MAP_TILES_URL, data_version=load_data_version()
+            )
+            layers = route_layer
+        elif _use_clusters(index, selected_categories):
+            build.set(layer="clusters")
+            map_obj = create_base_map(df, selected_categories, start[0], start[1], markers=False)
+            # Видимая область с прошлого перезапуска: состояние компонента доступно по key
+            # ещё до его отрисовки; при первом показе — оценка по центру и масштабу
+            view = st.session_state.get(map_obj.component_key) or {}
+            bounds = view.get("bounds") or {}
+            zoom = view.get("zoom") or 14
+            if (bounds.get("_southWest") or {}).get("lat") is not None:
+                bounds = (
+                    (bounds["_southWest"]["lat"], bounds["_southWest"]["lng"]),
+                    (bounds["_northEast"]["lat"], bounds["_northEast"]["lng"]),
+                )
+            else:
+                bounds = viewport_bounds(start, zoom, height=height)
+
+            objects_layer = create_cluster_layer(
+                df, load_marker_clusters(), selected_categories, bounds, zoom, hidden_ids
+            )
+            layers = [objects_layer, route_layer]
+            returned_objects = ["last_clicked", "bounds", "zoom"]
+        else:
+            build.set(layer="markers")
+            map_obj = create_base_map(
+                df,
+                selected_categories,
+                start[0],
+                start[1],
+                index=index,
+                markers_radius=MAP_MARKERS_RADIUS,
+                data_version=load_data_version(),
+                hidden_ids=hidden_ids,
+            )
+            layers = route_layer
+
+    with span("st_folium"):
+        return st_folium(
+            map_obj,
+            width=None,
+            height=height,
+            returned_objects=returned_objects,
+            key=map_obj.component_key,
+            center=start,
+            feature_group_to_add=layers,
+        )
 
 
 def main():  # noqa: C901
@@ -43,7 +206,11 @@ def main():  # noqa: C901
     """, unsafe_allow_html=True)
 
     _init_state()
-    df = load_data()
+    sync_dataset_version()
+    with span("load_data"):
+        df = load_data()
+    index = load_spatial_index()
+    graph = load_pedestrian_graph()
 
     st.sidebar.markdown(
         "<h2 style='color: #ff6b6b; font-size: 30px; text-align: center; font-weight: bold;'>Настройки маршрута</h2>",
@@ -74,23 +241,19 @@ def main():  # noqa: C901
         "Радиус поиска объектов (метров):", min_value=500, max_value=3000, value=1500, step=100
     )
 
+    route_mode = st.sidebar.selectbox(
+        "Режим построения маршрута:", list(ROUTE_MODES.keys()), format_func=ROUTE_MODES.get
+    )
+
     use_llm = st.sidebar.checkbox("🤖 Использовать ИИ для объяснения маршрута", value=True)
 
     st.sidebar.markdown(
         "<h2 style='color: #ff6b6b; font-size: 30px; text-align: center; font-weight: bold;'>Выбор точки старта</h2>",
         unsafe_allow_html=True
     )
-    popular_points = {
-        "Кремль": (56.326887, 44.005986),
-        "Площадь Минина": (56.327266, 44.006597),
-        "Большая Покровская": (56.318136, 43.995234),
-        "Набережная Федоровского": (56.325238, 43.985295),
-        "Стрелка": (56.334505, 43.976589),
-    }
-
-    selected_point = st.sidebar.selectbox("Выберите популярную точку и нажмите кнопку ниже:", list(popular_points.keys()))
+    selected_point = st.sidebar.selectbox("Выберите популярную точку и нажмите кнопку ниже:", list(POPULAR_POINTS.keys()))
     if st.sidebar.button("Установить точку старта"):
-        st.session_state.start_position = popular_points[selected_point]
+        st.session_state.start_position = POPULAR_POINTS[selected_point]
         st.session_state.route_built = False
         st.session_state.route_explanation = None
         st.session_state.explanation_generating = False
@@ -122,12 +285,27 @@ def main():  # noqa: C901
             st.sidebar.error("Пожалуйста, выберите хотя бы одну категорию!")
         else:
             with st.spinner("Построение маршрута..."):
-                route = plan_route(st.session_state.start_position, selected_categories, total_time, df, search_radius)
+                data_version = load_data_version()
+                route_cache.invalidate(data_version)
+                route = route_cache.get_or_plan(
+                    route_cache.key(
+                        st.session_state.start_position,
+                        selected_categories,
+                        total_time,
+                        search_radius,
+                        route_mode,
+                        data_version,
+                    ),
+                    _route_planner(df, index, graph, selected_categories, total_time, search_radius, route_mode),
+                    # Оптимизатор детерминирован: несколько его запусков дали бы один маршрут
+                    pool_size=1 if route_mode == "optimized" else None,
+                )
             if route:
                 st.session_state.current_route = route
                 st.session_state.route_built = True
                 st.session_state.route_explanation = None
                 st.session_state.explanation_generating = True
+                st.session_state.explanation_job = None
                 st.sidebar.success(f"✅ Маршрут построен! Посещено объектов: {len(route)}")
                 st.rerun()
             else:
@@ -150,29 +328,25 @@ def main():  # noqa: C901
         )
 
         with st.spinner("Загружаем карту..."):
-            map_obj = create_interactive_map(
-                df,
-                selected_categories,
-                st.session_state.start_position[0],
-                st.session_state.start_position[1],
-                search_radius,
-                st.session_state.start_position,
-                None,
-            )
-
-            map_data = st_folium(map_obj, width=None, height=600, returned_objects=["last_clicked"])
+            map_data = _render_map(df, index, graph, selected_categories, search_radius, None, height=600)
 
             if map_data and map_data.get("last_clicked"):
                 clicked_lat = map_data["last_clicked"]["lat"]
                 clicked_lon = map_data["last_clicked"]["lng"]
 
-                if (clicked_lat, clicked_lon) != st.session_state.start_position:
+                # С постоянным key последний клик сохраняется между перезапусками —
+                # реагируем только на новый
+                if (clicked_lat, clicked_lon) != st.session_state.last_map_click:
+                    st.session_state.last_map_click = (clicked_lat, clicked_lon)
                     st.session_state.start_position = (clicked_lat, clicked_lon)
                     st.session_state.route_built = False
                     st.session_state.route_explanation = None
                     st.session_state.explanation_generating = False
                     st.rerun()
     else:
+        # В session_state лежит компактный Route (только id и числа по переходам);
+        # строки каталога подставляются один раз за перезапуск
+        route_points = st.session_state.current_route.resolve(df) if st.session_state.current_route else []
         col1, col2 = st.columns([2, 1])
 
         with col1:
@@ -182,49 +356,41 @@ def main():  # noqa: C901
             )
 
             with st.spinner("Строим маршрут..."):
-                map_obj = create_interactive_map(
-                    df,
-                    selected_categories,
-                    st.session_state.start_position[0],
-                    st.session_state.start_position[1],
-                    search_radius,
-                    st.session_state.start_position,
-                    st.session_state.current_route
+                map_data = _render_map(
+                    df, index, graph, selected_categories, search_radius, route_points, height=500
                 )
 
-                map_data = st_folium(map_obj, width=None, height=500, returned_objects=["last_clicked"])
-
                 if map_data and map_data.get("last_clicked"):
                     clicked_lat = map_data["last_clicked"]["lat"]
                     clicked_lon = map_data["last_clicked"]["lng"]
 
-                    if (clicked_lat, clicked_lon) != st.session_state.start_position:
+                    if (clicked_lat, clicked_lon) != st.session_state.last_map_click:
+                        st.session_state.last_map_click = (clicked_lat, clicked_lon)
                         st.session_state.start_position = (clicked_lat, clicked_lon)
                         st.session_state.route_built = False
                         st.session_state.route_explanation = None
                         st.session_state.explanation_generating = False
                         st.rerun()
 
+            explanation_box = st.container()
             if (use_llm and
                     st.session_state.explanation_generating and
                     st.session_state.route_explanation is None):
-                with st.spinner("🎨 Создаем красочное описание маршрута с ИИ..."):
-                    explanation = generate_route_explanation(
-                        st.session_state.current_route,
+                # Объяснение генерируется в фоне и дописывается в чат ниже, после
+                # того как отрисованы карта и детали маршрута
+                if st.session_state.explanation_job is None:
+                    st.session_state.explanation_job = start_route_explanation(
+                        route_points,
                         selected_categories,
                         total_time,
                         categories,
                         st.session_state.start_position
                     )
-                    st.session_state.route_explanation = explanation
-                    st.session_state.explanation_generating = False
-                    st.session_state.used_llm_route_explanation = True
-                    st.rerun()
             elif (st.session_state.explanation_generating and
                     st.session_state.route_explanation is None):
                 with st.spinner("❓ Создаем объяснение маршрута..."):
                     explanation = generate_enhanced_fallback_explanation(
-                            st.session_state.current_route,
+                            route_points,
                             selected_categories,
                             total_time,
                             categories,
@@ -234,15 +400,17 @@ def main():  # noqa: C901
                     st.session_state.used_llm_route_explanation = False
                     st.rerun()
 
+            apply_chat_style()
+            explanation_placeholder = explanation_box.empty()
             if st.session_state.route_explanation:
-                apply_chat_style()
-                chat_response(st.session_state.route_explanation, st.session_state.used_llm_route_explanation)
+                with explanation_placeholder.container():
+                    chat_response(st.session_state.route_explanation, st.session_state.used_llm_route_explanation)
 
         with col2:
-            if st.session_state.current_route:
+            if route_points:
                 route = st.session_state.current_route
 
-                yandex_url = generate_yandex_maps_url(route, st.session_state.start_position)
+                yandex_url = generate_yandex_maps_url(route_points, st.session_state.start_position)
 
                 st.subheader("📍 Построенный маршрут")
 
@@ -255,10 +423,7 @@ def main():  # noqa: C901
 
                 st.subheader("📝 Детали маршрута")
 
-                total_distance = 0
-                total_time_route = 0
-
-                for i, point in enumerate(route, 1):
+                for i, point in enumerate(route_points, 1):
                     obj = point["object"]
 
                     with st.expander(f"{i}. {obj['title']}", expanded=(i == 1)):
@@ -270,20 +435,17 @@ def main():  # noqa: C901
 
                         st.code(f"Координаты: {obj['lat']:.6f}, {obj['lon']:.6f}")
 
-                    total_distance += point["distance"]
-                    total_time_route += point["travel_time"] + point["visit_time"]
-
                 st.subheader("📊 Итоги маршрута")
                 col_stat1, col_stat2, col_stat3 = st.columns(3)
 
                 with col_stat1:
-                    st.metric("Объектов", len(route))
+                    st.metric("Объектов", len(route_points))
                 with col_stat2:
-                    st.metric("Общее расстояние", f"{total_distance:.0f} м")
+                    st.metric("Общее расстояние", f"{route.total_distance:.0f} м")
                 with col_stat3:
-                    st.metric("Общее время", f"{total_time_route:.1f} мин")
+                    st.metric("Общее время", f"{route.total_time:.1f} мин")
 
-                description = generate_route_description(route)
+                description = generate_route_description(route_points)
                 st.download_button(
                     label="📥 Скачать описание маршрута",
                     data=description,
@@ -292,6 +454,12 @@ def main():  # noqa: C901
                     use_container_width=True,
                 )
 
+        if st.session_state.explanation_generating and st.session_state.explanation_job is not None:
+            _stream_explanation(st.session_state.explanation_job, explanation_box, explanation_placeholder)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    start_metrics_server()
+    # Один перезапуск скрипта — одна трасса: все спаны ниже получают ее trace_id
+    with span("script_run"):
+        main()
\ No newline at end of file
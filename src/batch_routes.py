@@ -0,0 +1,132 @@
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from src.catalog_store import load_catalog_df
+from src.constants import CATALOG_STORE_PATH, CATEGORIES, POPULAR_POINTS
+from src.data_loader import load_data
+from src.orienteering import optimize_route
+from src.route_model import Route
+from src.routing import build_greedy_route
+from src.scoring import CatalogArrays
+from src.spatial_index import GridIndex
+
+
+@dataclass(frozen=True)
+class RouteQuery:
+    """Один запрос пакетного планирования — те же параметры, что у plan_route."""
+
+    start: Tuple[float, float]
+    categories: Tuple[int, ...]
+    total_time: int
+    search_radius: int
+    mode: str = "greedy"
+    seed: Optional[int] = None
+
+
+# Данные процесса-воркера: DataFrame и индекс строятся один раз в initializer
+_worker_df: Optional[pd.DataFrame] = None
+_worker_index: Optional[GridIndex] = None
+
+
+def _init_worker(catalog: Union[pd.DataFrame, str]):
+    global _worker_df, _worker_index
+    # Путь к хранилищу каталога вместо DataFrame: воркер открывает файл через
+    # memory map, и каталог не копируется в каждый процесс
+    df = catalog if isinstance(catalog, pd.DataFrame) else load_catalog_df(catalog)
+    _worker_df = df
+    _worker_index = GridIndex(CatalogArrays.from_df(df))
+
+
+def _plan_one(query: RouteQuery) -> dict:
+    if query.mode == "optimized":
+        route = optimize_route(
+            query.start,
+            query.categories,
+            query.total_time,
+            _worker_df,
+            query.search_radius,
+            index=_worker_index,
+            seed=query.seed,
+        )
+    else:
+        route = build_greedy_route(
+            query.start,
+            query.categories,
+            query.total_time,
+            _worker_df,
+            query.search_radius,
+            index=_worker_index,
+            rng=random.Random(query.seed),
+        )
+    return route.to_dict()
+
+
+def plan_routes_batch(
+    queries: Sequence[RouteQuery],
+    catalog: Union[pd.DataFrame, str],
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> List[Route]:
+    """
+    Строит маршруты для множества запросов. Каталог передаётся каждому процессу
+    пула один раз, там же строится пространственный индекс; запросы раздаются
+    пачками по chunksize. workers=1 — без пула, в текущем процессе. catalog —
+    DataFrame или путь к хранилищу src.catalog_store (тогда процессы делят его
+    страницы через memory map).
+
+    Результат — Route для каждого запроса в порядке запросов; между процессами
+    маршруты передаются словарями Route.to_dict().
+    """
+    if workers == 1:
+        _init_worker(catalog)
+        return [Route.from_dict(_plan_one(q)) for q in queries]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalog,)) as pool:
+        return [Route.from_dict(r) for r in pool.map(_plan_one, queries, chunksize=chunksize)]
+
+
+def recommended_queries(
+    times: Sequence[int] = (60, 120, 180, 240),
+    radii: Sequence[int] = (1500,),
+    max_categories: int = len(CATEGORIES),
+) -> List[RouteQuery]:
+    """Все популярные точки старта × все сочетания категорий × время × радиус."""
+    queries = []
+    cat_ids = sorted(CATEGORIES)
+    for size in range(1, max_categories + 1):
+        for cats in itertools.combinations(cat_ids, size):
+            for start, total_time, radius in itertools.product(POPULAR_POINTS.values(), times, radii):
+                queries.append(RouteQuery(start, cats, total_time, radius, seed=len(queries)))
+    return queries
+
+
+def export_recommended_routes(df: pd.DataFrame, path: str, workers: Optional[int] = None):
+    """Пакетно строит рекомендованные маршруты и пишет их в JSONL (по строке на запрос)."""
+    queries = recommended_queries()
+    started = time.perf_counter()
+    catalog = CATALOG_STORE_PATH if os.path.exists(CATALOG_STORE_PATH) else df
+    routes = plan_routes_batch(queries, catalog, workers=workers)
+    elapsed = time.perf_counter() - started
+
+    with open(path, "w", encoding="utf-8") as f:
+        for query, route in zip(queries, routes):
+            f.write(json.dumps({**asdict(query), "route": route.to_dict()}, ensure_ascii=False) + "\n")
+    print(
+        f"[batch] Маршрутов: {len(queries)}, время: {elapsed:.1f} с "
+        f"({len(queries) / elapsed:.0f} маршрутов/с, процессов: {workers or os.cpu_count()}), файл: {path}"
+    )
+
+
+if __name__ == "__main__":
+    out_path = sys.argv[1] if len(sys.argv) > 1 else "data_/recommended_routes.jsonl"
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    export_recommended_routes(load_data(), out_path, workers=n_workers)
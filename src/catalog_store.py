@@ -0,0 +1,151 @@
+import os
+import pickle
+import sys
+import time
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from src.constants import CATALOG_STORE_PATH
+from src.db.repository import fetch_dataset_version, fetch_locations_df
+from src.db.session import SessionLocal
+
+# Колонки и типы хранилища — те же, что отдаёт fetch_locations_df. Строки хранятся
+# как large_string: pandas ("string[pyarrow]") использует такие буферы без копирования
+SCHEMA = pa.schema([
+    ("id", pa.large_string()),
+    ("title", pa.large_string()),
+    ("description", pa.large_string()),
+    ("category_id", pa.int64()),
+    ("address", pa.large_string()),
+    ("url", pa.large_string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+])
+
+_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+
+def _column(df: pd.DataFrame, field: pa.Field) -> pa.Array:
+    if field.name not in df.columns:
+        return pa.nulls(len(df), type=field.type)
+    values = df[field.name]
+    if pa.types.is_large_string(field.type):
+        values = values.map(lambda v: None if pd.isna(v) else str(v))
+    else:
+        values = pd.to_numeric(values, errors="coerce")
+        if pa.types.is_integer(field.type):
+            values = values.astype("Int64")
+    return pa.array(values, type=field.type, from_pandas=True)
+
+
+def save_catalog(df: pd.DataFrame, path: str = CATALOG_STORE_PATH, dataset_version: int = 0) -> int:
+    """
+    Записывает каталог в файл Arrow IPC без сжатия, пригодный для memory map.
+    Запись через временный файл и rename: процессы, у которых открыт старый файл,
+    продолжают читать прежние данные. Возвращает размер файла в байтах.
+    """
+    table = pa.Table.from_arrays([_column(df, field) for field in SCHEMA], schema=SCHEMA)
+    table = table.replace_schema_metadata({
+        "objects": str(len(df)),
+        "dataset_version": str(int(dataset_version)),
+        "created_at": str(int(time.time())),
+    })
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with pa.OSFile(path + ".tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + ".tmp", path)
+    return os.path.getsize(path)
+
+
+def open_catalog(path: str = CATALOG_STORE_PATH) -> pa.Table:
+    """Таблица Arrow поверх memory map: данные не читаются в память процесса, а
+    отображаются из файла, и все процессы на машине делят одни и те же страницы."""
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def catalog_to_df(table: pa.Table) -> pd.DataFrame:
+    """
+    DataFrame без копирования колонок: строки — "string[pyarrow]" поверх буферов
+    таблицы, числовые колонки без пропусков — NumPy-представления тех же буферов
+    (только для чтения). Изменять такой DataFrame на месте нельзя.
+    """
+    return table.to_pandas(
+        split_blocks=True,
+        types_mapper={pa.large_string(): _STRING_DTYPE}.get,
+    )
+
+
+def catalog_version(path: str = CATALOG_STORE_PATH) -> Optional[int]:
+    """Версия набора данных, из которой записано хранилище, или None, если файла нет.
+    Читается только схема файла."""
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return int(metadata.get(b"dataset_version", b"0"))
+
+
+def load_catalog_df(path: str = CATALOG_STORE_PATH) -> Optional[pd.DataFrame]:
+    """Каталог из хранилища или None, если файла ещё нет."""
+    if not os.path.exists(path):
+        return None
+    return catalog_to_df(open_catalog(path))
+
+
+def build_from_db(path: str = CATALOG_STORE_PATH):
+    """Выгружает таблицу locations в хранилище path."""
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        df = fetch_locations_df(session)
+        version = fetch_dataset_version(session)
+    if df.empty:
+        print("[catalog] В таблице locations нет данных — хранилище не записано.")
+        return
+    size = save_catalog(df, path, dataset_version=version)
+    print(
+        f"[catalog] Объектов: {len(df)}, версия данных: {version}, файл: {path} ({size / 1024:.0f} КБ), "
+        f"время: {time.perf_counter() - started:.2f} с"
+    )
+
+
+def _bench(path: str = CATALOG_STORE_PATH, repeats: int = 200):
+    df = load_catalog_df(path)
+    if df is None:
+        print(f"[catalog] Хранилище {path} не найдено: python -m src.catalog_store build")
+        return
+    legacy = df.astype({c: object for c in df.columns if df[c].dtype == _STRING_DTYPE})
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        load_catalog_df(path)
+    open_ms = (time.perf_counter() - started) / repeats * 1000
+
+    # Так st.cache_data отдаёт DataFrame при каждом обращении: pickle + unpickle
+    started = time.perf_counter()
+    for _ in range(repeats):
+        pickle.loads(pickle.dumps(legacy))
+    pickle_ms = (time.perf_counter() - started) / repeats * 1000
+
+    print(
+        f"[catalog] Объектов: {len(df)}; открыть хранилище: {open_ms:.2f} мс, "
+        f"копия через pickle (st.cache_data): {pickle_ms:.2f} мс; "
+        f"память процесса под DataFrame: {legacy.memory_usage(deep=True).sum() / 1024:.0f} КБ "
+        f"-> {os.path.getsize(path) / 1024:.0f} КБ общих страниц файла"
+    )
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else CATALOG_STORE_PATH
+    if command == "build":
+        build_from_db(out_path)
+    elif command == "bench":
+        _bench(out_path)
+    else:
+        print("Использование: python -m src.catalog_store [build | bench] [path]")
+        sys.exit(1)
@@ -40,4 +40,60 @@ CATEGORY_TIME = {
     12: 40,
 }
 
+POPULAR_POINTS = {
+    "Кремль": (56.326887, 44.005986),
+    "Площадь Минина": (56.327266, 44.006597),
+    "Большая Покровская": (56.318136, 43.995234),
+    "Набережная Федоровского": (56.325238, 43.985295),
+    "Стрелка": (56.334505, 43.976589),
+}
+
+# Радиус (м) вокруг центра карты, в котором показываются маркеры; покрывает весь Нижний Новгород
+MAP_MARKERS_RADIUS = 25_000
+
+# Сколько готовых слоёв маркеров (набор категорий × область карты) держать в памяти
+MAP_LAYER_CACHE_SIZE = 32
+
+# С какого числа объектов выбранных категорий карта переходит на кластеры маркеров
+# в видимой области (src.marker_clusters) вместо полного слоя
+MAP_CLUSTER_MIN_OBJECTS = 2000
+
+# Дисковый кэш векторных тайлов и наибольший отдаваемый масштаб
+TILE_CACHE_DIR = "data_/tiles"
+TILE_MAX_ZOOM = 20
+
+# Каталог объектов в формате Arrow IPC (python -m src.catalog_store); открывается
+# через memory map и общий для всех процессов и реплик на машине
+CATALOG_STORE_PATH = "data_/catalog.arrow"
+
+# Предрасчитанная матрица пеших переходов (python -m src.leg_matrix)
+LEG_MATRIX_DIR = "data_/leg_matrix"
+LEG_MATRIX_RADIUS = 3000
+
+# Локальный пешеходный граф (python -m src.pedestrian_graph build ...)
+PEDESTRIAN_GRAPH_PATH = "data_/pedestrian_graph.npz"
+
+# Категории, выбранные при первом открытии приложения
+DEFAULT_CATEGORIES = (1, 2, 7)
+
+ROUTE_MODES = {
+    "greedy": "🎲 Быстрый (с элементом случайности)",
+    "optimized": "🧭 Оптимальный по времени",
+}
+
+# Режим "optimized": лимит процессорного времени (с) и размер пула кандидатов
+OPTIMIZER_TIME_LIMIT = 0.3
+OPTIMIZER_POOL_SIZE = 40
+# Вес доли бюджета времени, занятой осмотром объектов, в целевой функции оптимизатора
+OPTIMIZER_TIME_WEIGHT = 20.0
+
+# Кэш маршрутов: число ключей, маршрутов в пуле на ключ, точность округления старта
+# (4 знака — около 10 м)
+ROUTE_CACHE_MAX_KEYS = 512
+ROUTE_CACHE_POOL_SIZE = 4
+ROUTE_CACHE_PRECISION = 4
+# Сколько секунд построения в сумме можно потратить на заполнение пула одного
+# ключа: после этого пул считается полным, даже если в нём меньше маршрутов
+ROUTE_CACHE_FILL_SECONDS = 0.5
+
 FILE_PATH = "data_/cultural_objects_mnn.xlsx"
\ No newline at end of file
@@ -0,0 +1,82 @@
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Число в строке координат — то же выражение, что раньше шло в re.findall
+NUMBER = r"[-+]?\d*\.\d+|\d+"
+
+# Первые два числа строки. Атомарные группы (?>...) не дают движку регулярных
+# выражений «откатить» первое число, чтобы найти второе внутри него: "12" не
+# превращается в 1 и 2. Поэтому результат совпадает с re.findall(NUMBER)[:2]
+_PAIR = rf"(?P<first>(?>{NUMBER}))[\s\S]*?(?P<second>(?>{NUMBER}))"
+
+# Типичная строка "lon, lat" из двух дробных чисел. Для таких строк результат
+# re.findall очевиден, и их можно разобрать в Arrow (RE2) без цикла по строкам
+_FAST_PAIR = r"^\s*(?P<first>-?\d*\.\d+)\s*[,;\s]\s*(?P<second>-?\d*\.\d+)\s*$"
+
+# Колонки со строкой координат, в порядке предпочтения
+COORDINATE_COLUMNS = ("coordinate", "coordinates", "coords")
+
+
+def parse_coordinate_strings(values: pd.Series) -> pd.DataFrame:
+    """
+    Разбирает колонку строк координат целиком. В строке два числа, первое — lon,
+    второе — lat. Возвращает DataFrame с колонками lat, lon (NaN, если чисел меньше
+    двух или значение пустое) с тем же индексом, что у values.
+    """
+    lats = np.full(len(values), np.nan)
+    lons = np.full(len(values), np.nan)
+    present = np.flatnonzero(values.notna().to_numpy())
+    text = values.iloc[present].astype(str)
+
+    strings = pa.array(text.to_numpy(), type=pa.large_string())
+    fast = pc.match_substring_regex(strings, _FAST_PAIR).to_numpy(zero_copy_only=False).astype(bool)
+    if fast.any():
+        pairs = pc.extract_regex(strings.filter(pa.array(fast)), _FAST_PAIR)
+        lons[present[fast]] = pc.cast(pairs.field("first"), pa.float64()).to_numpy()
+        lats[present[fast]] = pc.cast(pairs.field("second"), pa.float64()).to_numpy()
+
+    # Остальное — точным выражением через str.extract
+    if not fast.all():
+        pairs = text[~fast].str.extract(_PAIR)
+        lons[present[~fast]] = pairs["first"].astype(float).to_numpy()
+        lats[present[~fast]] = pairs["second"].astype(float).to_numpy()
+    return pd.DataFrame({"lat": lats, "lon": lons}, index=values.index)
+
+
+def parse_lat_lon(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Координаты каждой строки df: сначала явные колонки lat/lon, для остальных —
+    первая непустая из COORDINATE_COLUMNS, разобранная parse_coordinate_strings.
+    """
+    coords = pd.DataFrame({"lat": np.nan, "lon": np.nan}, index=df.index)
+    if "lat" in df.columns and "lon" in df.columns:
+        coords["lat"] = pd.to_numeric(df["lat"], errors="coerce")
+        coords["lon"] = pd.to_numeric(df["lon"], errors="coerce")
+
+    missing = coords["lat"].isna() | coords["lon"].isna()
+    strings = pd.Series(None, index=df.index, dtype=object)
+    for column in COORDINATE_COLUMNS:
+        if column in df.columns:
+            values = df[column].where(df[column].astype(str).str.strip() != "")
+            strings = strings.where(strings.notna(), values)
+    if missing.any():
+        coords.loc[missing, ["lat", "lon"]] = parse_coordinate_strings(strings[missing]).to_numpy()
+    return coords
+
+
+def malformed_rows(df: pd.DataFrame, coords: pd.DataFrame) -> pd.Index:
+    """Индексы строк, координаты которых не удалось получить."""
+    return df.index[coords["lat"].isna() | coords["lon"].isna()]
+
+
+def describe_malformed(df: pd.DataFrame, rows: Sequence, limit: int = 5) -> str:
+    """Короткий отчёт о строках без координат: число и несколько примеров."""
+    columns: List[str] = [c for c in ("title", *COORDINATE_COLUMNS, "lat", "lon") if c in df.columns]
+    examples = "; ".join(
+        ", ".join(f"{c}={df.at[row, c]!r}" for c in columns) for row in list(rows)[:limit]
+    )
+    return f"координаты не разобраны в {len(rows)} строках" + (f", например: {examples}" if examples else "")
@@ -1,16 +1,46 @@
-import re
-from typing import Optional, Iterable
+import logging
+import os
+import threading
+from typing import Dict, Optional, Iterable, Tuple
 
 import pandas as pd
 import streamlit as st
 
-from src.constants import FILE_PATH
-from src.db.repository import fetch_locations_df
+from src.catalog_store import catalog_version, load_catalog_df
+from src.config import DATASET_VERSION_CHECK_SECONDS, LLM_SUMMARIES_REFRESH_SECONDS
+from src.constants import FILE_PATH, LEG_MATRIX_DIR, PEDESTRIAN_GRAPH_PATH
+from src.coordinates import describe_malformed, malformed_rows, parse_coordinate_strings
+from src.db.repository import (
+    ROUTE_COLUMNS,
+    fetch_dataset_version,
+    fetch_location_summaries,
+    fetch_locations_df,
+    fetch_locations_within,
+)
 from src.db.session import SessionLocal
+from src.leg_matrix import CatalogLegs, LegMatrix
+from src.marker_clusters import MarkerClusters
+from src.pedestrian_graph import PedestrianGraph
+from src.scoring import CatalogArrays
+from src.spatial_index import GridIndex
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
 def load_data(categories: Optional[Iterable[int]] = None):
+    """
+    Каталог объектов. Сначала читается хранилище CATALOG_STORE_PATH (memory map,
+    без копирования колонок), затем БД, затем исходный Excel. Результат общий для
+    всех сессий процесса — изменять его на месте нельзя.
+    """
+    try:
+        df = load_catalog_df()
+        if df is not None and not df.empty:
+            if categories:
+                df = df[df["category_id"].isin(list(categories))]
+            return df
+    except Exception as e:
+        st.warning(f"Не удалось открыть хранилище каталога: {e}")
+
     try:
         with SessionLocal() as s:
             df = fetch_locations_df(s, categories=categories)
@@ -22,20 +52,154 @@ def load_data(categories: Optional[Iterable[int]] = None):
         try:
             df = pd.read_excel(FILE_PATH, sheet_name="cultural_sites_202509191434")
 
-            def parse_coordinates(coord_str):
-                if pd.isna(coord_str):
-                    return None, None
-                matches = re.findall(r"[-+]?\d*\.\d+|\d+", str(coord_str))
-                if len(matches) >= 2:
-                    return float(matches[1]), float(matches[0])
-                return None, None
-
-            coords = df["coordinate"].apply(parse_coordinates)
-            df["lat"] = coords.apply(lambda x: x[0] if x[0] is not None else None)
-            df["lon"] = coords.apply(lambda x: x[1] if x[1] is not None else None)
+            coords = parse_coordinate_strings(df["coordinate"])
+            malformed = malformed_rows(df, coords)
+            if len(malformed):
+                logging.warning(f"[data_loader] {FILE_PATH}: {describe_malformed(df, malformed)}")
+            df["lat"] = coords["lat"]
+            df["lon"] = coords["lon"]
             df = df.dropna(subset=["lat", "lon"])
             df["description"] = df["description"].fillna("Описание отсутствует")
             return df
         except Exception as e:
             st.error(f"Ошибка загрузки данных: {e}")
             return pd.DataFrame()
+
+
+@st.cache_data(show_spinner=False)
+def load_data_version() -> str:
+    """Отпечаток содержимого каталога: меняется, когда меняются объекты, их координаты или категории."""
+    df = load_data()
+    if df is None or df.empty:
+        return "empty"
+    columns = [c for c in ("id", "lat", "lon", "category_id") if c in df.columns]
+    digest = pd.util.hash_pandas_object(df[columns].astype(str), index=False).sum()
+    return f"{len(df)}-{int(digest) & 0xFFFFFFFFFFFF:x}"
+
+
+@st.cache_data(ttl=DATASET_VERSION_CHECK_SECONDS, show_spinner=False)
+def load_dataset_version() -> int:
+    """
+    Версия набора данных: из хранилища каталога, если оно есть (load_data читает
+    именно его), иначе из БД. Увеличивается импортом, который что-то изменил.
+    """
+    version = catalog_version()
+    if version is not None:
+        return version
+    try:
+        with SessionLocal() as s:
+            return fetch_dataset_version(s)
+    except Exception:
+        return 0
+
+
+_synced_version: Optional[int] = None
+_sync_lock = threading.Lock()
+
+
+def sync_dataset_version() -> int:
+    """
+    Вызывается в начале каждого перезапуска скрипта: если с прошлого раза вышла
+    новая версия набора данных, сбрасывает каталог и всё, что по нему построено.
+    load_data_version при этом тоже пересчитывается, поэтому кэш маршрутов и слои
+    карты, ключом которых он служит, устаревают сами.
+    """
+    global _synced_version
+    version = load_dataset_version()
+    with _sync_lock:
+        if _synced_version is not None and version != _synced_version:
+            for loader in (load_data, load_data_version, load_spatial_index, load_marker_clusters,
+                           load_catalog_legs, load_location_summaries):
+                loader.clear()
+        _synced_version = version
+    return version
+
+
+@st.cache_resource(ttl=LLM_SUMMARIES_REFRESH_SECONDS, show_spinner=False)
+def load_location_summaries() -> Dict[str, str]:
+    """
+    Короткие описания объектов для промптов (python -m src.object_summaries build):
+    id -> описание. Пустой словарь, если описаний нет или БД недоступна.
+    """
+    try:
+        with SessionLocal() as s:
+            return fetch_location_summaries(s)
+    except Exception:
+        return {}
+
+
+@st.cache_resource(show_spinner=False)
+def load_spatial_index() -> Optional[GridIndex]:
+    """Пространственный индекс по результату load_data(); строится один раз на процесс."""
+    df = load_data()
+    if df is None or df.empty:
+        return None
+    return GridIndex(CatalogArrays.from_df(df))
+
+
+@st.cache_resource(show_spinner=False)
+def load_marker_clusters() -> Optional[MarkerClusters]:
+    """Иерархический индекс кластеров маркеров по результату load_data()."""
+    index = load_spatial_index()
+    if index is None:
+        return None
+    return MarkerClusters(index.arrays)
+
+
+@st.cache_resource(show_spinner=False)
+def load_leg_matrix() -> Optional[LegMatrix]:
+    """Матрица переходов из LEG_MATRIX_DIR (memory map) или None, если её ещё не построили."""
+    if LegMatrix.current_dir(LEG_MATRIX_DIR) is None:
+        return None
+    try:
+        return LegMatrix.load(LEG_MATRIX_DIR)
+    except Exception as e:
+        st.warning(f"Не удалось загрузить матрицу переходов: {e}")
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def load_catalog_legs() -> Optional[CatalogLegs]:
+    """
+    Матрица переходов, привязанная к каталогу load_spatial_index() — один раз на
+    версию набора данных, а не на каждый маршрут. None, если матрицы нет или она
+    построена не по всем объектам каталога.
+    """
+    matrix = load_leg_matrix()
+    index = load_spatial_index()
+    if matrix is None or index is None:
+        return None
+    return matrix.aligned(index.arrays)
+
+
+@st.cache_resource(show_spinner=False)
+def load_pedestrian_graph() -> Optional[PedestrianGraph]:
+    """Локальный пешеходный граф или None — тогда используется OSRM и геодезические расстояния."""
+    if not os.path.exists(PEDESTRIAN_GRAPH_PATH):
+        return None
+    try:
+        return PedestrianGraph.load(PEDESTRIAN_GRAPH_PATH)
+    except Exception as e:
+        st.warning(f"Не удалось загрузить пешеходный граф: {e}")
+        return None
+
+
+def load_route_area(center: Tuple[float, float], radius: float, categories: Iterable[int]) -> pd.DataFrame:
+    """
+    Объекты заданных категорий в радиусе radius метров от center — окрестность,
+    достаточная для построения маршрута. Фильтрация выполняется в PostGIS, из БД
+    читаются только колонки ROUTE_COLUMNS (тексты объектов маршрут берёт из
+    каталога через Route.resolve); если БД недоступна, та же выборка делается
+    по кэшированному каталогу.
+    """
+    categories = list(categories)
+    try:
+        with SessionLocal() as s:
+            return fetch_locations_within(s, center, radius, categories=categories, columns=ROUTE_COLUMNS)
+    except Exception:
+        df = load_data()
+        index = load_spatial_index()
+        if index is None:
+            return df
+        positions, _ = index.query(center, radius, categories)
+        return df.iloc[positions]
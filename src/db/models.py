@@ -1,7 +1,8 @@
 import uuid
+from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Integer, String, Text
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Integer, String, Text, func
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from geoalchemy2 import Geometry
@@ -23,3 +24,63 @@ class Location(Base):
     title: Mapped[str] = mapped_column(String(500), nullable=False)
     category_id: Mapped[int] = mapped_column(Integer, nullable=False)
     url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    # Хэши нормализованной строки источника для инкрементального импорта:
+    # source_key — название, адрес и координаты, row_hash — все поля
+    source_key: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    row_hash: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+
+
+class RouteGeometry(Base):
+    """Кэш геометрии пеших отрезков OSRM, общий для всех реплик приложения."""
+
+    __tablename__ = "route_geometry_cache"
+
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    geometry: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
+
+
+class LocationSummary(Base):
+    """
+    Короткое описание объекта для промптов нейросети. Актуально, пока
+    description_hash совпадает с md5 названия и описания объекта; model —
+    чем получено описание (модель Yandex GPT или "extractive").
+    """
+
+    __tablename__ = "location_summaries"
+
+    location_id: Mapped[uuid.UUID] = mapped_column(
+        PG_UUID(as_uuid=True), ForeignKey("locations.id", ondelete="CASCADE"), primary_key=True
+    )
+    description_hash: Mapped[str] = mapped_column(String(32), nullable=False)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    model: Mapped[str] = mapped_column(String(50), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class LlmExplanation(Base):
+    """Кэш объяснений маршрутов от нейросети; ключ — хэш состава маршрута и промпта."""
+
+    __tablename__ = "llm_explanation_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    explanation: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
+
+
+class DatasetVersion(Base):
+    """Версия содержимого locations: увеличивается каждым импортом, который что-то изменил."""
+
+    __tablename__ = "dataset_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, default=1)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
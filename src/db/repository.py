@@ -1,45 +1,346 @@
-from typing import Iterable, Optional
+import io
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+# Колонки, которые можно запросить у fetch_locations_*: выражение SELECT и тип в DataFrame
+LOCATION_COLUMNS = {
+    "id": ("id::text", pa.string()),
+    "title": ("title", pa.string()),
+    "description": ("description", pa.string()),
+    "category_id": ("category_id", pa.int64()),
+    "address": ("address", pa.string()),
+    "url": ("url", pa.string()),
+    "lat": ("ST_Y(coordinate)", pa.float64()),
+    "lon": ("ST_X(coordinate)", pa.float64()),
+}
+
+# Колонки, достаточные для построения маршрута (CatalogArrays)
+ROUTE_COLUMNS = ("id", "category_id", "lat", "lon")
+
+_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+
+def _select_locations(columns: Optional[Sequence[str]]) -> Tuple[str, List[str]]:
+    names = list(columns) if columns else list(LOCATION_COLUMNS)
+    unknown = [c for c in names if c not in LOCATION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Неизвестные колонки locations: {', '.join(unknown)}")
+    select = ", ".join(f"{LOCATION_COLUMNS[c][0]} AS {c}" for c in names)
+    return f"SELECT {select} FROM locations", names
+
+
+def _copy_to_df(session: Session, sql: str, params: dict, names: List[str]) -> pd.DataFrame:
+    """
+    Выполняет запрос через COPY (...) TO STDOUT в CSV и разбирает результат
+    pyarrow.csv сразу в типизированные колонки: без объекта Python на каждую
+    строку и без повторного приведения типов. Строки — "string[pyarrow]".
+    """
+    types = {c: LOCATION_COLUMNS[c][1] for c in names}
+    cursor = session.connection().connection.cursor()
+    try:
+        # COPY не принимает параметры запроса — подставляем их на клиенте
+        query = cursor.mogrify(sql, params).decode()
+        buf = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+
+    if buf.tell():
+        buf.seek(0)
+        table = pa_csv.read_csv(
+            buf,
+            read_options=pa_csv.ReadOptions(column_names=names),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            # NULL в CSV Postgres — пустое поле без кавычек, пустая строка — ""
+            convert_options=pa_csv.ConvertOptions(
+                column_types=types, strings_can_be_null=True, quoted_strings_can_be_null=False
+            ),
+        )
+    else:
+        table = pa.table({c: pa.array([], type=t) for c, t in types.items()})
+    return table.to_pandas(types_mapper={pa.string(): _STRING_DTYPE}.get)
+
 
 def fetch_locations_df(
     session: Session,
     categories: Optional[Iterable[int]] = None,
+    columns: Optional[Sequence[str]] = None,
 ) -> pd.DataFrame:
     """
     Возвращает DataFrame с колонками:
     id, title, description, category_id, address, url, lat, lon
+    или только с перечисленными в columns (см. LOCATION_COLUMNS).
     """
-    base_sql = """
-        SELECT
-            id,
-            title,
-            description,
-            category_id,
-            address,
-            url,
-            ST_Y(coordinate) AS lat,
-            ST_X(coordinate) AS lon
-        FROM locations
-    """
+    base_sql, names = _select_locations(columns)
     params = {}
     if categories:
-        base_sql += " WHERE category_id = ANY(:cats)"
+        base_sql += " WHERE category_id = ANY(%(cats)s)"
         params["cats"] = list(categories)
 
     base_sql += " ORDER BY title"
 
-    result = session.execute(text(base_sql), params)
-    rows = [dict(r._mapping) for r in result]
-    df = pd.DataFrame(rows)
-
-    if not df.empty:
-        if "category_id" in df.columns:
-            df["category_id"] = pd.to_numeric(df["category_id"], errors="coerce")
-        for col in ("lat", "lon"):
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df
+    return _copy_to_df(session, base_sql, params, names)
+
+
+def fetch_locations_within(
+    session: Session,
+    center: Tuple[float, float],
+    radius_m: float,
+    categories: Optional[Iterable[int]] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    Как fetch_locations_df, но только объекты не дальше radius_m метров от
+    center=(lat, lon). Фильтр выполняется в PostGIS через ST_DWithin по geography
+    и использует GIST-индекс idx_locations_coordinate_geog.
+    """
+    base_sql, names = _select_locations(columns)
+    base_sql += """
+        WHERE ST_DWithin(
+            coordinate::geography,
+            ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography,
+            %(radius)s
+        )
+    """
+    params = {"lat": float(center[0]), "lon": float(center[1]), "radius": float(radius_m)}
+    if categories:
+        base_sql += " AND category_id = ANY(%(cats)s)"
+        params["cats"] = list(categories)
+
+    base_sql += " ORDER BY title"
+
+    return _copy_to_df(session, base_sql, params, names)
+
+
+def fetch_locations_mvt(
+    session: Session,
+    z: int,
+    x: int,
+    y: int,
+    categories: Optional[Iterable[int]] = None,
+    extent: int = 4096,
+    buffer: int = 64,
+) -> bytes:
+    """
+    Векторный тайл Mapbox (MVT) z/x/y со слоем "locations": точки объектов
+    с атрибутами id, title, category_id. Отбор по рамке тайла (с запасом buffer)
+    идёт через оператор && и GIST-индекс по coordinate.
+    """
+    base_sql = """
+        WITH tile AS (
+            SELECT
+                ST_TileEnvelope(:z, :x, :y) AS envelope,
+                ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326) AS bbox
+        ),
+        features AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(l.coordinate, 3857), tile.envelope, :extent, :buffer, true) AS geom,
+                l.id::text AS id,
+                l.title,
+                l.category_id
+            FROM locations l, tile
+            WHERE l.coordinate && tile.bbox
+    """
+    params = {"z": int(z), "x": int(x), "y": int(y), "extent": int(extent), "buffer": int(buffer),
+              "margin": buffer / extent}
+    if categories:
+        base_sql += " AND l.category_id = ANY(:cats)"
+        params["cats"] = list(categories)
+    base_sql += """
+        )
+        SELECT ST_AsMVT(features, 'locations', :extent, 'geom') FROM features
+    """
+
+    tile = session.execute(text(base_sql), params).scalar()
+    return bytes(tile) if tile else b""
+
+
+def get_route_geometry(session: Session, key: str, ttl_seconds: float) -> Optional[str]:
+    """JSON-геометрия отрезка из кэша или None, если записи нет или она старше ttl_seconds."""
+    row = session.execute(
+        text(
+            """
+            SELECT geometry FROM route_geometry_cache
+            WHERE key = :key AND created_at > now() - make_interval(secs => :ttl)
+            """
+        ),
+        {"key": key, "ttl": float(ttl_seconds)},
+    ).first()
+    return row[0] if row else None
+
+
+def put_route_geometry(session: Session, key: str, geometry: str):
+    session.execute(
+        text(
+            """
+            INSERT INTO route_geometry_cache (key, geometry, created_at)
+            VALUES (:key, :geometry, now())
+            ON CONFLICT (key) DO UPDATE
+            SET geometry = EXCLUDED.geometry, created_at = EXCLUDED.created_at
+            """
+        ),
+        {"key": key, "geometry": geometry},
+    )
+
+
+def evict_route_geometry(session: Session, ttl_seconds: float, max_entries: int) -> int:
+    """Удаляет устаревшие записи и самые старые сверх max_entries; возвращает число удалённых."""
+    expired = session.execute(
+        text("DELETE FROM route_geometry_cache WHERE created_at <= now() - make_interval(secs => :ttl)"),
+        {"ttl": float(ttl_seconds)},
+    ).rowcount
+    overflow = session.execute(
+        text(
+            """
+            DELETE FROM route_geometry_cache
+            WHERE key IN (
+                SELECT key FROM route_geometry_cache
+                ORDER BY created_at DESC
+                OFFSET :max_entries
+            )
+            """
+        ),
+        {"max_entries": int(max_entries)},
+    ).rowcount
+    return expired + overflow
+
+
+def get_llm_explanation(session: Session, key: str, ttl_seconds: float) -> Optional[str]:
+    """Объяснение маршрута из кэша или None, если записи нет или она старше ttl_seconds."""
+    row = session.execute(
+        text(
+            """
+            SELECT explanation FROM llm_explanation_cache
+            WHERE key = :key AND created_at > now() - make_interval(secs => :ttl)
+            """
+        ),
+        {"key": key, "ttl": float(ttl_seconds)},
+    ).first()
+    return row[0] if row else None
+
+
+def put_llm_explanation(session: Session, key: str, explanation: str):
+    session.execute(
+        text(
+            """
+            INSERT INTO llm_explanation_cache (key, explanation, created_at)
+            VALUES (:key, :explanation, now())
+            ON CONFLICT (key) DO UPDATE
+            SET explanation = EXCLUDED.explanation, created_at = EXCLUDED.created_at
+            """
+        ),
+        {"key": key, "explanation": explanation},
+    )
+
+
+def evict_llm_explanations(session: Session, ttl_seconds: float, max_entries: int) -> int:
+    """Удаляет устаревшие объяснения и самые старые сверх max_entries; возвращает число удалённых."""
+    expired = session.execute(
+        text("DELETE FROM llm_explanation_cache WHERE created_at <= now() - make_interval(secs => :ttl)"),
+        {"ttl": float(ttl_seconds)},
+    ).rowcount
+    overflow = session.execute(
+        text(
+            """
+            DELETE FROM llm_explanation_cache
+            WHERE key IN (
+                SELECT key FROM llm_explanation_cache
+                ORDER BY created_at DESC
+                OFFSET :max_entries
+            )
+            """
+        ),
+        {"max_entries": int(max_entries)},
+    ).rowcount
+    return expired + overflow
+
+
+# md5 названия и описания объекта — версия, к которой привязано короткое описание
+_DESCRIPTION_HASH = "md5(coalesce(l.title, '') || E'\\n' || coalesce(l.description, ''))"
+
+
+def fetch_stale_summaries(session: Session, upgrade_model: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[dict]:
+    """
+    Объекты без актуального короткого описания: его нет или текст объекта
+    изменился. С upgrade_model — также описания, полученные другим способом.
+    """
+    sql = f"""
+        SELECT l.id::text AS id, l.title, l.description, {_DESCRIPTION_HASH} AS description_hash
+        FROM locations l
+        LEFT JOIN location_summaries s ON s.location_id = l.id
+        WHERE s.location_id IS NULL OR s.description_hash <> {_DESCRIPTION_HASH}
+    """
+    params = {}
+    if upgrade_model:
+        sql += " OR s.model <> :model"
+        params["model"] = upgrade_model
+    sql += " ORDER BY l.title"
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = int(limit)
+    return [dict(r._mapping) for r in session.execute(text(sql), params)]
+
+
+def put_location_summaries(session: Session, rows: List[dict]):
+    """rows: словари id, description_hash, summary, model."""
+    if not rows:
+        return
+    session.execute(
+        text(
+            """
+            INSERT INTO location_summaries (location_id, description_hash, summary, model, updated_at)
+            VALUES (CAST(:id AS uuid), :description_hash, :summary, :model, now())
+            ON CONFLICT (location_id) DO UPDATE
+            SET description_hash = EXCLUDED.description_hash, summary = EXCLUDED.summary,
+                model = EXCLUDED.model, updated_at = EXCLUDED.updated_at
+            """
+        ),
+        rows,
+    )
+
+
+def fetch_location_summaries(session: Session) -> Dict[str, str]:
+    """Актуальные короткие описания: id объекта -> описание. Пусто, если таблицы нет."""
+    if session.execute(text("SELECT to_regclass('location_summaries')")).scalar() is None:
+        return {}
+    rows = session.execute(
+        text(
+            f"""
+            SELECT l.id::text, s.summary
+            FROM location_summaries s
+            JOIN locations l ON l.id = s.location_id
+            WHERE s.description_hash = {_DESCRIPTION_HASH}
+            """
+        )
+    )
+    return {obj_id: summary for obj_id, summary in rows}
+
+
+def fetch_dataset_version(session: Session) -> int:
+    """Текущая версия набора данных; 0, если импорт с учётом версий ещё не выполнялся."""
+    if session.execute(text("SELECT to_regclass('dataset_version')")).scalar() is None:
+        return 0
+    version = session.execute(text("SELECT version FROM dataset_version WHERE id = 1")).scalar()
+    return int(version or 0)
+
+
+def bump_dataset_version(session: Session) -> int:
+    """Увеличивает версию набора данных (в текущей транзакции) и возвращает новую."""
+    return int(
+        session.execute(
+            text(
+                """
+                INSERT INTO dataset_version (id, version, updated_at) VALUES (1, 1, now())
+                ON CONFLICT (id) DO UPDATE
+                SET version = dataset_version.version + 1, updated_at = now()
+                RETURNING version
+                """
+            )
+        ).scalar()
+    )
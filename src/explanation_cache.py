@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+from src.db.models import LlmExplanation
+from src.db.repository import evict_llm_explanations, get_llm_explanation, put_llm_explanation
+from src.db.session import SessionLocal, engine
+
+
+class ExplanationCache:
+    """
+    Двухуровневый кэш объяснений маршрутов от нейросети.
+
+    Ключ считает вызывающий код (см. llm_utils.explanation_key) по составу
+    маршрута и входным данным промпта, поэтому один и тот же маршрут получает
+    готовый текст без запроса к API. Первый уровень — LRU в памяти процесса,
+    второй — таблица llm_explanation_cache в Postgres, общая для всех реплик.
+    У записей есть TTL, размер таблицы ограничен max_entries. Если БД
+    недоступна, кэш временно работает только в памяти.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        memory_entries: int = 256,
+        evict_every: int = 50,
+        db_retry_seconds: float = 60.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.evict_every = evict_every
+        self.db_retry_seconds = db_retry_seconds
+
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db_ready = False
+        self._db_disabled_until = 0.0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "db_errors": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+
+        explanation = self._db_call(lambda s: get_llm_explanation(s, key, self.ttl_seconds))
+        if explanation:
+            self._remember(key, explanation, now)
+            with self._lock:
+                self._stats["db_hits"] += 1
+            return explanation
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, explanation: str):
+        if not explanation:
+            return
+        self._remember(key, explanation, time.time())
+
+        with self._lock:
+            self._stats["stores"] += 1
+            self._puts += 1
+            need_evict = self._puts % self.evict_every == 0
+
+        def store(session):
+            put_llm_explanation(session, key, explanation)
+            if need_evict:
+                evict_llm_explanations(session, self.ttl_seconds, self.max_entries)
+            session.commit()
+
+        self._db_call(store)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key: str, explanation: str, stamp: float):
+        with self._lock:
+            self._memory[key] = (stamp, explanation)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _db_call(self, fn):
+        if time.time() < self._db_disabled_until:
+            return None
+        try:
+            if not self._db_ready:
+                LlmExplanation.__table__.create(bind=engine, checkfirst=True)
+                self._db_ready = True
+            with SessionLocal() as session:
+                return fn(session)
+        except Exception as e:
+            with self._lock:
+                self._stats["db_errors"] += 1
+            self._db_disabled_until = time.time() + self.db_retry_seconds
+            print(f"LLM explanation cache DB unavailable: {e}")
+            return None
+
+
+# Глобальный экземпляр кэша для повторного использования
+explanation_cache = ExplanationCache()
@@ -0,0 +1,251 @@
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Сколько строк источника читать за раз: память импортёра зависит от этого
+# числа, а не от размера файла
+CHUNK_ROWS = 10_000
+
+ChunkReader = Callable[..., Iterator[pd.DataFrame]]
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def pick_sheet(file_path: str, sheet_name: Optional[str | int]) -> str | int:
+    """
+    Возвращает корректный идентификатор листа:
+      1) Явно переданный sheet_name
+      2) Лист 'cultural_sites_202509191434', если есть
+      3) Первый лист в книге
+    """
+    if sheet_name is not None:
+        return sheet_name
+
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        preferred = "cultural_sites_202509191434"
+        if preferred in wb.sheetnames:
+            return preferred
+        return wb.sheetnames[0]
+    finally:
+        wb.close()
+
+
+def read_excel_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS,
+                      sheet_name: Optional[str | int] = None) -> Iterator[pd.DataFrame]:
+    """Лист Excel в режиме read_only openpyxl: строки читаются из XML потоком."""
+    sheet = pick_sheet(file_path, sheet_name)
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet] if isinstance(sheet, int) else wb[sheet]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) for c in header]
+        chunk: List[tuple] = []
+        for row in rows:
+            # Пустые ячейки — None, как у pd.read_excel (он читает "" как NaN)
+            row = tuple(None if v == "" else v for v in row)
+            if all(v is None for v in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield _normalize_columns(pd.DataFrame(chunk, columns=columns))
+                chunk = []
+        if chunk:
+            yield _normalize_columns(pd.DataFrame(chunk, columns=columns))
+    finally:
+        wb.close()
+
+
+def read_csv_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS, **_) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows):
+        yield _normalize_columns(chunk)
+
+
+def read_parquet_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS, **_) -> Iterator[pd.DataFrame]:
+    parquet = pq.ParquetFile(file_path)
+    for batch in parquet.iter_batches(batch_size=chunk_rows):
+        yield _normalize_columns(batch.to_pandas())
+
+
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+
+
+def _iter_geojson_features(file_path: str, block_size: int = 1 << 20) -> Iterator[dict]:
+    """
+    Объекты массива "features" из FeatureCollection без загрузки всего файла:
+    файл читается блоками, каждый Feature разбирается raw_decode по мере
+    поступления данных. В памяти — один блок и один объект.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, encoding="utf-8") as f:
+        buf, eof = "", False
+        while True:
+            match = _FEATURES_START.search(buf)
+            if match:
+                buf = buf[match.end():]
+                break
+            if eof:
+                return
+            block = f.read(block_size)
+            eof = not block
+            # Хвост оставляем: ключ мог разрезаться границей блока
+            buf = buf[-64:] + block
+
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                block = f.read(block_size)
+                eof = not block
+                buf, pos = buf[pos:] + block, 0
+                continue
+            yield feature
+            pos = end
+            if pos > block_size:
+                buf, pos = buf[pos:], 0
+
+
+def _feature_row(feature: dict) -> dict:
+    row = {str(k).strip().lower(): v for k, v in (feature.get("properties") or {}).items()}
+    geometry = feature.get("geometry") or {}
+    coordinates = geometry.get("coordinates")
+    if geometry.get("type") == "Point" and coordinates and len(coordinates) >= 2:
+        # В GeoJSON порядок [lon, lat]
+        row["lon"], row["lat"] = coordinates[0], coordinates[1]
+    if "id" not in row and feature.get("id") is not None:
+        row["id"] = feature["id"]
+    return row
+
+
+def read_geojson_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS, **_) -> Iterator[pd.DataFrame]:
+    """FeatureCollection с точками: properties — поля объекта, geometry — координаты."""
+    chunk: List[dict] = []
+    for feature in _iter_geojson_features(file_path):
+        chunk.append(_feature_row(feature))
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk)
+
+
+READERS: Dict[str, ChunkReader] = {
+    ".xlsx": read_excel_chunks,
+    ".xlsm": read_excel_chunks,
+    ".csv": read_csv_chunks,
+    ".parquet": read_parquet_chunks,
+    ".geojson": read_geojson_chunks,
+    ".json": read_geojson_chunks,
+}
+
+
+def read_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS,
+                sheet_name: Optional[str | int] = None) -> Iterator[pd.DataFrame]:
+    """Источник импорта кусками по chunk_rows строк; формат определяется по расширению."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Неподдерживаемый формат {ext or file_path}; поддерживаются: {', '.join(sorted(READERS))}")
+    return READERS[ext](file_path, chunk_rows=chunk_rows, sheet_name=sheet_name)
+
+
+def _write_sample(df: pd.DataFrame, directory: str) -> Dict[str, str]:
+    """Синтетический источник во всех форматах для бенчмарка."""
+    paths = {fmt: os.path.join(directory, f"sample.{fmt}") for fmt in ("csv", "parquet", "geojson", "xlsx")}
+    df.to_csv(paths["csv"], index=False)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), paths["parquet"])
+    with open(paths["geojson"], "w", encoding="utf-8") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        props = df.drop(columns=["lat", "lon"]).to_dict("records")
+        for i, (p, lat, lon) in enumerate(zip(props, df["lat"], df["lon"])):
+            feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": p}
+            f.write((",\n" if i else "") + json.dumps(feature, ensure_ascii=False))
+        f.write("\n]}\n")
+    df.to_excel(paths["xlsx"], index=False)
+    return paths
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _bench_one(path: str, queue):
+    from src.simple_importer import _normalized_rows
+
+    # ru_maxrss наследуется от родителя, поэтому пик RSS снимаем сами
+    baseline, peak, done = _rss_mb(), [0.0], threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], _rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    stats = {"skipped": 0}
+    rows = sum(1 for _ in _normalized_rows(read_chunks(path), stats))
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    queue.put((rows, stats["skipped"], elapsed, max(peak[0], _rss_mb()) - baseline))
+
+
+def _bench(n_rows: int):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "title": [f"Объект {i}" for i in range(n_rows)],
+        "description": ["Описание объекта культурного наследия Нижнего Новгорода. " * 4] * n_rows,
+        "category_id": rng.choice([1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12], n_rows),
+        "address": [f"Нижний Новгород, ул. Большая Покровская, {i % 200 + 1}" for i in range(n_rows)],
+        "url": ["https://example.org/object"] * n_rows,
+        "lat": rng.uniform(56.2, 56.4, n_rows).round(6),
+        "lon": rng.uniform(43.8, 44.1, n_rows).round(6),
+    })
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_sample(df, directory)
+        print(f"[readers] Строк: {n_rows}, разбор + проверка без записи в БД, кусок: {CHUNK_ROWS}")
+        for fmt, path in paths.items():
+            # Каждый формат в отдельном процессе, чтобы пиковая память не смешивалась
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_bench_one, args=(path, queue))
+            proc.start()
+            rows, skipped, elapsed, peak_mb = queue.get()
+            proc.join()
+            print(
+                f"[readers] {fmt:8} {os.path.getsize(path) / 1e6:7.1f} МБ: {elapsed:6.2f} с, "
+                f"{rows / elapsed:9.0f} строк/с, пропущено: {skipped}, прирост памяти: {peak_mb:.0f} МБ"
+            )
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
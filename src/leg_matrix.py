@@ -0,0 +1,208 @@
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.constants import LEG_MATRIX_DIR, LEG_MATRIX_RADIUS
+from src.db.repository import ROUTE_COLUMNS, fetch_locations_df
+from src.db.session import SessionLocal
+from src.scoring import CatalogArrays, walking_times
+from src.spatial_index import GridIndex
+
+_ARRAYS = ("ids", "indptr", "indices", "distances", "times")
+# Файл с именем каталога текущей версии матрицы
+_POINTER = "CURRENT"
+
+
+class LegMatrix:
+    """
+    Разреженная матрица пеших переходов между объектами каталога (формат CSR).
+
+    Строка i содержит всех соседей объекта ids[i] в радиусе radius метров:
+    indices[indptr[i]:indptr[i + 1]] — номера соседей (по возрастанию),
+    distances — расстояние в метрах, times — время в пути в минутах.
+    На диске хранится набором .npy-файлов и открывается через memory map,
+    поэтому несколько процессов читают одни и те же страницы.
+    """
+
+    def __init__(self, ids, indptr, indices, distances, times, radius: float):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+        self.times = times
+        self.radius = float(radius)
+        self._row_of_id = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, arrays: CatalogArrays, radius: float = LEG_MATRIX_RADIUS) -> "LegMatrix":
+        index = GridIndex(arrays)
+        counts = np.zeros(len(arrays) + 1, dtype=np.int64)
+        neighbours, distances = [], []
+
+        for i in range(len(arrays)):
+            if np.isnan(arrays.lats[i]) or np.isnan(arrays.lons[i]):
+                continue
+            positions, dists = index.query((arrays.lats[i], arrays.lons[i]), radius)
+            keep = positions != i
+            neighbours.append(positions[keep])
+            distances.append(dists[keep])
+            counts[i + 1] = keep.sum()
+
+        indices = np.concatenate(neighbours) if neighbours else np.empty(0, dtype=np.int64)
+        dists = np.concatenate(distances) if distances else np.empty(0, dtype=np.float64)
+        return cls(
+            ids=np.asarray([str(x) for x in arrays.ids]),
+            indptr=np.cumsum(counts),
+            indices=indices.astype(np.int32),
+            distances=dists,
+            times=walking_times(dists).astype(np.float32),
+            radius=radius,
+        )
+
+    def save(self, path: str = LEG_MATRIX_DIR, keep_versions: int = 2):
+        """
+        Записывает весь набор файлов в новый каталог версии path/v<время>-<pid>, а
+        затем атомарно переключает на него указатель path/CURRENT. Читатель всегда
+        видит согласованный набор: либо прежний, либо новый целиком. Процессы, у
+        которых старая матрица открыта через memory map, продолжают читать её;
+        из старых версий остаются keep_versions последних.
+        """
+        os.makedirs(path, exist_ok=True)
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        staging = os.path.join(path, version + ".tmp")
+        os.makedirs(staging)
+        for name in _ARRAYS:
+            with open(os.path.join(staging, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"radius": self.radius, "objects": len(self), "legs": len(self.indices)}, f)
+        os.replace(staging, os.path.join(path, version))
+
+        pointer = os.path.join(path, _POINTER)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer + ".tmp", pointer)
+        _remove_old_versions(path, keep_versions)
+
+    @staticmethod
+    def current_dir(path: str = LEG_MATRIX_DIR) -> Optional[str]:
+        """Каталог текущей версии матрицы или None, если матрицу ещё не построили."""
+        try:
+            with open(os.path.join(path, _POINTER), encoding="utf-8") as f:
+                return os.path.join(path, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path: str = LEG_MATRIX_DIR, mmap: bool = True) -> "LegMatrix":
+        directory = cls.current_dir(path)
+        if directory is None:
+            raise FileNotFoundError(f"Матрица переходов не найдена в {path}")
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        loaded = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS}
+        return cls(radius=meta["radius"], **loaded)
+
+    def row_of(self, object_id) -> int:
+        if self._row_of_id is None:
+            self._row_of_id = {str(x): i for i, x in enumerate(self.ids)}
+        return self._row_of_id.get(str(object_id), -1)
+
+    def leg(self, i: int, j: int) -> Optional[Tuple[float, float]]:
+        """(расстояние, время) перехода между строками i и j или None, если они дальше radius."""
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        k = lo + np.searchsorted(self.indices[lo:hi], j)
+        if k < hi and self.indices[k] == j:
+            return float(self.distances[k]), float(self.times[k])
+        return None
+
+    def aligned(self, arrays: CatalogArrays) -> Optional["CatalogLegs"]:
+        """
+        Привязывает матрицу к каталогу, по которому строится маршрут.
+        Возвращает None, если в матрице есть не все объекты каталога (матрица
+        устарела) — тогда расстояния считаются как обычно.
+        """
+        rows = np.fromiter((self.row_of(x) for x in arrays.ids), dtype=np.int64, count=len(arrays))
+        if (rows < 0).any():
+            return None
+        positions = np.full(len(self), -1, dtype=np.int64)
+        positions[rows] = np.arange(len(arrays))
+        return CatalogLegs(self, arrays, rows, positions)
+
+
+class CatalogLegs:
+    """
+    Матрица переходов, пересчитанная в позиции строк конкретного DataFrame.
+    Привязка проходит по всем id каталога, поэтому для общего каталога она
+    делается один раз (data_loader.load_catalog_legs), а не на каждый маршрут.
+    """
+
+    def __init__(self, matrix: LegMatrix, arrays: CatalogArrays, rows: np.ndarray, positions: np.ndarray):
+        self.matrix = matrix
+        self.arrays = arrays
+        self._rows = rows
+        self._positions = positions
+
+    @property
+    def radius(self) -> float:
+        return self.matrix.radius
+
+    def for_arrays(self, arrays: CatalogArrays) -> Optional["CatalogLegs"]:
+        """Эта привязка, если она сделана для arrays, иначе новая."""
+        return self if arrays is self.arrays else self.matrix.aligned(arrays)
+
+    def neighbours(self, position: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Соседи объекта в позиции position: (позиции по возрастанию, расстояния)."""
+        row = self._rows[position]
+        lo, hi = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        positions = self._positions[self.matrix.indices[lo:hi]]
+        distances = np.asarray(self.matrix.distances[lo:hi])
+
+        keep = positions >= 0
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(positions, kind="stable")
+        return positions[order], distances[order]
+
+
+def _remove_old_versions(path: str, keep: int):
+    """Удаляет каталоги версий, кроме keep последних; недописанные .tmp не трогает."""
+    versions = sorted(
+        (entry for entry in os.scandir(path) if entry.is_dir() and entry.name.startswith("v")
+         and not entry.name.endswith(".tmp")),
+        key=lambda entry: int(entry.name[1:].split("-")[0]),
+    )
+    for entry in versions[:-max(1, keep)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def build_from_db(path: str = LEG_MATRIX_DIR, radius: float = LEG_MATRIX_RADIUS):
+    """Строит матрицу по текущему содержимому таблицы locations и сохраняет её в path."""
+    with SessionLocal() as session:
+        df = fetch_locations_df(session, columns=ROUTE_COLUMNS)
+    if df.empty:
+        print("[leg_matrix] В таблице locations нет данных — матрица не построена.")
+        return
+
+    started = time.perf_counter()
+    matrix = LegMatrix.build(CatalogArrays.from_df(df), radius=radius)
+    matrix.save(path)
+    elapsed = time.perf_counter() - started
+    print(
+        f"[leg_matrix] Объектов: {len(matrix)}, переходов: {len(matrix.indices)}, "
+        f"радиус: {radius:.0f} м, время: {elapsed:.1f} с, каталог: {path}"
+    )
+
+
+if __name__ == "__main__":
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else LEG_MATRIX_DIR
+    max_radius = float(sys.argv[2]) if len(sys.argv) > 2 else LEG_MATRIX_RADIUS
+    build_from_db(out_dir, max_radius)
@@ -0,0 +1,323 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+import numpy as np
+import requests
+import streamlit as st
+from dotenv import find_dotenv, load_dotenv
+from requests.adapters import HTTPAdapter
+
+from src.config import (
+    LLM_BACKOFF_SECONDS,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_CONNECT_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_READ_TIMEOUT_SECONDS,
+    LLM_WORKERS,
+    YANDEXGPT_URL,
+)
+
+load_dotenv(find_dotenv(), override=False)
+
+MODEL = "yandexgpt-lite"
+
+SYSTEM_PROMPT = """Ты - профессиональный гид-эксперт по Нижнему Новгороду с талантом рассказчика.
+                        Твоя задача - создавать красочные, увлекательные и информативные описания маршрутов."""
+
+# Ответы, после которых запрос имеет смысл повторить
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Запрос не отправлен: после серии ошибок API временно считается недоступным."""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего API. После failure_threshold ошибок подряд
+    размыкается, и запросы сразу получают отказ, не дожидаясь таймаутов. Через
+    reset_seconds пропускает один пробный запрос: успех замыкает цепь, ошибка
+    снова размыкает её на reset_seconds.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class YandexGPTClient:
+    """
+    Клиент для работы с Yandex GPT API.
+    Обеспечивает генерацию текстовых описаний через нейросеть.
+
+    Запросы идут через общую keep-alive сессию с пулом соединений. Ошибки сети,
+    таймауты, 429 и 5xx повторяются до max_retries раз с экспоненциальной
+    паузой со случайным разбросом (full jitter). Серия неудач размыкает
+    CircuitBreaker, и до его сброса запросы не отправляются. Задержки и ошибки
+    доступны через stats().
+    """
+
+    def __init__(
+        self,
+        url: str = YANDEXGPT_URL,
+        api_key: Optional[str] = None,
+        folder_id: Optional[str] = None,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = LLM_READ_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_seconds: float = LLM_BACKOFF_SECONDS,
+        breaker: Optional[CircuitBreaker] = None,
+        latency_window: int = 1000,
+    ):
+        self.url = url
+        # Учетные данные читаются один раз, а не при каждом запросе
+        self.api_key = api_key or os.getenv("YANDEXGPT_API_KEY")
+        self.folder_id = folder_id or os.getenv("YANDEXGPT_FOLDER_ID")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Api-Key {self.api_key}",
+            "Content-Type": "application/json"
+        })
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._stats = {"requests": 0, "successes": 0, "failures": 0, "retries": 0, "short_circuits": 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.folder_id)
+
+    def available(self) -> bool:
+        """
+        Есть учетные данные, и предохранитель не разомкнут. Вызывается перед
+        запросом: отказ из-за предохранителя учитывается в short_circuits.
+        """
+        if not self.configured:
+            return False
+        if self.breaker.state == "open":
+            self._count("short_circuits")
+            return False
+        return True
+
+    def _payload(self, prompt, temperature, max_tokens, stream, system_prompt=SYSTEM_PROMPT):
+        # Формирование запроса к API
+        return {
+            "modelUri": f"gpt://{self.folder_id}/{MODEL}",
+            "completionOptions": {
+                "stream": stream,
+                "temperature": temperature,
+                "maxTokens": max_tokens
+            },
+            "messages": [
+                {
+                    "role": "system",
+                    "text": system_prompt
+                },
+                {
+                    "role": "user",
+                    "text": prompt
+                }
+            ]
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _post(self, payload, stream: bool) -> requests.Response:
+        """
+        POST с повторами. Возвращает успешный ответ (при stream=True тело еще
+        не прочитано) или пробрасывает последнюю ошибку. Предохранитель
+        проверяется один раз до первой попытки.
+        """
+        if not self.breaker.allow():
+            self._count("short_circuits")
+            raise CircuitOpenError("Yandex GPT временно отключен после серии ошибок")
+        self._count("requests")
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+                if response.status_code not in _RETRY_STATUSES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            self._count("retries")
+            time.sleep(random.uniform(0, self.backoff_seconds * 2 ** attempt))
+            attempt += 1
+
+    def _finish(self, started: float, ok: bool):
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        with self._lock:
+            self._stats["successes" if ok else "failures"] += 1
+            self._latencies.append(time.perf_counter() - started)
+
+    def complete(self, prompt, temperature=0.5, max_tokens=400, system_prompt=SYSTEM_PROMPT) -> Optional[str]:
+        """
+        Один запрос без потоковой выдачи. Возвращает текст ответа или None без
+        учетных данных; ошибки (в том числе CircuitOpenError) пробрасываются.
+        """
+        if not self.configured:
+            return None
+        started = time.perf_counter()
+        payload = self._payload(prompt, temperature, max_tokens, stream=False, system_prompt=system_prompt)
+        try:
+            response = self._post(payload, stream=False)
+            result = response.json()
+            text = result["result"]["alternatives"][0]["message"]["text"]
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self._finish(started, ok=False)
+            raise
+        self._finish(started, ok=True)
+        return text
+
+    def generate_explanation(self, prompt, temperature=0.5, max_tokens=400):
+        """
+        Генерирует текстовое описание через Yandex GPT API.
+
+        Args:
+            prompt (str): Текст запроса для нейросети
+            temperature (float): Параметр креативности (0-1)
+            max_tokens (int): Максимальное количество токенов в ответе
+
+        Returns:
+            str: Сгенерированный текст или None при ошибке
+        """
+        try:
+            return self.complete(prompt, temperature, max_tokens)
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            st.error(f"❌ Ошибка Yandex GPT: {e}")
+            return None
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        """
+        Число токенов текста по токенизатору модели (метод tokenize того же API)
+        или None, если API недоступен. В метрики запросов не входит.
+        """
+        if not self.configured:
+            return None
+        url = self.url.rsplit("/", 1)[0] + "/tokenize"
+        try:
+            response = self.session.post(
+                url, json={"modelUri": f"gpt://{self.folder_id}/{MODEL}", "text": text}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            return len(response.json()["tokens"])
+        except Exception:
+            return None
+
+    def stream_explanation(self, prompt, temperature=0.5, max_tokens=400) -> Iterator[str]:
+        """
+        То же, что generate_explanation, но с "stream": True: API присылает
+        строки JSON по мере генерации, в каждой — весь текст на текущий момент.
+        Отдает только новые фрагменты текста. Без учетных данных ничего не отдает;
+        ошибки сети и API пробрасываются вызывающему (метод вызывается из фонового
+        потока, где st.error недоступен), при разомкнутом предохранителе —
+        CircuitOpenError. Повторяется только установка соединения: после первого
+        фрагмента ответ уже показан пользователю.
+        """
+        if not self.configured:
+            return
+        started = time.perf_counter()
+        try:
+            response = self._post(self._payload(prompt, temperature, max_tokens, stream=True), stream=True)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self._finish(started, ok=False)
+            raise
+
+        ok, sent = False, 0
+        try:
+            with response:
+                # chunk_size=None — строки отдаются по мере прихода, без буфера в 512 байт
+                for line in response.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    text = json.loads(line)["result"]["alternatives"][0]["message"]["text"]
+                    if len(text) > sent:
+                        yield text[sent:]
+                        sent = len(text)
+            ok = True
+        except GeneratorExit:
+            # Потребитель прекратил чтение — это не ошибка API
+            ok = True
+            raise
+        finally:
+            self._finish(started, ok=ok)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = np.array(self._latencies)
+        stats["circuit"] = self.breaker.state
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(latency_p50=p50, latency_p95=p95, latency_p99=p99)
+        return stats
+
+
+# Глобальный экземпляр клиента для повторного использования
+yandex_gpt = YandexGPTClient()
@@ -1,99 +1,38 @@
-import os
+import hashlib
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 
-import requests
 import streamlit as st
-from dotenv import find_dotenv, load_dotenv
 
-load_dotenv(find_dotenv(), override=False)
+from src.config import LLM_WORKERS
+from src.constants import CATEGORIES, DEFAULT_CATEGORIES, POPULAR_POINTS
+from src.data_loader import load_data, load_location_summaries
+from src.explanation_cache import explanation_cache
+from src.llm_client import MODEL, SYSTEM_PROMPT, CircuitOpenError, YandexGPTClient, yandex_gpt
+from src.tracing import in_current_trace, span
 
 
-class YandexGPTClient:
+def build_route_prompt(route, selected_categories, total_time, categories_dict, summaries=None):
     """
-    Клиент для работы с Yandex GPT API.
-    Обеспечивает генерацию текстовых описаний через нейросеть.
-    """
-
-    def __init__(self):
-        self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-
-    def generate_explanation(self, prompt, temperature=0.5, max_tokens=400):
-        """
-        Генерирует текстовое описание через Yandex GPT API.
-
-        Args:
-            prompt (str): Текст запроса для нейросети
-            temperature (float): Параметр креативности (0-1)
-            max_tokens (int): Максимальное количество токенов в ответе
-
-        Returns:
-            str: Сгенерированный текст или None при ошибке
-        """
-        try:
-            # Получение учетных данных из секретов Streamlit
-            api_key = os.getenv("YANDEXGPT_API_KEY")
-            folder_id = os.getenv("YANDEXGPT_FOLDER_ID")
-
-            if not api_key or not folder_id:
-                return None
-
-            headers = {
-                "Authorization": f"Api-Key {api_key}",
-                "Content-Type": "application/json"
-            }
-
-            # Формирование запроса к API
-            payload = {
-                "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
-                "completionOptions": {
-                    "stream": False,
-                    "temperature": temperature,
-                    "maxTokens": max_tokens
-                },
-                "messages": [
-                    {
-                        "role": "system",
-                        "text": """Ты - профессиональный гид-эксперт по Нижнему Новгороду с талантом рассказчика.
-                        Твоя задача - создавать красочные, увлекательные и информативные описания маршрутов."""
-                    },
-                    {
-                        "role": "user",
-                        "text": prompt
-                    }
-                ]
-            }
-
-            response = requests.post(
-                self.url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            result = response.json()
-            return result["result"]["alternatives"][0]["message"]["text"]
-
-        except Exception as e:
-            st.error(f"❌ Ошибка Yandex GPT: {e}")
-            return None
-
-
-# Глобальный экземпляр клиента для повторного использования
-yandex_gpt = YandexGPTClient()
-
-
-def generate_route_explanation(route, selected_categories, total_time, categories_dict, start_position):
-    """
-    Генерирует текстовое описание маршрута с использованием нейросети.
+    Формирует промпт для нейросети по маршруту.
 
     Args:
-        route (list): Список точек маршрута
+        route (list): Список точек маршрута (непустой)
         selected_categories (list): Выбранные категории интересов
         total_time (int): Общее время маршрута в минутах
         categories_dict (dict): Словарь категорий
-        start_position (tuple): Координаты начальной точки
+        summaries (dict): Короткие описания объектов (id -> текст); по умолчанию
+            load_location_summaries(). Для объектов без короткого описания в
+            промпт идет начало полного
 
     Returns:
-        str: Описание маршрута с предупреждением о возможных неточностях
+        tuple: (промпт, названия выбранных категорий, описания объектов) —
+        последние два нужны резервному описанию
     """
-    if not route:
-        return "Маршрут не содержит объектов."
 
     # Расчет общих показателей маршрута
     total_travel_time = sum(point["travel_time"] for point in route)
@@ -102,13 +41,15 @@ def generate_route_explanation(route, selected_categories, total_time, categorie
 
     selected_cats_names = [categories_dict.get(
         cat_id, "Другое") for cat_id in selected_categories]
+    if summaries is None:
+        summaries = load_location_summaries()
 
     # Формирование детальных описаний каждого объекта маршрута
     object_descriptions = []
     for i, point in enumerate(route, 1):
         obj = point["object"]
         category_name = categories_dict.get(obj["category_id"], "Другое")
-        description = obj["description"]
+        description = summaries.get(str(obj["id"])) or obj["description"]
 
         # Обрезка длинных описаний для оптимизации промпта
         if len(description) > 200:
@@ -121,7 +62,7 @@ def generate_route_explanation(route, selected_categories, total_time, categorie
 
     # Формирование промпта для нейросети
     prompt = f"""
-СОЗДАЙ КРАСОВОЕ ОПИСАНИЕ ТУРИСТИЧЕСКОГО МАРШРУТА ПО НИЖНЕМУ НОВГОРОДУ
+СОЗДАЙ КРАСОЧНОЕ ОПИСАНИЕ ТУРИСТИЧЕСКОГО МАРШРУТА ПО НИЖНЕМУ НОВГОРОДУ
 
     ИНФОРМАЦИЯ О МАРШРУТЕ:
     - Интересы туриста: {", ".join(selected_cats_names)}
@@ -131,30 +72,72 @@ def generate_route_explanation(route, selected_categories, total_time, categorie
     - Время в пути: {total_travel_time:.1f} минут
     - Время на осмотр: {total_visit_time} минут
 
-    ПОДРОБНОЕ ОПИСАНИЕ ОБЪЕКТОВ МАРШРУТА:
+    ОБЪЕКТЫ МАРШРУТА:
     {descriptions_text}
 
     ЗАДАЧА:
-    Создай увлекательное описание этого маршрута, которое:
-    1. Кратко раскрывает ключевые особенности КАЖДОГО объекта КРАТКО (1 предложение на объект)
-    2. Объясняет, почему именно эти достопримечательности были выбраны
-    3. Показывает логическую связь между объектами маршрута
-    4. Подчеркивает практическую пользу и эмоциональную ценность прогулки
-    5. Создает целостный образ путешествия по Нижнему Новгороду
-
-    ОСОБЫЕ УКАЗАНИЯ:
-    - Используй яркие, но лаконичные описания
-    - Для каждого объекта выдели только САМОЕ ГЛАВНОЕ (1 ключевая особенность)
-    - Подчеркивай историческую и культурную ценность объектов кратко
-    - Покажи, как маршрут удовлетворяет интересы туриста в {", ".join(selected_cats_names)}
-    - Создай ощущение последовательного погружения в атмосферу города
-    - ОПИСАНИЕ КАЖДОГО ОБЪЕКТА ДОЛЖНО БЫТЬ КРАТКИМ И СОДЕРЖАТЕЛЬНЫМ
+    Создай увлекательное и целостное описание прогулки по Нижнему Новгороду:
+    - для КАЖДОГО объекта одно яркое предложение о главной особенности (история, культурная ценность);
+    - почему выбраны именно эти объекты и как они связаны между собой;
+    - как маршрут отвечает интересам туриста: {", ".join(selected_cats_names)};
+    - практическая польза и эмоциональная ценность прогулки.
+    Пиши ярко, но лаконично.
 
     НАЧНИ ОПИСАНИЕ:
 """
 
+    return prompt, selected_cats_names, descriptions_text
+
+
+def explanation_key(route, selected_cats_names, total_time, descriptions_text):
+    """
+    Ключ кэша объяснений: хэш упорядоченного списка объектов маршрута, набора
+    выбранных категорий, бюджета времени и текстов объектов из промпта (а также
+    модели и системного промпта). Расстояния и время в пути в ключ не входят:
+    на текст объяснения они почти не влияют, а маршрут из тех же объектов от
+    соседней точки старта должен получить тот же ответ.
+    """
+    material = json.dumps({
+        "objects": [str(point["object"]["id"]) for point in route],
+        "categories": sorted(selected_cats_names),
+        "total_time": int(total_time),
+        "descriptions": descriptions_text,
+        "model": MODEL,
+        "system": SYSTEM_PROMPT,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(material.encode(), digest_size=16).hexdigest()
+
+
+def generate_route_explanation(route, selected_categories, total_time, categories_dict, start_position):
+    """
+    Генерирует текстовое описание маршрута с использованием нейросети.
+
+    Args:
+        route (list): Список точек маршрута
+        selected_categories (list): Выбранные категории интересов
+        total_time (int): Общее время маршрута в минутах
+        categories_dict (dict): Словарь категорий
+        start_position (tuple): Координаты начальной точки
+
+    Returns:
+        str: Описание маршрута с предупреждением о возможных неточностях
+    """
+    if not route:
+        return "Маршрут не содержит объектов."
+
+    prompt, selected_cats_names, descriptions_text = build_route_prompt(
+        route, selected_categories, total_time, categories_dict)
+    key = explanation_key(route, selected_cats_names, total_time, descriptions_text)
+    cached = explanation_cache.get(key)
+    if cached:
+        return cached
+
     # Основная генерация через нейросеть
-    explanation = yandex_gpt.generate_explanation(prompt)
+    with span("llm_explanation", stream=False, prompt_chars=len(prompt)) as llm:
+        explanation = yandex_gpt.generate_explanation(prompt)
+        llm.set(used_llm=bool(explanation))
+    if explanation:
+        explanation_cache.put(key, explanation)
 
     # Резервный вариант при недоступности нейросети
     if not explanation:
@@ -226,3 +209,190 @@ def generate_enhanced_fallback_explanation(route, selected_cats_names, total_tim
 Это идеальный способ познакомиться с ключевыми достопримечательностями Нижнего Новгорода, ощутив его неповторимый характер и историческое величие."""
 
     return explanation
+
+
+# Фоновые потоки для генерации объяснений: запрос к нейросети не блокирует
+# перезапуск скрипта Streamlit
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+
+class ExplanationJob:
+    """
+    Объяснение маршрута, которое генерируется в фоновом потоке. Текст
+    накапливается по мере прихода фрагментов от нейросети; страница читает его
+    при каждом обновлении. Объект живет в st.session_state, поэтому генерация
+    продолжается и после перезапуска скрипта (клик по карте и т.п.).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parts: List[str] = []
+        self._done = threading.Event()
+        self.used_llm = True
+        self.error: Optional[str] = None
+        self.started_at = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+
+    def append(self, chunk: str):
+        with self._lock:
+            if self.first_chunk_at is None:
+                self.first_chunk_at = time.perf_counter()
+            self._parts.append(chunk)
+
+    def replace(self, text: str, used_llm: bool):
+        with self._lock:
+            self._parts = [text]
+            self.used_llm = used_llm
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return "".join(self._parts)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def finish(self):
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждет завершения не дольше timeout секунд; True, если генерация закончена."""
+        return self._done.wait(timeout)
+
+
+def _run_explanation(job: ExplanationJob, prompt: str, key: str, fallback: Callable[[], str],
+                     client: YandexGPTClient):
+    with span("llm_explanation", stream=True, prompt_chars=len(prompt)) as llm:
+        try:
+            for chunk in client.stream_explanation(prompt):
+                job.append(chunk)
+            # Кэшируется только полный ответ нейросети
+            if job.text.strip():
+                explanation_cache.put(key, job.text)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            # Нейросеть недоступна или ответ пустой — резервное описание
+            if not job.text.strip():
+                job.replace(fallback(), used_llm=False)
+            if job.first_chunk_at is not None:
+                llm.set(first_chunk_ms=round((job.first_chunk_at - job.started_at) * 1000, 1))
+            llm.set(used_llm=job.used_llm, error=job.error)
+            job.finish()
+
+
+def start_route_explanation(route, selected_categories, total_time, categories_dict, start_position,
+                            client: Optional[YandexGPTClient] = None) -> ExplanationJob:
+    """
+    Запускает generate_route_explanation в фоне с потоковым ответом нейросети и
+    сразу возвращает ExplanationJob. Промпт строится в вызывающем потоке.
+    Если объяснение для такого же маршрута уже есть в кэше или нейросеть
+    недоступна (нет учетных данных, разомкнут предохранитель), задача сразу
+    готова.
+    """
+    job = ExplanationJob()
+    if not route:
+        job.replace("Маршрут не содержит объектов.", used_llm=False)
+        job.finish()
+        return job
+
+    prompt, selected_cats_names, descriptions_text = build_route_prompt(
+        route, selected_categories, total_time, categories_dict)
+    key = explanation_key(route, selected_cats_names, total_time, descriptions_text)
+    cached = explanation_cache.get(key)
+    if cached:
+        job.append(cached)
+        job.finish()
+        return job
+
+    def fallback():
+        return generate_enhanced_fallback_explanation(
+            route, selected_cats_names, total_time, categories_dict, start_position, descriptions_text
+        )
+
+    # Нет учетных данных или предохранитель разомкнут — сразу резервное описание
+    client = client or yandex_gpt
+    if not client.available():
+        job.replace(fallback(), used_llm=False)
+        job.finish()
+        return job
+
+    _executor.submit(in_current_trace(_run_explanation), job, prompt, key, fallback, client)
+    return job
+
+
+def popular_routes(times=(60, 120, 180, 240), categories=DEFAULT_CATEGORIES, radius=1500,
+                   modes=("greedy", "optimized")):
+    """
+    Маршруты от популярных точек старта (POPULAR_POINTS × times × modes,
+    категории по умолчанию): список пар (RouteQuery, точки маршрута).
+    """
+    from src.batch_routes import RouteQuery, plan_routes_batch
+    from src.catalog_store import load_catalog_df
+
+    df = load_catalog_df()
+    if df is None:
+        df = load_data()
+    queries = [
+        RouteQuery(start, tuple(categories), total_time, radius, mode=mode, seed=i)
+        for i, (start, total_time, mode) in enumerate(
+            (s, t, m) for s in POPULAR_POINTS.values() for t in times for m in modes
+        )
+    ]
+    routes = plan_routes_batch(queries, df, workers=1)
+    return [(query, route.resolve(df)) for query, route in zip(queries, routes)]
+
+
+def warm_explanations(client: Optional[YandexGPTClient] = None, **route_options):
+    """
+    Заранее генерирует объяснения для маршрутов popular_routes(**route_options),
+    чтобы первые пользователи получали готовый текст из кэша. Маршруты,
+    объяснение которых уже есть в кэше, пропускаются.
+    """
+    client = client or yandex_gpt
+    routes = popular_routes(**route_options)
+
+    started = time.perf_counter()
+    seen, cached, generated, failed = set(), 0, 0, 0
+    for query, points in routes:
+        if not points:
+            continue
+        prompt, selected_cats_names, descriptions_text = build_route_prompt(
+            points, list(query.categories), query.total_time, CATEGORIES)
+        key = explanation_key(points, selected_cats_names, query.total_time, descriptions_text)
+        if key in seen:
+            continue
+        seen.add(key)
+        if explanation_cache.get(key):
+            cached += 1
+            continue
+        try:
+            explanation = "".join(client.stream_explanation(prompt))
+        except CircuitOpenError as e:
+            print(f"[llm] {e}, прогрев остановлен")
+            break
+        except Exception as e:
+            print(f"[llm] Ошибка Yandex GPT: {e}")
+            explanation = ""
+        if explanation.strip():
+            explanation_cache.put(key, explanation)
+            generated += 1
+        else:
+            failed += 1
+
+    print(
+        f"[llm] Маршрутов: {len(routes)}, разных: {len(seen)}, уже в кэше: {cached}, "
+        f"сгенерировано: {generated}, без ответа: {failed}, время: {time.perf_counter() - started:.1f} с"
+    )
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "warm":
+        warm_explanations()
+    else:
+        print("Использование: python -m src.llm_utils warm")
+        sys.exit(1)
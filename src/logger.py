@@ -1,7 +1,11 @@
 import logging
 import socket
+from functools import lru_cache
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from src.tracing import current_trace_id
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,18 +16,37 @@ logging.basicConfig(
     ],
 )
 
+
+@lru_cache(maxsize=1)
+def _host_ip() -> str:
+    # Адрес сервера не меняется — разрешаем имя хоста один раз, а не при каждом действии
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return "unknown"
+
+
 def get_user_ip() -> str:
+    """
+    Адрес пользователя: первый из X-Forwarded-For (за прокси), иначе адрес
+    соединения из st.context; вне сессии Streamlit — адрес сервера.
+    """
+    if get_script_run_ctx() is None:
+        return _host_ip()
     try:
-        if hasattr(st, "server") and hasattr(st.server, "_runtime"):
-            headers = st.server._runtime._get_websocket_headers()  # type: ignore
-            if headers and "X-Forwarded-For" in headers:
-                return headers["X-Forwarded-For"].split(",")[0].strip()
-        hostname = socket.gethostname()
-        return socket.gethostbyname(hostname)
+        forwarded = st.context.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        if st.context.ip_address:
+            return st.context.ip_address
     except Exception:
-        return "unknown"
+        pass
+    return _host_ip()
+
 
 def log_user_action(action: str, **kwargs):
     user_ip = get_user_ip()
     extra = " ".join([f"{k}={v}" for k, v in kwargs.items()])
-    logging.info(f"[USER] {action.upper()} ip={user_ip} {extra}")
\ No newline at end of file
+    trace_id = current_trace_id()
+    trace = f" trace={trace_id}" if trace_id else ""
+    logging.info(f"[USER] {action.upper()} ip={user_ip}{trace} {extra}")
@@ -1,34 +1,407 @@
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import folium
-import pandas as pd
+import numpy as np
 import requests
+from folium.elements import MacroElement
 from folium.features import DivIcon
-from functools import lru_cache
+from folium.plugins import VectorGridProtobuf
+from folium.template import Template
+from jinja2.utils import htmlsafe_json_dumps
+from requests.adapters import HTTPAdapter
 
+from src.config import OSRM_BASE_URL, OSRM_DEADLINE_SECONDS
 from src.constants import CATEGORIES as categories
 from src.constants import CATEGORY_COLORS as category_colors
+from src.constants import MAP_LAYER_CACHE_SIZE, TILE_MAX_ZOOM
+from src.osrm_cache import route_geometry_cache
+from src.tracing import in_current_trace, span
+
+_OSRM_WORKERS = 8
+_METERS_PER_DEGREE = 111_320.0
+
+# Общая keep-alive сессия и пул потоков для запросов к OSRM
+_osrm_session = requests.Session()
+_osrm_session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=_OSRM_WORKERS))
+_osrm_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=_OSRM_WORKERS))
+_osrm_pool = ThreadPoolExecutor(max_workers=_OSRM_WORKERS, thread_name_prefix="osrm")
+
 
-@lru_cache(maxsize=512)
 def _fetch_osrm_route(a, b):
-    profile = 'driving'
-    base = "https://routing.openstreetmap.de/routed-foot/route/v1"
-    url = f"{base}/{profile}/{a[1]},{a[0]};{b[1]},{b[0]}?overview=full&geometries=geojson"
-    try:
-        r = requests.get(url, timeout=6)
-        r.raise_for_status()
-        data = r.json()
-        coords = data["routes"][0]["geometry"]["coordinates"]
-        return [(lat, lon) for lon, lat in coords]
-    except Exception as e:
-        print(f"OSRM route fetch failed: {e}")
-        return []
-
-
-def create_interactive_map(
-    df, selected_categories, center_lat, center_lon, search_radius, start_position=None, route=None
+    with span("osrm_leg") as leg:
+        a, b = route_geometry_cache.snap(a), route_geometry_cache.snap(b)
+        cached = route_geometry_cache.get(a, b)
+        leg.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        profile = 'driving'
+        url = f"{OSRM_BASE_URL}/{profile}/{a[1]},{a[0]};{b[1]},{b[0]}?overview=full&geometries=geojson"
+        try:
+            r = _osrm_session.get(url, timeout=6)
+            r.raise_for_status()
+            data = r.json()
+            coords = data["routes"][0]["geometry"]["coordinates"]
+            result = [(lat, lon) for lon, lat in coords]
+        except Exception as e:
+            print(f"OSRM route fetch failed: {e}")
+            leg.set(error=str(e))
+            return []
+
+        route_geometry_cache.put(a, b, result)
+        leg.set(points=len(result))
+        return result
+
+
+def _graph_route_legs(points, router):
+    """Геометрия отрезков по локальному пешеходному графу; вне сети — прямая линия."""
+    legs = []
+    for a, b in zip(points, points[1:]):
+        found = router.route(a, b)
+        legs.append(found[1] if found else [a, b])
+    return legs
+
+
+def _fetch_route_legs(points, deadline=OSRM_DEADLINE_SECONDS):
+    """
+    Загружает геометрию всех отрезков points[i] -> points[i + 1] параллельно.
+    Отрезки, которые не удалось получить до дедлайна (или с ошибкой), заменяются
+    прямой линией; опоздавшие запросы дорабатывают в фоне и попадают в кэш
+    геометрии (src.osrm_cache).
+    """
+    pairs = list(zip(points, points[1:]))
+    # Отрезки считаются в пуле потоков, но их спаны входят в трассу текущего запроса
+    futures = [_osrm_pool.submit(in_current_trace(_fetch_osrm_route), a, b) for a, b in pairs]
+
+    pending = set(futures)
+    stop_at = time.monotonic() + deadline
+    while pending:
+        left = stop_at - time.monotonic()
+        if left <= 0:
+            break
+        _, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+
+    legs = []
+    for (a, b), future in zip(pairs, futures):
+        seg = future.result() if future.done() and not future.exception() else []
+        legs.append(seg or [a, b])
+    return legs
+
+
+class _ObjectMarkersLayer(MacroElement):
+    """
+    Все маркеры объектов одним элементом: данные — компактный JSON-массив
+    [lat, lon, category_id, title, description, id], а маркеры, тултипы и попапы
+    (те же, что давали отдельные folium.Marker) создаются в браузере циклом.
+    Объекты из hidden_ids пропускаются — их рисует слой маршрута с номерами.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup().addTo({{ this._parent.get_name() }});
+            (function (layer) {
+                var categories = {{ this.categories }};
+                var hidden = new Set({{ this.hidden }});
+                var icons = {};
+                {{ this.points }}.forEach(function (p) {
+                    if (hidden.has(p[5])) {
+                        return;
+                    }
+                    var category = categories[p[2]] || ["Другое", "gray"];
+                    if (!icons[category[1]]) {
+                        icons[category[1]] = L.AwesomeMarkers.icon({
+                            markerColor: category[1],
+                            iconColor: "white",
+                            icon: "info-sign",
+                            prefix: "glyphicon",
+                            extraClasses: "fa-rotate-0"
+                        });
+                    }
+                    L.marker([p[0], p[1]], {icon: icons[category[1]]})
+                        .bindTooltip("<div>" + p[3] + " (" + category[0] + ")</div>", {sticky: true})
+                        .bindPopup(
+                            '<div style="width: 250px;"><h4>' + p[3] + "</h4>" +
+                            "<p><b>Категория:</b> " + category[0] + "</p>" +
+                            "<p><b>Описание:</b> " + p[4] + "...</p></div>",
+                            {maxWidth: 300}
+                        )
+                        .addTo(layer);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, points: str, hidden_ids=()):
+        super().__init__()
+        self._name = "ObjectMarkers"
+        self.points = points
+        self.hidden = htmlsafe_json_dumps(sorted(str(i) for i in hidden_ids))
+        self.categories = htmlsafe_json_dumps(
+            {cat_id: [name, category_colors.get(cat_id, "gray")] for cat_id, name in categories.items()},
+            ensure_ascii=False,
+        )
+
+
+class _ClusterMarkersLayer(MacroElement):
+    """
+    Кластеры маркеров ([lat, lon, count]) кружками с числом объектов;
+    клик по кластеру приближает карту к нему.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup().addTo({{ this._parent.get_name() }});
+            (function (layer) {
+                {{ this.clusters }}.forEach(function (c) {
+                    var size = c[2] < 10 ? 30 : (c[2] < 100 ? 36 : 44);
+                    L.marker([c[0], c[1]], {
+                        icon: L.divIcon({
+                            className: "",
+                            iconSize: [size, size],
+                            html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size + 'px;' +
+                                'border-radius:50%;background:rgba(255,107,107,0.85);color:#fff;text-align:center;' +
+                                'font-weight:700;border:2px solid #fff;box-shadow:0 1px 4px rgba(0,0,0,0.35);">' +
+                                c[2] + "</div>"
+                        })
+                    })
+                        .bindTooltip("Объектов: " + c[2] + ". Приблизьте карту, чтобы увидеть их")
+                        .on("click", function (e) {
+                            this._map.setView(e.latlng, this._map.getZoom() + 2);
+                        })
+                        .addTo(layer);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, clusters: str):
+        super().__init__()
+        self._name = "ClusterMarkers"
+        self.clusters = clusters
+
+
+# Цвета маркеров Leaflet.awesome-markers в HEX — для точек векторных тайлов
+_MARKER_HEX = {
+    "red": "#d63e2a",
+    "darkred": "#a23336",
+    "lightred": "#ff8e7f",
+    "orange": "#f69730",
+    "beige": "#ffcb92",
+    "green": "#72b026",
+    "darkgreen": "#728224",
+    "lightgreen": "#bbf970",
+    "blue": "#38aadd",
+    "darkblue": "#0067a3",
+    "lightblue": "#8adaff",
+    "cadetblue": "#436978",
+    "purple": "#d252b9",
+    "darkpurple": "#5b396b",
+    "pink": "#ff91ea",
+    "white": "#fbfbfb",
+    "gray": "#575757",
+    "lightgray": "#a3a3a3",
+    "black": "#303030",
+}
+
+
+class _ObjectTilesLayer(VectorGridProtobuf):
+    """
+    Объекты из векторных тайлов src.tile_server (слой "locations"): браузер
+    подгружает только тайлы видимой области. Точки окрашены по категории,
+    по клику открывается попап с названием и категорией.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) -%}
+            var {{ this.get_name() }} = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+                rendererFactory: L.canvas.tile,
+                interactive: true,
+                maxNativeZoom: {{ this.max_zoom }},
+                vectorTileLayerStyles: {
+                    locations: function (properties) {
+                        var category = {{ this.categories }}[properties.category_id] || ["Другое", "#575757"];
+                        return {radius: 7, weight: 2, color: "#ffffff", fill: true, fillColor: category[1], fillOpacity: 0.9};
+                    }
+                }
+            }).on("click", function (e) {
+                var p = e.layer.properties;
+                var category = {{ this.categories }}[p.category_id] || ["Другое", "#575757"];
+                L.popup({maxWidth: 300})
+                    .setLatLng(e.latlng)
+                    .setContent('<div style="width: 250px;"><h4>' + p.title + "</h4>" +
+                        "<p><b>Категория:</b> " + category[0] + "</p></div>")
+                    .openOn({{ this._parent.get_name() }});
+            }).addTo({{ this._parent.get_name() }});
+        {%- endmacro %}
+        """
+    )
+
+    default_js = [
+        ("vectorGrid", "https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js"),
+    ]
+
+    def __init__(self, url: str, max_zoom: int = TILE_MAX_ZOOM):
+        super().__init__(url, name="Объекты", control=False)
+        self._name = "ObjectTiles"
+        self.max_zoom = max_zoom
+        self.categories = htmlsafe_json_dumps(
+            {
+                cat_id: [name, _MARKER_HEX.get(category_colors.get(cat_id, "gray"), "#575757")]
+                for cat_id, name in categories.items()
+            },
+            ensure_ascii=False,
+        )
+
+
+# Готовые JSON-массивы маркеров: (версия данных, категории, область) -> строка
+_marker_layers: "OrderedDict[tuple, str]" = OrderedDict()
+_marker_layers_lock = threading.Lock()
+
+
+def _markers_area(center, markers_radius):
+    """
+    Центр области маркеров, привязанный к сетке с шагом markers_radius / 2, и радиус,
+    покрывающий исходный круг. Соседние клики по карте попадают в одну клетку,
+    поэтому слой маркеров для них строится один раз.
+    """
+    step = markers_radius / 2
+    lat_step = step / _METERS_PER_DEGREE
+    lat = round(center[0] / lat_step) * lat_step
+    lon_step = step / (_METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    lon = round(center[1] / lon_step) * lon_step
+    return (round(lat, 6), round(lon, 6)), markers_radius + step
+
+
+def _marker_points(df) -> str:
+    df = df.dropna(subset=["lat", "lon"])
+    rows = zip(
+        df["lat"].round(6).tolist(),
+        df["lon"].round(6).tolist(),
+        df["category_id"].tolist(),
+        df["title"].astype(str).tolist(),
+        df["description"].astype(str).str[:150].tolist(),
+        df["id"].astype(str).tolist(),
+    )
+    return htmlsafe_json_dumps([list(row) for row in rows], ensure_ascii=False)
+
+
+def _object_markers_layer(df, selected_categories, center, index, markers_radius, data_version, hidden_ids):
+    """Слой маркеров объектов; при известной data_version JSON берётся из LRU-кэша."""
+    radius = None
+    if index is not None and markers_radius is not None:
+        center, radius = _markers_area(center, markers_radius)
+    cats = tuple(sorted(set(int(c) for c in selected_categories or ())))
+    key = (data_version, cats, center if radius else None, radius)
+
+    points = None
+    if data_version is not None:
+        with _marker_layers_lock:
+            points = _marker_layers.get(key)
+            if points is not None:
+                _marker_layers.move_to_end(key)
+
+    if points is None:
+        if radius is not None:
+            positions, _ = index.query(center, radius, cats or None)
+            filtered_df = df.iloc[positions]
+        else:
+            filtered_df = df[df["category_id"].isin(cats)] if cats else df
+        points = _marker_points(filtered_df)
+        if data_version is not None:
+            with _marker_layers_lock:
+                _marker_layers[key] = points
+                while len(_marker_layers) > MAP_LAYER_CACHE_SIZE:
+                    _marker_layers.popitem(last=False)
+
+    return center, _ObjectMarkersLayer(points, hidden_ids)
+
+
+def create_base_map(
+    df,
+    selected_categories,
+    center_lat,
+    center_lon,
+    index=None,
+    markers_radius=None,
+    data_version=None,
+    hidden_ids=(),
+    markers=True,
 ):
-    filtered_df = df[df["category_id"].isin(selected_categories)] if selected_categories else df
+    """
+    Статическая часть карты: подложка и маркеры объектов выбранных категорий
+    (markers=False — только подложка, объекты рисует create_cluster_layer).
+    Всё, что зависит от точки старта, добавляется отдельно — create_route_layer
+    (через feature_group_to_add у st_folium).
+
+    m.component_key меняется только вместе с набором маркеров: если передать его
+    в st_folium(key=...), клик по карте не пересоздаёт её в браузере — обновляется
+    лишь слой маршрута, а вид сдвигается параметром center.
+    """
+    if not markers:
+        m = folium.Map(location=[center_lat, center_lon], zoom_start=14, attribution_control=False)
+        m.component_key = "map-clusters"
+        return m
+
+    center, layer = _object_markers_layer(
+        df, selected_categories, (center_lat, center_lon), index, markers_radius, data_version, hidden_ids
+    )
+    m = folium.Map(location=list(center), zoom_start=14, attribution_control=False)
+    layer.add_to(m)
+    m.component_key = f"map-{zlib.crc32(layer.points.encode()):08x}-{zlib.crc32(layer.hidden.encode()):08x}"
+    return m
+
+
+def create_tiles_map(selected_categories, center_lat, center_lon, tiles_url, data_version=None):
+    """
+    Карта, на которой объекты выбранных категорий подгружаются векторными тайлами
+    с tiles_url (шаблон с {z}/{x}/{y}). Версия данных добавляется в URL, чтобы
+    браузер не показывал тайлы из кэша после обновления каталога.
+    """
+    cats = sorted(set(int(c) for c in selected_categories or ()))
+    params = [f"categories={','.join(str(c) for c in cats)}"] if cats else []
+    if data_version is not None:
+        params.append(f"v={data_version}")
+    url = tiles_url + ("&" if "?" in tiles_url else "?") + "&".join(params) if params else tiles_url
 
     m = folium.Map(location=[center_lat, center_lon], zoom_start=14, attribution_control=False)
+    _ObjectTilesLayer(url).add_to(m)
+    m.component_key = f"map-tiles-{zlib.crc32(url.encode()):08x}"
+    return m
+
+
+def create_cluster_layer(df, clusters, selected_categories, bounds, zoom, hidden_ids=()):
+    """
+    Объекты только видимой области bounds на масштабе zoom: кластеры и одиночные
+    маркеры из индекса clusters (src.marker_clusters.MarkerClusters, построен по df).
+    Размер слоя определяется экраном, а не размером каталога.
+    """
+    view = clusters.query(bounds, zoom, selected_categories)
+    grouped = view.counts > 1
+    cluster_rows = zip(
+        np.round(view.lats[grouped], 6).tolist(),
+        np.round(view.lons[grouped], 6).tolist(),
+        view.counts[grouped].tolist(),
+    )
+
+    layer = folium.FeatureGroup(name="Объекты")
+    _ClusterMarkersLayer(htmlsafe_json_dumps([list(row) for row in cluster_rows])).add_to(layer)
+    _ObjectMarkersLayer(_marker_points(df.iloc[view.positions[~grouped]]), hidden_ids).add_to(layer)
+    return layer
+
+
+def create_route_layer(start_position, search_radius, route=None, router=None):
+    """Динамическая часть карты: точка старта, линия и пронумерованные объекты маршрута, радиус поиска."""
+    layer = folium.FeatureGroup(name="Маршрут")
 
     if start_position:
         folium.Marker(
@@ -36,26 +409,16 @@ def create_interactive_map(
             popup="Начальная точка",
             tooltip="Начальная точка (кликните для изменения)",
             icon=folium.Icon(color="darkblue", icon="home", prefix="fa"),
-        ).add_to(m)
+        ).add_to(layer)
 
-    route_index_map = {}
     if route:
-        path_coords = []
-        prev = start_position if start_position else (route[0]["object"]["lat"], route[0]["object"]["lon"])
+        points = [start_position if start_position else (route[0]["object"]["lat"], route[0]["object"]["lon"])]
+        points.extend((point["object"]["lat"], point["object"]["lon"]) for point in route)
 
-        for idx, point in enumerate(route, start=1):
-            obj = point["object"]
-            route_index_map[obj["id"]] = idx
-            nxt = (obj["lat"], obj["lon"])
-            try:
-                seg = _fetch_osrm_route(prev, nxt)
-                if path_coords and seg:
-                    path_coords.extend(seg[1:])
-                else:
-                    path_coords.extend(seg)
-            except Exception:
-                path_coords.extend([prev, nxt])
-            prev = nxt
+        path_coords = []
+        legs = _graph_route_legs(points, router) if router is not None else _fetch_route_legs(points)
+        for seg in legs:
+            path_coords.extend(seg[1:] if path_coords else seg)
 
         if path_coords:
             folium.PolyLine(
@@ -65,29 +428,22 @@ def create_interactive_map(
                 opacity=0.7,
                 popup="Пешеходный маршрут",
                 dash_array='12'
-            ).add_to(m)
-
-    for _, row in filtered_df.iterrows():
-        if pd.isna(row["lat"]) or pd.isna(row["lon"]):
-            continue
+            ).add_to(layer)
 
-        color = category_colors.get(row["category_id"], "gray")
-        category_name = categories.get(row["category_id"], "Другое")
-
-        popup_html = f"""
-        <div style="width: 250px;">
-            <h4>{row["title"]}</h4>
-            <p><b>Категория:</b> {category_name}</p>
-            <p><b>Описание:</b> {row["description"][:150]}...</p>
-        </div>
-        """
-
-        if row["id"] in route_index_map:
-            idx = route_index_map[row["id"]]
+        for idx, point in enumerate(route, start=1):
+            obj = point["object"]
+            category_name = categories.get(obj["category_id"], "Другое")
+            popup_html = f"""
+            <div style="width: 250px;">
+                <h4>{obj["title"]}</h4>
+                <p><b>Категория:</b> {category_name}</p>
+                <p><b>Описание:</b> {obj["description"][:150]}...</p>
+            </div>
+            """
             folium.Marker(
-                [row["lat"], row["lon"]],
+                [obj["lat"], obj["lon"]],
                 popup=folium.Popup(popup_html, max_width=300),
-                tooltip=f"{idx}. {row['title']} ({category_name})",
+                tooltip=f"{idx}. {obj['title']} ({category_name})",
                 icon=DivIcon(
                     icon_size=(28, 28),
                     icon_anchor=(14, 14),
@@ -101,14 +457,7 @@ def create_interactive_map(
                         ">{idx}</div>
                     ''',
                 ),
-            ).add_to(m)
-        else:
-            folium.Marker(
-                [row["lat"], row["lon"]],
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=f"{row['title']} ({category_name})",
-                icon=folium.Icon(color=color, icon="info-sign"),
-            ).add_to(m)
+            ).add_to(layer)
 
     if start_position:
         folium.Circle(
@@ -118,6 +467,6 @@ def create_interactive_map(
             fill=True,
             fillOpacity=0.001,
             tooltip=f"Радиус поиска: {search_radius}м",
-        ).add_to(m)
+        ).add_to(layer)
 
-    return m
\ No newline at end of file
+    return layer
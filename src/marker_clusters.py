@@ -0,0 +1,225 @@
+import math
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.scoring import CatalogArrays
+
+Bounds = Tuple[Tuple[float, float], Tuple[float, float]]
+
+# Размер тайла Leaflet в пикселях
+_TILE_SIZE = 256
+_MAX_MERCATOR_LAT = 85.05112878
+# Сетка уровня отдельных объектов (координаты ячеек помещаются в int32)
+_POINT_GRID = 2 ** 30
+
+
+@dataclass(frozen=True)
+class MapView:
+    """
+    Что показать в видимой области карты. Элемент с count == 1 — отдельный объект
+    (positions — его строка в каталоге), с count > 1 — кластер (positions == -1).
+    """
+
+    lats: np.ndarray
+    lons: np.ndarray
+    counts: np.ndarray
+    positions: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+@dataclass(frozen=True)
+class _Level:
+    """Кластеры одного уровня масштаба, отсортированные по (категория, cx, cy)."""
+
+    category_ids: np.ndarray
+    cx: np.ndarray
+    cy: np.ndarray
+    counts: np.ndarray
+    lat_sums: np.ndarray
+    lon_sums: np.ndarray
+    first: np.ndarray
+    category_starts: dict
+
+
+def _mercator(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Нормированные координаты Web Mercator: x, y в [0, 1), y растёт к югу."""
+    lats = np.clip(lats, -_MAX_MERCATOR_LAT, _MAX_MERCATOR_LAT)
+    x = (lons + 180.0) / 360.0
+    sin = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def viewport_bounds(center: Tuple[float, float], zoom: int, width: int = 1200, height: int = 600) -> Bounds:
+    """Примерная видимая область карты Leaflet: ((юг, запад), (север, восток))."""
+    scale = _TILE_SIZE * 2 ** zoom
+    x, y = _mercator(np.array([center[0]]), np.array([center[1]]))
+    xs = np.array([x[0] - width / 2 / scale, x[0] + width / 2 / scale])
+    ys = np.clip(np.array([y[0] + height / 2 / scale, y[0] - height / 2 / scale]), 0.0, 1.0)
+    lons = xs * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * ys))))
+    return (float(lats[0]), float(lons[0])), (float(lats[1]), float(lons[1]))
+
+
+class MarkerClusters:
+    """
+    Иерархический индекс кластеров маркеров в духе supercluster, но на сетке:
+    для каждого масштаба min_zoom..max_zoom точки группируются по ячейкам
+    cell_px × cell_px экранных пикселей в проекции Web Mercator. Ячейка уровня z
+    ровно делится на четыре ячейки уровня z + 1, поэтому при приближении кластеры
+    распадаются, а не перескакивают. Начиная с max_zoom + 1 объекты отдаются
+    поодиночке.
+
+    Уровни строятся раздельно по категориям; запрос складывает кластеры выбранных
+    категорий, попавшие в видимую область, так что один индекс обслуживает любой
+    набор категорий.
+    """
+
+    def __init__(self, arrays: CatalogArrays, min_zoom: int = 0, max_zoom: int = 16, cell_px: int = 64):
+        self.arrays = arrays
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+
+        valid = np.flatnonzero(~np.isnan(arrays.lats) & ~np.isnan(arrays.lons))
+        self._x, self._y = _mercator(arrays.lats[valid], arrays.lons[valid])
+        self._valid = valid
+        self._levels = [self._build_level(self._cells(zoom)) for zoom in range(min_zoom, max_zoom + 1)]
+        self._points = self._build_level(None)
+
+    def __len__(self) -> int:
+        return len(self.arrays)
+
+    def _cells(self, zoom: int) -> int:
+        """Число ячеек сетки по каждой оси на масштабе zoom."""
+        return max(1, _TILE_SIZE * 2 ** zoom // self.cell_px)
+
+    def _build_level(self, n_cells: Optional[int]) -> _Level:
+        # n_cells=None — уровень отдельных объектов: ячейка на каждую точку
+        grid = n_cells if n_cells is not None else _POINT_GRID
+        cats = self.arrays.category_ids[self._valid].astype(np.int32)
+        cx = np.floor(self._x * grid).astype(np.int32)
+        cy = np.floor(self._y * grid).astype(np.int32)
+        order = np.lexsort((cy, cx, cats))
+        cats, cx, cy = cats[order], cx[order], cy[order]
+        positions = self._valid[order]
+        lats, lons = self.arrays.lats[positions], self.arrays.lons[positions]
+
+        if n_cells is None:
+            starts = np.arange(len(positions))
+        else:
+            change = np.ones(len(positions), dtype=bool)
+            change[1:] = (cats[1:] != cats[:-1]) | (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])
+            starts = np.flatnonzero(change)
+
+        counts = np.diff(np.append(starts, len(positions))).astype(np.int32)
+        group_cats = cats[starts]
+        unique_cats, cat_first = np.unique(group_cats, return_index=True)
+        bounds = np.append(cat_first, len(group_cats))
+        return _Level(
+            category_ids=group_cats,
+            cx=cx[starts],
+            cy=cy[starts],
+            counts=counts,
+            lat_sums=np.add.reduceat(lats, starts) if len(starts) else lats,
+            lon_sums=np.add.reduceat(lons, starts) if len(starts) else lons,
+            first=positions[starts].astype(np.int32),
+            category_starts={int(c): (int(a), int(b)) for c, a, b in zip(unique_cats, bounds[:-1], bounds[1:])},
+        )
+
+    def query(self, bounds: Bounds, zoom: float, categories: Optional[Iterable[int]] = None,
+              padding: float = 0.25) -> MapView:
+        """
+        Кластеры и объекты внутри bounds=((юг, запад), (север, восток)), расширенной
+        на padding своей ширины/высоты с каждой стороны, для масштаба zoom.
+        """
+        zoom = int(math.floor(zoom))
+        if zoom > self.max_zoom:
+            level, grid = self._points, _POINT_GRID
+        else:
+            zoom = max(zoom, self.min_zoom)
+            level, grid = self._levels[zoom - self.min_zoom], self._cells(zoom)
+
+        (south, west), (north, east) = bounds
+        xs, ys = _mercator(np.array([south, north]), np.array([west, east]))
+        pad_x, pad_y = (xs[1] - xs[0]) * padding, (ys[0] - ys[1]) * padding
+        x0 = int(math.floor(max(xs[0] - pad_x, 0.0) * grid))
+        x1 = int(math.floor(min(xs[1] + pad_x, 1.0 - 1e-12) * grid))
+        y0 = int(math.floor(max(ys[1] - pad_y, 0.0) * grid))
+        y1 = int(math.floor(min(ys[0] + pad_y, 1.0 - 1e-12) * grid))
+
+        cats = level.category_starts.keys() if categories is None else (int(c) for c in categories)
+        found: List[np.ndarray] = []
+        for cat in cats:
+            if cat not in level.category_starts:
+                continue
+            a, b = level.category_starts[cat]
+            lo = a + np.searchsorted(level.cx[a:b], x0, side="left")
+            hi = a + np.searchsorted(level.cx[a:b], x1, side="right")
+            rows = np.arange(lo, hi)
+            found.append(rows[(level.cy[lo:hi] >= y0) & (level.cy[lo:hi] <= y1)])
+        rows = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+        if zoom > self.max_zoom:
+            positions = level.first[rows]
+            return MapView(
+                lats=self.arrays.lats[positions],
+                lons=self.arrays.lons[positions],
+                counts=np.ones(len(rows), dtype=np.int64),
+                positions=positions,
+            )
+
+        # Кластеры разных категорий в одной ячейке объединяются
+        keys = level.cx[rows].astype(np.int64) * grid + level.cy[rows]
+        cells, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=level.counts[rows], minlength=len(cells)).astype(np.int64)
+        lats = np.bincount(inverse, weights=level.lat_sums[rows], minlength=len(cells)) / np.maximum(counts, 1)
+        lons = np.bincount(inverse, weights=level.lon_sums[rows], minlength=len(cells)) / np.maximum(counts, 1)
+        first = np.full(len(cells), -1, dtype=np.int64)
+        first[inverse] = level.first[rows]
+        return MapView(lats=lats, lons=lons, counts=counts, positions=np.where(counts == 1, first, -1))
+
+
+def _bench(n_points: int, queries: int = 500):
+    rng = np.random.default_rng(0)
+    # Синтетический «многогородской» каталог: скопления точек вокруг случайных центров
+    centers = np.column_stack([rng.uniform(43, 60, 50), rng.uniform(30, 60, 50)])
+    which = rng.integers(0, len(centers), n_points)
+    lats = centers[which, 0] + rng.normal(0, 0.08, n_points)
+    lons = centers[which, 1] + rng.normal(0, 0.12, n_points)
+    arrays = CatalogArrays(
+        ids=np.arange(n_points),
+        lats=lats,
+        lons=lons,
+        category_ids=rng.integers(1, 11, n_points),
+        visit_times=np.full(n_points, 30.0),
+    )
+
+    started = time.perf_counter()
+    clusters = MarkerClusters(arrays)
+    print(f"[clusters] Точек: {n_points}, построение индекса: {time.perf_counter() - started:.1f} с")
+
+    for zoom in (6, 10, 13, 17):
+        timings, sizes = [], []
+        for _ in range(queries):
+            center = centers[rng.integers(0, len(centers))]
+            bounds = viewport_bounds((float(center[0]), float(center[1])), zoom, 400, 800)
+            started = time.perf_counter()
+            view = clusters.query(bounds, zoom, rng.choice(np.arange(1, 11), 3, replace=False))
+            timings.append(time.perf_counter() - started)
+            sizes.append(len(view))
+        ms = np.asarray(timings) * 1000
+        print(
+            f"[clusters] zoom {zoom}: p50 {np.percentile(ms, 50):.2f} мс, p95 {np.percentile(ms, 95):.2f} мс, "
+            f"маркеров в кадре: в среднем {np.mean(sizes):.0f}, максимум {np.max(sizes)}"
+        )
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
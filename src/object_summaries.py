@@ -0,0 +1,178 @@
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.config import LLM_WORKERS
+from src.constants import CATEGORIES
+from src.db.models import LocationSummary
+from src.db.repository import fetch_location_summaries, fetch_stale_summaries, put_location_summaries
+from src.db.session import SessionLocal, engine
+from src.llm_client import MODEL, CircuitOpenError, YandexGPTClient, yandex_gpt
+from src.llm_utils import build_route_prompt, popular_routes
+
+# Способ получения описания без нейросети — первое предложение полного описания
+EXTRACTIVE = "extractive"
+
+SUMMARY_MAX_CHARS = 160
+
+SUMMARY_SYSTEM_PROMPT = "Ты кратко пересказываешь описания достопримечательностей Нижнего Новгорода."
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+(?=[«\"(]?[А-ЯЁA-Z0-9])")
+# Грубая оценка числа токенов, если токенизатор API недоступен: слова и знаки
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def _clip(text: str, limit: int = SUMMARY_MAX_CHARS) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0].rstrip(",;:—-") + "…"
+
+
+def extractive_summary(title: Optional[str], description: Optional[str]) -> str:
+    """Первое предложение описания (не длиннее SUMMARY_MAX_CHARS) или название."""
+    description = " ".join(str(description or "").split())
+    if not description:
+        return str(title or "")
+    return _clip(_SENTENCE_END.split(description, 1)[0])
+
+
+def llm_summary(client: YandexGPTClient, title: Optional[str], description: Optional[str]) -> Optional[str]:
+    """Одно предложение о главном в объекте от нейросети; None без учетных данных."""
+    prompt = (
+        f"Сформулируй одно короткое предложение (не длиннее 20 слов) о самом главном "
+        f"в объекте «{title}». Без вступлений и оценок.\n\nОписание: {str(description or '')[:1500]}"
+    )
+    text = client.complete(prompt, temperature=0.2, max_tokens=80, system_prompt=SUMMARY_SYSTEM_PROMPT)
+    if not text or not text.strip():
+        return None
+    return _clip(text.strip().splitlines()[0])
+
+
+def build_summaries(use_llm: bool = True, limit: Optional[int] = None, batch_size: int = 100,
+                    client: Optional[YandexGPTClient] = None):
+    """
+    Пишет короткие описания объектов, у которых их нет или текст которых
+    изменился. Через нейросеть, если она доступна (тогда заменяются и описания,
+    полученные без нее), иначе — первое предложение описания. Если нейросеть
+    отказывает посреди работы, оставшиеся объекты получают извлеченные описания.
+    """
+    client = client or yandex_gpt
+    use_llm = use_llm and client.available()
+
+    LocationSummary.__table__.create(bind=engine, checkfirst=True)
+    with SessionLocal() as session:
+        rows = fetch_stale_summaries(session, upgrade_model=MODEL if use_llm else None, limit=limit)
+
+    def summarize(row: dict) -> dict:
+        summary, source = None, EXTRACTIVE
+        if use_llm and client.available():
+            try:
+                summary, source = llm_summary(client, row["title"], row["description"]), MODEL
+            except CircuitOpenError:
+                pass
+            except Exception as e:
+                print(f"[summaries] Ошибка Yandex GPT для «{row['title']}»: {e}")
+        if not summary:
+            summary, source = extractive_summary(row["title"], row["description"]), EXTRACTIVE
+        return {"id": row["id"], "description_hash": row["description_hash"], "summary": summary, "model": source}
+
+    started = time.perf_counter()
+    counts = {MODEL: 0, EXTRACTIVE: 0}
+    with ThreadPoolExecutor(max_workers=LLM_WORKERS if use_llm else 1) as pool:
+        for start in range(0, len(rows), batch_size):
+            results = list(pool.map(summarize, rows[start:start + batch_size]))
+            with SessionLocal() as session:
+                put_location_summaries(session, results)
+                session.commit()
+            for r in results:
+                counts[r["model"]] += 1
+
+    print(
+        f"[summaries] Объектов к обновлению: {len(rows)}, через {MODEL}: {counts[MODEL]}, "
+        f"первым предложением описания: {counts[EXTRACTIVE]}, время: {time.perf_counter() - started:.1f} с"
+    )
+
+
+def prompt_report(routes, summaries: Dict[str, str], client: Optional[YandexGPTClient] = None,
+                  latency_samples: int = 5):
+    """
+    Сравнивает промпты маршрутов с полными описаниями объектов и с короткими:
+    размер в символах и токенах, доля объектов с коротким описанием и, если
+    нейросеть доступна, время ответа на latency_samples маршрутах.
+    """
+    client = client or yandex_gpt
+    use_tokenizer = client.count_tokens("проверка") is not None
+
+    def tokens(prompt: str) -> int:
+        return client.count_tokens(prompt) if use_tokenizer else len(_TOKEN.findall(prompt))
+
+    full_chars, short_chars, full_tokens, short_tokens = [], [], [], []
+    covered = total = 0
+    pairs: List[tuple] = []
+    for query, points in routes:
+        if not points:
+            continue
+        args = (points, list(query.categories), query.total_time, CATEGORIES)
+        full = build_route_prompt(*args, summaries={})[0]
+        short = build_route_prompt(*args, summaries=summaries)[0]
+        full_chars.append(len(full))
+        short_chars.append(len(short))
+        full_tokens.append(tokens(full))
+        short_tokens.append(tokens(short))
+        total += len(points)
+        covered += sum(str(p["object"]["id"]) in summaries for p in points)
+        pairs.append((full, short))
+
+    if not pairs:
+        print("[summaries] Нет маршрутов для сравнения")
+        return
+    tokenizer = "токенизатор API" if use_tokenizer else "оценка по словам и знакам"
+    print(
+        f"[summaries] Маршрутов: {len(pairs)}, объектов с коротким описанием: {covered}/{total}; "
+        f"промпт: {np.mean(full_chars):.0f} -> {np.mean(short_chars):.0f} символов, "
+        f"{np.mean(full_tokens):.0f} -> {np.mean(short_tokens):.0f} токенов "
+        f"(-{(1 - np.sum(short_tokens) / np.sum(full_tokens)) * 100:.0f}%, {tokenizer})"
+    )
+
+    if not client.available():
+        print("[summaries] Yandex GPT недоступен — время ответа не измерялось")
+        return
+    full_s, short_s = [], []
+    for i, (full, short) in enumerate(pairs[:latency_samples]):
+        # Порядок чередуется, чтобы прогрев соединения не давал преимущества
+        order = [(full, full_s), (short, short_s)]
+        if i % 2:
+            order.reverse()
+        for prompt, sink in order:
+            started = time.perf_counter()
+            client.complete(prompt)
+            sink.append(time.perf_counter() - started)
+    print(
+        f"[summaries] Время ответа (медиана, {len(full_s)} маршрутов): "
+        f"{np.median(full_s):.2f} с -> {np.median(short_s):.2f} с"
+    )
+
+
+def report():
+    """Отчет по маршрутам от популярных точек с текущими описаниями из БД."""
+    with SessionLocal() as session:
+        summaries = fetch_location_summaries(session)
+    prompt_report(popular_routes(modes=("optimized",)), summaries)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        extractive_only = "--extractive" in sys.argv[2:]
+        numbers = [int(a) for a in sys.argv[2:] if a.isdigit()]
+        build_summaries(use_llm=not extractive_only, limit=numbers[0] if numbers else None)
+    elif command == "report":
+        report()
+    else:
+        print("Использование: python -m src.object_summaries [build [--extractive] [limit] | report]")
+        sys.exit(1)
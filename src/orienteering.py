@@ -0,0 +1,225 @@
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.constants import OPTIMIZER_POOL_SIZE, OPTIMIZER_TIME_LIMIT, OPTIMIZER_TIME_WEIGHT
+from src.route_model import Route
+from src.scoring import MAX_DISTANCE, MAX_STOPS, CatalogArrays, geodesic_distances, route_reach, walking_times
+
+# Сколько возмущений подряд без улучшения допускается до досрочной остановки
+_STALL_LIMIT = 200
+
+
+class _Problem:
+    """
+    Задача ориентирования для одного запроса: узел 0 — старт, узлы 1..P — объекты
+    из пула кандидатов. Матрицы расстояний и времени в пути считаются один раз.
+    """
+
+    def __init__(self, arrays: CatalogArrays, start, pool: np.ndarray, total_time: float, reach: float,
+                 time_weight: float = OPTIMIZER_TIME_WEIGHT):
+        self.pool = pool
+        self.total_time = total_time
+        lats = np.concatenate([[start[0]], arrays.lats[pool]])
+        lons = np.concatenate([[start[1]], arrays.lons[pool]])
+
+        self.distances = np.stack([geodesic_distances((la, lo), lats, lons) for la, lo in zip(lats, lons)])
+        self.travel = walking_times(self.distances)
+        self.visit = np.concatenate([[0.0], arrays.visit_times[pool]])
+        # Тот же score, что и в plan_route: category_match / (distance_km + 0.1)
+        self.scores = 1 / (self.distances / 1000 + 0.1)
+        # Доля бюджета, проведенная на осмотре объекта, а не в пути: без нее score
+        # поощряет короткие переходы, но не заполнение бюджета времени
+        self.visit_gain = time_weight * self.visit / total_time
+        self.allowed = self.distances <= reach
+
+    def evaluate(self, seq: List[int]) -> Optional[Tuple[float, float]]:
+        """(целевая функция, затраченное время) или None, если маршрут недопустим."""
+        score, spent, prev = 0.0, 0.0, 0
+        for node in seq:
+            if not self.allowed[prev, node]:
+                return None
+            score += self.scores[prev, node] + self.visit_gain[node]
+            spent += self.travel[prev, node] + self.visit[node]
+            prev = node
+        if spent > self.total_time:
+            return None
+        return score, spent
+
+
+def _better(a: Optional[Tuple[float, float]], b: Optional[Tuple[float, float]]) -> bool:
+    """Больше score, при равенстве — меньше времени."""
+    if a is None:
+        return False
+    if b is None:
+        return True
+    return a[0] > b[0] + 1e-9 or (abs(a[0] - b[0]) <= 1e-9 and a[1] < b[1])
+
+
+def _greedy(problem: _Problem, max_stops: int) -> List[int]:
+    seq: List[int] = []
+    while len(seq) < max_stops:
+        base = problem.evaluate(seq)[0]
+        best_node, best_gain = None, -1.0
+        for node in range(1, len(problem.visit)):
+            if node in seq:
+                continue
+            value = problem.evaluate(seq + [node])
+            if value is not None and value[0] - base > best_gain:
+                best_node, best_gain = node, value[0] - base
+        if best_node is None:
+            break
+        seq.append(best_node)
+    return seq
+
+
+def _neighbours(seq: List[int], n_nodes: int, max_stops: int):
+    """Соседние решения: вставка, замена объекта и 2-opt (разворот отрезка маршрута)."""
+    unused = [node for node in range(1, n_nodes) if node not in seq]
+    if len(seq) < max_stops:
+        for node in unused:
+            for pos in range(len(seq) + 1):
+                yield seq[:pos] + [node] + seq[pos:]
+    for pos in range(len(seq)):
+        for node in unused:
+            yield seq[:pos] + [node] + seq[pos + 1:]
+    for i in range(len(seq) - 1):
+        for j in range(i + 1, len(seq)):
+            yield seq[:i] + seq[i:j + 1][::-1] + seq[j + 1:]
+
+
+def _local_search(problem: _Problem, seq: List[int], max_stops: int, deadline: float) -> List[int]:
+    value = problem.evaluate(seq)
+    improved = True
+    while improved and time.thread_time() < deadline:
+        improved = False
+        for candidate in _neighbours(seq, len(problem.visit), max_stops):
+            candidate_value = problem.evaluate(candidate)
+            if _better(candidate_value, value):
+                seq, value, improved = candidate, candidate_value, True
+                break
+    return seq
+
+
+def optimize_route(
+    start_position,
+    user_categories,
+    total_time_minutes,
+    df,
+    search_radius,
+    index=None,
+    time_limit: float = OPTIMIZER_TIME_LIMIT,
+    pool_size: int = OPTIMIZER_POOL_SIZE,
+    max_stops: int = MAX_STOPS,
+    seed: Optional[int] = None,
+):
+    """
+    Маршрут как решение задачи ориентирования с бюджетом времени: максимизирует
+    суммарный score (та же формула, что в plan_route, считается для каждого перехода)
+    плюс OPTIMIZER_TIME_WEIGHT × долю total_time_minutes, занятую осмотром
+    объектов (CATEGORY_TIME), — так бюджет тратится на объекты, а не на дорогу.
+
+    Старт — детерминированный жадный маршрут, затем итерированный локальный поиск
+    (вставка, замена, 2-opt; возмущение — удаление случайных остановок), пока не
+    исчерпан time_limit секунд процессорного времени потока или улучшения не
+    прекратились. Лимит считается по time.thread_time: другие сессии и пулы
+    потоков процесса в него не входят.
+    Возвращает Route, как и plan_route.
+    """
+    arrays = index.arrays if index is not None else CatalogArrays.from_df(df)
+    reach = min(search_radius, MAX_DISTANCE)
+    area = route_reach(search_radius, total_time_minutes)
+
+    if index is not None:
+        pool, distances = index.query(start_position, area, user_categories)
+    else:
+        cats = np.fromiter(user_categories, dtype=np.int64)
+        pool = np.flatnonzero(np.isin(arrays.category_ids, cats))
+        distances = geodesic_distances(start_position, arrays.lats[pool], arrays.lons[pool])
+        pool, distances = pool[distances <= area], distances[distances <= area]
+    keep = ~np.isnan(arrays.visit_times[pool])
+    pool, distances = pool[keep], distances[keep]
+    pool = pool[np.argsort(distances, kind="stable")[:pool_size]]
+    if not len(pool):
+        return Route()
+
+    deadline = time.thread_time() + time_limit
+    rng = random.Random(seed)
+    problem = _Problem(arrays, start_position, pool, total_time_minutes, reach)
+
+    best = _local_search(problem, _greedy(problem, max_stops), max_stops, deadline)
+    best_value = problem.evaluate(best)
+    current, stall = best, 0
+    while time.thread_time() < deadline and current and stall < _STALL_LIMIT:
+        stall += 1
+        perturbed = list(current)
+        for _ in range(min(len(perturbed), rng.randint(1, 2))):
+            perturbed.pop(rng.randrange(len(perturbed)))
+        current = _local_search(problem, perturbed, max_stops, deadline)
+        value = problem.evaluate(current)
+        if _better(value, best_value):
+            best, best_value, stall = current, value, 0
+        elif rng.random() < 0.5:
+            current = best
+
+    positions = [int(pool[node - 1]) for node in best]
+    legs = list(zip([0] + best[:-1], best))
+    return Route(
+        ids=tuple(str(arrays.ids[pos]) for pos in positions),
+        positions=tuple(positions),
+        travel_times=tuple(float(problem.travel[a, b]) for a, b in legs),
+        visit_times=tuple(int(problem.visit[b]) for _, b in legs),
+        distances=tuple(float(problem.distances[a, b]) for a, b in legs),
+    )
+
+
+def route_score(route: Route) -> Tuple[float, float]:
+    """(суммарный score, затраченное время) готового маршрута."""
+    score = sum(1 / (distance / 1000 + 0.1) for distance in route.distances)
+    return score, route.total_time
+
+
+def _bench(starts: int):
+    # Импорт здесь, чтобы не было цикла routing -> orienteering -> routing
+    from src.data_loader import load_data, load_spatial_index
+    from src.routing import plan_route
+
+    df = load_data()
+    index = load_spatial_index()
+    rng = random.Random(0)
+    categories = list(np.unique(index.arrays.category_ids))
+
+    rows = []
+    for _ in range(starts):
+        anchor = rng.randrange(len(df))
+        start = (
+            index.arrays.lats[anchor] + rng.uniform(-0.01, 0.01),
+            index.arrays.lons[anchor] + rng.uniform(-0.015, 0.015),
+        )
+        cats = rng.sample(categories, 3)
+        budget = rng.choice([60, 120, 180, 240])
+        greedy = plan_route(start, cats, budget, df, 1500, index=index)
+        started = time.thread_time()
+        optimized = optimize_route(start, cats, budget, df, 1500, index=index, seed=0)
+        cpu = time.thread_time() - started
+        g_score, g_time = route_score(greedy)
+        o_score, o_time = route_score(optimized)
+        rows.append((
+            g_score, o_score, g_time / budget, o_time / budget,
+            sum(greedy.visit_times) / budget, sum(optimized.visit_times) / budget, cpu,
+        ))
+
+    data = np.asarray(rows)
+    print(f"[orienteering] стартов: {starts}")
+    print(f"  score: жадный {data[:, 0].mean():.2f}, оптимизатор {data[:, 1].mean():.2f}")
+    print(f"  использование времени: жадный {data[:, 2].mean():.0%}, оптимизатор {data[:, 3].mean():.0%}")
+    print(f"  из них на осмотр объектов: жадный {data[:, 4].mean():.0%}, оптимизатор {data[:, 5].mean():.0%}")
+    print(f"  оптимизатор не хуже жадного: {(data[:, 1] >= data[:, 0] - 1e-9).mean():.0%} запросов")
+    print(f"  CPU на запрос: p50 {np.percentile(data[:, 6], 50) * 1000:.0f} мс, макс {data[:, 6].max() * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
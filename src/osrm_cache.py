@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.config import OSRM_CACHE_MAX_ENTRIES, OSRM_CACHE_PRECISION, OSRM_CACHE_TTL_SECONDS
+from src.db.models import RouteGeometry
+from src.db.repository import evict_route_geometry, get_route_geometry, put_route_geometry
+from src.db.session import SessionLocal, engine
+
+Point = Tuple[float, float]
+
+
+class RouteGeometryCache:
+    """
+    Двухуровневый кэш геометрии отрезков OSRM.
+
+    Координаты концов округляются до precision знаков, так что близкие клики
+    попадают в одну запись. Первый уровень — LRU в памяти процесса, второй —
+    таблица route_geometry_cache в Postgres, общая для всех реплик. У записей есть
+    TTL, размер обоих уровней ограничен; пустые (неудачные) ответы не кэшируются.
+    Если БД недоступна, кэш временно работает только в памяти.
+    """
+
+    def __init__(
+        self,
+        precision: int = OSRM_CACHE_PRECISION,
+        ttl_seconds: float = OSRM_CACHE_TTL_SECONDS,
+        max_entries: int = OSRM_CACHE_MAX_ENTRIES,
+        memory_entries: int = 512,
+        evict_every: int = 200,
+        db_retry_seconds: float = 60.0,
+    ):
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.evict_every = evict_every
+        self.db_retry_seconds = db_retry_seconds
+
+        self._memory: "OrderedDict[str, Tuple[float, List[Point]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db_ready = False
+        self._db_disabled_until = 0.0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "db_errors": 0}
+
+    def snap(self, point: Point) -> Point:
+        return round(float(point[0]), self.precision), round(float(point[1]), self.precision)
+
+    def key(self, a: Point, b: Point) -> str:
+        a, b = self.snap(a), self.snap(b)
+        return f"{a[0]},{a[1]};{b[0]},{b[1]}"
+
+    def get(self, a: Point, b: Point) -> Optional[List[Point]]:
+        key = self.key(a, b)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+
+        raw = self._db_call(lambda s: get_route_geometry(s, key, self.ttl_seconds))
+        if raw:
+            coords = [tuple(p) for p in json.loads(raw)]
+            self._remember(key, coords, now)
+            with self._lock:
+                self._stats["db_hits"] += 1
+            return coords
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, a: Point, b: Point, coords: List[Point]):
+        if not coords:
+            return
+        key = self.key(a, b)
+        self._remember(key, coords, time.time())
+
+        with self._lock:
+            self._stats["stores"] += 1
+            self._puts += 1
+            need_evict = self._puts % self.evict_every == 0
+
+        payload = json.dumps([[lat, lon] for lat, lon in coords])
+
+        def store(session):
+            put_route_geometry(session, key, payload)
+            if need_evict:
+                evict_route_geometry(session, self.ttl_seconds, self.max_entries)
+            session.commit()
+
+        self._db_call(store)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key: str, coords: List[Point], stamp: float):
+        with self._lock:
+            self._memory[key] = (stamp, coords)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _db_call(self, fn):
+        if time.time() < self._db_disabled_until:
+            return None
+        try:
+            if not self._db_ready:
+                RouteGeometry.__table__.create(bind=engine, checkfirst=True)
+                self._db_ready = True
+            with SessionLocal() as session:
+                return fn(session)
+        except Exception as e:
+            with self._lock:
+                self._stats["db_errors"] += 1
+            self._db_disabled_until = time.time() + self.db_retry_seconds
+            print(f"OSRM cache DB unavailable: {e}")
+            return None
+
+
+# Глобальный экземпляр кэша для повторного использования
+route_geometry_cache = RouteGeometryCache()
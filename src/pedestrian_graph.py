@@ -0,0 +1,259 @@
+import heapq
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.constants import PEDESTRIAN_GRAPH_PATH
+from src.scoring import CatalogArrays
+from src.spatial_index import GridIndex
+
+Point = Tuple[float, float]
+
+# Точка дальше этого расстояния от ближайшего узла графа считается вне сети
+MAX_SNAP_DISTANCE = 300.0
+
+
+class PedestrianGraph:
+    """
+    Локальный пешеходный граф для маршрутизации без внешнего OSRM.
+
+    Граф неориентированный и хранится в формате CSR (indptr/adjacency/weights,
+    веса — длины рёбер в метрах). Для A* заранее посчитаны расстояния от
+    нескольких опорных узлов (landmarks, эвристика ALT): по неравенству
+    треугольника |d(L, t) - d(L, v)| — нижняя оценка d(v, t).
+
+    Граф готовится офлайн командой
+        python -m src.pedestrian_graph build nodes.csv edges.csv [graph.npz]
+    где nodes.csv — id, lat, lon, а edges.csv — u, v, length (метры).
+    """
+
+    def __init__(self, lats, lons, indptr, adjacency, weights, landmarks):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.adjacency = np.asarray(adjacency, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        # (число узлов × число опорных узлов), -1 — узел недостижим
+        self.landmarks = np.asarray(landmarks, dtype=np.float64)
+        self._index = GridIndex(CatalogArrays.from_points(self.lats, self.lons), cell_size=200.0)
+        # Для обходов в чистом Python списки заметно быстрее индексации NumPy
+        self._indptr = self.indptr.tolist()
+        self._adjacency = self.adjacency.tolist()
+        self._weights = self.weights.tolist()
+        self._landmarks = self.landmarks.tolist()
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def from_edge_list(cls, nodes: pd.DataFrame, edges: pd.DataFrame, n_landmarks: int = 8) -> "PedestrianGraph":
+        node_ids = nodes["id"].to_numpy()
+        position = pd.Series(np.arange(len(nodes)), index=node_ids)
+        u = position.reindex(edges["u"].to_numpy()).to_numpy()
+        v = position.reindex(edges["v"].to_numpy()).to_numpy()
+        length = pd.to_numeric(edges["length"], errors="coerce").to_numpy(dtype=np.float64)
+        valid = ~np.isnan(u) & ~np.isnan(v) & ~np.isnan(length)
+        u, v, length = u[valid].astype(np.int64), v[valid].astype(np.int64), length[valid]
+
+        # Пешеходные рёбра проходимы в обе стороны
+        src = np.concatenate([u, v])
+        dst = np.concatenate([v, u])
+        w = np.concatenate([length, length])
+        order = np.lexsort((dst, src))
+        src, dst, w = src[order], dst[order], w[order]
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.add.at(indptr, src + 1, 1)
+        indptr = np.cumsum(indptr)
+
+        graph = cls(
+            nodes["lat"].to_numpy(),
+            nodes["lon"].to_numpy(),
+            indptr,
+            dst,
+            w,
+            np.empty((len(nodes), 0)),
+        )
+        graph.landmarks = graph._select_landmarks(n_landmarks)
+        graph._landmarks = graph.landmarks.tolist()
+        return graph
+
+    @classmethod
+    def load(cls, path: str = PEDESTRIAN_GRAPH_PATH) -> "PedestrianGraph":
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def save(self, path: str = PEDESTRIAN_GRAPH_PATH):
+        np.savez(
+            path,
+            lats=self.lats,
+            lons=self.lons,
+            indptr=self.indptr,
+            adjacency=self.adjacency,
+            weights=self.weights,
+            landmarks=self.landmarks,
+        )
+
+    def snap(self, point: Point) -> Optional[Tuple[int, float]]:
+        """Ближайший узел графа и расстояние до него или None, если сеть дальше MAX_SNAP_DISTANCE."""
+        nodes, distances = self._index.query(point, MAX_SNAP_DISTANCE)
+        if not len(nodes):
+            return None
+        best = int(np.argmin(distances))
+        return int(nodes[best]), float(distances[best])
+
+    def dijkstra(self, source: int, max_distance: float = np.inf) -> Dict[int, float]:
+        """Кратчайшие расстояния от source до всех узлов не дальше max_distance."""
+        indptr, adjacency, weights = self._indptr, self._adjacency, self._weights
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        done = set()
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                nxt = adjacency[k]
+                nd = d + weights[k]
+                if nd <= max_distance and nd < dist.get(nxt, np.inf):
+                    dist[nxt] = nd
+                    heapq.heappush(heap, (nd, nxt))
+        return {node: dist[node] for node in done}
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, List[int]]]:
+        """A* с эвристикой ALT: (длина в метрах, список узлов) или None, если пути нет."""
+        landmarks = self._landmarks
+        target_lm = landmarks[target]
+
+        def heuristic(node: int) -> float:
+            best = 0.0
+            for t, v in zip(target_lm, landmarks[node]):
+                if t >= 0 and v >= 0 and abs(t - v) > best:
+                    best = abs(t - v)
+            return best
+
+        indptr, adjacency, weights = self._indptr, self._adjacency, self._weights
+        dist = {source: 0.0}
+        parent = {source: -1}
+        heap = [(heuristic(source), source)]
+        closed = set()
+        while heap:
+            _, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while parent[path[-1]] != -1:
+                    path.append(parent[path[-1]])
+                return dist[target], path[::-1]
+            if node in closed:
+                continue
+            closed.add(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                nxt = adjacency[k]
+                nd = dist[node] + weights[k]
+                if nd < dist.get(nxt, np.inf):
+                    dist[nxt] = nd
+                    parent[nxt] = node
+                    heapq.heappush(heap, (nd + heuristic(nxt), nxt))
+        return None
+
+    def route(self, a: Point, b: Point) -> Optional[Tuple[float, List[Point]]]:
+        """Пеший маршрут между точками: (длина в метрах, геометрия [(lat, lon), ...])."""
+        snapped_a, snapped_b = self.snap(a), self.snap(b)
+        if snapped_a is None or snapped_b is None:
+            return None
+        found = self.shortest_path(snapped_a[0], snapped_b[0])
+        if found is None:
+            return None
+        length, nodes = found
+        coords = [tuple(a)] + [(self.lats[n], self.lons[n]) for n in nodes] + [tuple(b)]
+        return snapped_a[1] + length + snapped_b[1], coords
+
+    def _select_landmarks(self, count: int) -> np.ndarray:
+        """Опорные узлы выбираются «самыми дальними»: каждый следующий — дальше всех от уже выбранных."""
+        columns = []
+        coverage = np.zeros(len(self))
+        node = 0
+        for _ in range(min(count, len(self))):
+            reached = self.dijkstra(node)
+            column = np.full(len(self), -1.0)
+            column[list(reached.keys())] = list(reached.values())
+            columns.append(column)
+            coverage += np.where(column >= 0, column, 0)
+            node = int(np.argmax(coverage))
+        return np.stack(columns, axis=1) if columns else np.empty((len(self), 0))
+
+
+class GraphLegs:
+    """
+    Сетевые расстояния для plan_route вместо геодезических. Объекты каталога
+    привязываются к узлам графа по мере надобности (результат запоминается),
+    а каждый шаг маршрута — это одна ограниченная Dijkstra от текущей точки.
+    """
+
+    def __init__(self, graph: PedestrianGraph, arrays: CatalogArrays):
+        self.graph = graph
+        self.arrays = arrays
+        self._snapped: Dict[int, Optional[Tuple[int, float]]] = {}
+
+    def distances(self, position: Point, subset: np.ndarray, max_distance: float) -> Optional[np.ndarray]:
+        """
+        Расстояния от position до объектов subset по сети; inf — если объект
+        недостижим в пределах max_distance. None — если position вне сети.
+        """
+        origin = self.graph.snap(position)
+        if origin is None:
+            return None
+        reached = self.graph.dijkstra(origin[0], max_distance)
+
+        result = np.full(len(subset), np.inf)
+        for i, pos in enumerate(subset):
+            target = self._snap(int(pos))
+            if target is not None and target[0] in reached:
+                result[i] = origin[1] + reached[target[0]] + target[1]
+        return result
+
+    def _snap(self, pos: int) -> Optional[Tuple[int, float]]:
+        if pos not in self._snapped:
+            point = (self.arrays.lats[pos], self.arrays.lons[pos])
+            self._snapped[pos] = None if np.isnan(point).any() else self.graph.snap(point)
+        return self._snapped[pos]
+
+
+def _bench(path: str, queries: int = 200):
+    started = time.perf_counter()
+    graph = PedestrianGraph.load(path)
+    load_time = time.perf_counter() - started
+    print(f"[graph] Узлов: {len(graph)}, рёбер: {len(graph.adjacency) // 2}, загрузка: {load_time:.2f} с")
+
+    rng = np.random.default_rng(0)
+    pairs = rng.integers(0, len(graph), size=(queries, 2))
+    timings = {"a*": [], "dijkstra 2 км": []}
+    for s, t in pairs:
+        started = time.perf_counter()
+        graph.shortest_path(int(s), int(t))
+        timings["a*"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        graph.dijkstra(int(s), 2000)
+        timings["dijkstra 2 км"].append(time.perf_counter() - started)
+
+    for name, values in timings.items():
+        ms = np.asarray(values) * 1000
+        print(f"[graph] {name}: p50 {np.percentile(ms, 50):.1f} мс, p95 {np.percentile(ms, 95):.1f} мс")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if command == "build" and len(sys.argv) > 3:
+        out = sys.argv[4] if len(sys.argv) > 4 else PEDESTRIAN_GRAPH_PATH
+        started = time.perf_counter()
+        built = PedestrianGraph.from_edge_list(pd.read_csv(sys.argv[2]), pd.read_csv(sys.argv[3]))
+        built.save(out)
+        print(f"[graph] Граф сохранён в {out}: {len(built)} узлов, {time.perf_counter() - started:.1f} с")
+    elif command == "bench":
+        _bench(sys.argv[2] if len(sys.argv) > 2 else PEDESTRIAN_GRAPH_PATH)
+    else:
+        print("Использование: python -m src.pedestrian_graph build nodes.csv edges.csv [graph.npz] | bench [graph.npz]")
+        sys.exit(1)
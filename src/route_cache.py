@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
+
+from src.constants import (
+    ROUTE_CACHE_FILL_SECONDS,
+    ROUTE_CACHE_MAX_KEYS,
+    ROUTE_CACHE_POOL_SIZE,
+    ROUTE_CACHE_PRECISION,
+)
+from src.route_model import Route
+
+
+class _RoutePool:
+    """Различные маршруты одного ключа, число вызовов планировщика и их суммарное время."""
+
+    __slots__ = ("routes", "attempts", "spent")
+
+    def __init__(self):
+        self.routes: List[Route] = []
+        self.attempts = 0
+        self.spent = 0.0
+
+
+class RouteCache:
+    """
+    Кэш построенных маршрутов с LRU-вытеснением.
+
+    Ключ — квантованная точка старта (precision знаков после запятой), отсортированный
+    набор категорий, время, радиус, режим и версия данных. Для каждого ключа хранится
+    небольшой пул различных маршрутов, который заполняется постепенно: каждый из
+    первых pool_size запросов по ключу вызывает планировщик один раз и получает
+    новый маршрут, дальше отдаётся случайный маршрут из пула. Так случайность
+    plan_route сохраняется, а ни один клик не строит маршрут больше одного раза.
+
+    Цена заполнения — до pool_size построений на ключ, и первые клики по новому
+    ключу не быстрее планировщика. Поэтому заполнение ограничено и по времени:
+    когда построения по ключу заняли в сумме fill_seconds, пул больше не растёт.
+    Для детерминированного планировщика (режим optimized) нужен pool_size=1.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = ROUTE_CACHE_MAX_KEYS,
+        pool_size: int = ROUTE_CACHE_POOL_SIZE,
+        precision: int = ROUTE_CACHE_PRECISION,
+        fill_seconds: float = ROUTE_CACHE_FILL_SECONDS,
+    ):
+        self.max_keys = max_keys
+        self.pool_size = pool_size
+        self.precision = precision
+        self.fill_seconds = fill_seconds
+        self._pools: "OrderedDict[Hashable, _RoutePool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.hits = 0
+        self.misses = 0
+
+    def key(
+        self,
+        start: Tuple[float, float],
+        categories: Iterable[int],
+        total_time: int,
+        search_radius: int,
+        mode: str = "greedy",
+        data_version: Optional[Hashable] = None,
+    ) -> Tuple:
+        return (
+            round(float(start[0]), self.precision),
+            round(float(start[1]), self.precision),
+            tuple(sorted(set(int(c) for c in categories))),
+            int(total_time),
+            int(search_radius),
+            mode,
+            data_version,
+        )
+
+    def get_or_plan(self, key: Hashable, planner: Callable[[], Route], pool_size: Optional[int] = None) -> Route:
+        """
+        Маршрут для key. Пока по ключу было меньше pool_size (по умолчанию
+        self.pool_size) вызовов планировщика и они заняли меньше fill_seconds,
+        вызывает его один раз и добавляет новый маршрут в пул; потом — случайный
+        маршрут из пула без построения.
+        """
+        size = self.pool_size if pool_size is None else max(1, pool_size)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                if pool.routes and (pool.attempts >= size or pool.spent >= self.fill_seconds):
+                    self.hits += 1
+                    return self._rng.choice(pool.routes)
+                pool.attempts += 1
+            self.misses += 1
+
+        started = time.perf_counter()
+        route = planner()
+        spent = time.perf_counter() - started
+        with self._lock:
+            if pool is not None:
+                pool.spent += spent
+            if not route:
+                # Планировщик ничего не нашёл — отдаём то, что уже есть в пуле
+                return self._rng.choice(pool.routes) if pool is not None and pool.routes else Route()
+            if pool is None:
+                pool = self._pools.setdefault(key, _RoutePool())
+                pool.attempts += 1
+                pool.spent += spent
+            self._pools.move_to_end(key)
+            if all(existing.ids != route.ids for existing in pool.routes):
+                pool.routes.append(route)
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+        return route
+
+    def invalidate(self, data_version: Optional[Hashable] = None):
+        """Сбрасывает весь кэш или только записи, построенные не для data_version."""
+        with self._lock:
+            if data_version is None:
+                self._pools.clear()
+                return
+            for key in [k for k in self._pools if k[-1] != data_version]:
+                del self._pools[key]
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+
+# Глобальный экземпляр, общий для всех сессий процесса Streamlit
+route_cache = RouteCache()
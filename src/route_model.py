@@ -0,0 +1,75 @@
+from dataclasses import asdict, dataclass
+from typing import List, Tuple
+
+import pandas as pd
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    """
+    Компактный маршрут: только id объектов и числа по каждому переходу, без строк
+    DataFrame. Такой объект дёшево хранить в st.session_state каждой сессии, в кэше
+    маршрутов и передавать между процессами; строки каталога подставляются по
+    требованию методом resolve.
+
+    positions — номера строк DataFrame, по которому маршрут строился; это лишь
+    подсказка для быстрого resolve, источником истины остаются ids.
+    """
+
+    ids: Tuple[str, ...] = ()
+    positions: Tuple[int, ...] = ()
+    travel_times: Tuple[float, ...] = ()
+    visit_times: Tuple[int, ...] = ()
+    distances: Tuple[float, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def total_distance(self) -> float:
+        return sum(self.distances)
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.travel_times) + sum(self.visit_times)
+
+    def resolve(self, df: pd.DataFrame) -> List[dict]:
+        """
+        Маршрут в виде списка остановок {"object": строка df, "travel_time",
+        "visit_time", "distance"}. Объекты, которых в df больше нет, пропускаются.
+        """
+        n = len(df)
+        ids = df["id"]
+        rows = []
+        lookup = None
+        for k, obj_id in enumerate(self.ids):
+            pos = self.positions[k] if k < len(self.positions) else -1
+            if not 0 <= pos < n or str(ids.iat[pos]) != obj_id:
+                if lookup is None:
+                    keys = ids.astype(str)
+                    lookup = pd.Series(range(n), index=keys.to_numpy())[~keys.duplicated().to_numpy()]
+                found = lookup.get(obj_id)
+                if found is None:
+                    continue
+                pos = int(found)
+            rows.append({
+                "object": df.iloc[pos],
+                "travel_time": self.travel_times[k],
+                "visit_time": self.visit_times[k],
+                "distance": self.distances[k],
+            })
+        return rows
+
+    def to_dict(self) -> dict:
+        """Сериализуемое в JSON представление (списки чисел и строк)."""
+        return {name: list(values) for name, values in asdict(self).items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Route":
+        return cls(
+            ids=tuple(str(i) for i in data.get("ids", ())),
+            positions=tuple(int(p) for p in data.get("positions", ())),
+            travel_times=tuple(float(t) for t in data.get("travel_times", ())),
+            visit_times=tuple(int(t) for t in data.get("visit_times", ())),
+            distances=tuple(float(d) for d in data.get("distances", ())),
+        )
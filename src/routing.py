@@ -1,9 +1,16 @@
+import numpy as np
 import pandas as pd
 import random
 from geopy.distance import geodesic
 
 from src.constants import CATEGORY_TIME
+from src.leg_matrix import CatalogLegs
 from src.logger import log_user_action
+from src.orienteering import optimize_route
+from src.pedestrian_graph import GraphLegs
+from src.route_model import Route
+from src.scoring import MAX_DISTANCE, MAX_STOPS, CatalogArrays, score_candidates
+from src.tracing import span
 
 
 def calculate_distance(coord1, coord2):
@@ -35,65 +42,145 @@ def calculate_score(object_data, user_categories, current_position, search_radiu
     return score, distance, visit_time
 
 
-def plan_route(start_position, user_categories, total_time_minutes, df, search_radius, top_k=3):
+def _candidate_distances(arrays, position, pos, user_categories, reach, index, legs, graph_legs):
+    """
+    Позиции объектов-кандидатов и расстояния до них от текущей точки маршрута.
+    Источники по приоритету: строка матрицы переходов (если стоим на объекте
+    каталога), пространственный индекс; пешеходный граф заменяет расстояния
+    сетевыми. (None, None) — геодезические расстояния по всему каталогу.
+    """
+    subset = distances = None
+    if legs is not None and pos is not None:
+        subset, distances = legs.neighbours(pos)
+    elif index is not None:
+        subset, distances = index.query(position, reach, user_categories)
+
+    if graph_legs is not None:
+        if subset is None:
+            subset = np.flatnonzero(np.isin(arrays.category_ids, list(user_categories)))
+        network = graph_legs.distances(position, subset, reach)
+        if network is not None:
+            return subset, network
+        if distances is None:
+            return None, None
+    return subset, distances
+
+
+def plan_route(
+    start_position,
+    user_categories,
+    total_time_minutes,
+    df,
+    search_radius,
+    top_k=3,
+    index=None,
+    leg_matrix=None,
+    router=None,
+    mode="greedy",
+):
     log_user_action(
         "build_route",
         start=start_position,
         radius=search_radius,
         total_time=total_time_minutes,
+        mode=mode,
     )
 
-    rng = random.Random()
+    with span("plan_route", mode=mode, total_time=total_time_minutes, radius=search_radius) as s:
+        if mode == "optimized":
+            route = optimize_route(start_position, user_categories, total_time_minutes, df, search_radius, index=index)
+        else:
+            route = build_greedy_route(
+                start_position,
+                user_categories,
+                total_time_minutes,
+                df,
+                search_radius,
+                top_k=top_k,
+                index=index,
+                leg_matrix=leg_matrix,
+                router=router,
+            )
+        s.set(stops=len(route) if route else 0)
+    return route
+
+
+def build_greedy_route(
+    start_position,
+    user_categories,
+    total_time_minutes,
+    df,
+    search_radius,
+    top_k=3,
+    index=None,
+    leg_matrix=None,
+    router=None,
+    rng=None,
+):
+    """
+    Рандомизированный жадный маршрут (ядро plan_route без логирования): на каждом
+    шаге случайно выбирается один из top_k кандидатов с наибольшим score.
+    rng — источник случайности (по умолчанию новый random.Random()).
+    Возвращает Route; строки объектов — route.resolve(df).
+    """
+    if index is not None and len(index) != len(df):
+        raise ValueError("Пространственный индекс построен не по этому DataFrame")
+
+    rng = rng if rng is not None else random.Random()
+    arrays = index.arrays if index is not None else CatalogArrays.from_df(df)
+    reach = min(search_radius, MAX_DISTANCE)
+    legs = None
+    if leg_matrix is not None and leg_matrix.radius >= reach:
+        # CatalogLegs, привязанная к этому каталогу заранее, используется как есть
+        legs = leg_matrix.for_arrays(arrays) if isinstance(leg_matrix, CatalogLegs) else leg_matrix.aligned(arrays)
+    graph_legs = GraphLegs(router, arrays) if router is not None else None
 
     current_position = start_position
+    current_pos = None
     remaining_time = total_time_minutes
-    route = []
-    visited_ids = set()
-
-    while remaining_time > 20 and len(route) < 5:
-        candidates = []
-
-        for _, obj in df.iterrows():
-            if obj["id"] in visited_ids:
-                continue
-
-            score, distance, visit_time = calculate_score(obj, user_categories, current_position, search_radius)
-            if score == 0:
-                continue
-            travel_time = calculate_walking_time(distance)
-
-            if travel_time + visit_time <= remaining_time:
-                candidates.append({
-                    "object": obj,
-                    "score": score,
-                    "distance": distance,
-                    "visit_time": visit_time,
-                    "travel_time": travel_time,
-                })
-
-        if not candidates:
+    positions, travel_times, visit_times, leg_distances = [], [], [], []
+    visited = np.zeros(len(arrays), dtype=bool)
+
+    while remaining_time > 20 and len(positions) < MAX_STOPS:
+        subset, distances = _candidate_distances(
+            arrays, current_position, current_pos, user_categories, reach, index, legs, graph_legs
+        )
+        candidates = score_candidates(
+            arrays,
+            current_position,
+            user_categories,
+            search_radius,
+            remaining_time=remaining_time,
+            exclude=visited,
+            subset=subset,
+            distances=distances,
+        )
+        if not len(candidates):
             break
 
-        candidates.sort(key=lambda x: x["score"], reverse=True)
-        pool = candidates[: max(1, top_k)]
-
-        chosen = rng.choice(pool)
-
-        route.append({
-            "object": chosen["object"],
-            "travel_time": chosen["travel_time"],
-            "visit_time": chosen["visit_time"],
-            "distance": chosen["distance"],
-        })
-
-        visited_ids.add(chosen["object"]["id"])
-        current_position = (chosen["object"]["lat"], chosen["object"]["lon"])
-        remaining_time -= chosen["travel_time"] + chosen["visit_time"]
-
-    return route
+        pick = rng.randrange(min(max(1, top_k), len(candidates)))
+        pos = int(candidates.indices[pick])
+        positions.append(pos)
+        travel_times.append(float(candidates.travel_times[pick]))
+        visit_times.append(int(candidates.visit_times[pick]))
+        leg_distances.append(float(candidates.distances[pick]))
+
+        visited[arrays.ids == arrays.ids[pos]] = True
+        current_position = (arrays.lats[pos], arrays.lons[pos])
+        current_pos = pos
+        remaining_time -= float(candidates.travel_times[pick] + candidates.visit_times[pick])
+
+    return Route(
+        ids=tuple(str(arrays.ids[pos]) for pos in positions),
+        positions=tuple(positions),
+        travel_times=tuple(travel_times),
+        visit_times=tuple(visit_times),
+        distances=tuple(leg_distances),
+    )
 
 
 def generate_route_description(route):
+    """route — список остановок, как возвращает Route.resolve."""
     if not route:
         return "Маршрут не построен. Попробуйте изменить параметры."
 
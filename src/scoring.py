@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.constants import CATEGORY_TIME
+
+# Эллипсоид WGS-84 — тот же, что по умолчанию использует geopy.geodesic
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+WALKING_SPEED_MS = 5 * 1000 / 3600
+MAX_DISTANCE = 2000
+MAX_STOPS = 5
+
+
+@dataclass(frozen=True)
+class CatalogArrays:
+    """
+    Колонки каталога в виде NumPy-массивов.
+    Порядок элементов совпадает с порядком строк исходного DataFrame.
+    """
+
+    ids: np.ndarray
+    lats: np.ndarray
+    lons: np.ndarray
+    category_ids: np.ndarray
+    visit_times: np.ndarray
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "CatalogArrays":
+        lats = pd.to_numeric(df["lat"], errors="coerce").to_numpy(dtype=np.float64)
+        lons = pd.to_numeric(df["lon"], errors="coerce").to_numpy(dtype=np.float64)
+        cats = pd.to_numeric(df["category_id"], errors="coerce")
+        visit_times = cats.map(CATEGORY_TIME).to_numpy(dtype=np.float64)
+        return cls(
+            ids=df["id"].to_numpy(),
+            lats=lats,
+            lons=lons,
+            category_ids=cats.fillna(-1).to_numpy(dtype=np.int64),
+            visit_times=visit_times,
+        )
+
+    @classmethod
+    def from_points(cls, lats, lons) -> "CatalogArrays":
+        """Массивы для произвольного набора точек без категорий (например, узлов графа)."""
+        lats = np.asarray(lats, dtype=np.float64)
+        return cls(
+            ids=np.arange(len(lats)),
+            lats=lats,
+            lons=np.asarray(lons, dtype=np.float64),
+            category_ids=np.full(len(lats), -1, dtype=np.int64),
+            visit_times=np.full(len(lats), np.nan),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+@dataclass(frozen=True)
+class CandidateScores:
+    """Кандидаты одного шага маршрута, отсортированные по убыванию score."""
+
+    indices: np.ndarray
+    scores: np.ndarray
+    distances: np.ndarray
+    visit_times: np.ndarray
+    travel_times: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+
+def geodesic_distances(position, lats, lons) -> np.ndarray:
+    """
+    Расстояния в метрах от точки position=(lat, lon) до массива точек.
+
+    Приближение малых расстояний на эллипсоиде WGS-84: разности координат
+    масштабируются радиусами кривизны меридиана и первого вертикала на средней
+    широте. На отрезках до 5 км относительное расхождение с geopy.geodesic
+    не превышает 1e-6 (меньше миллиметра на километр).
+    """
+    lat0 = np.radians(position[0])
+    lon0 = np.radians(position[1])
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+
+    mid = (lats + lat0) / 2
+    sin_mid = np.sin(mid)
+    w = np.sqrt(1 - WGS84_E2 * sin_mid * sin_mid)
+    meridian = WGS84_A * (1 - WGS84_E2) / (w * w * w)
+    prime_vertical = WGS84_A / w
+
+    dy = meridian * (lats - lat0)
+    dx = prime_vertical * np.cos(mid) * (lons - lon0)
+    return np.hypot(dx, dy)
+
+
+def walking_times(distances) -> np.ndarray:
+    """Векторный аналог routing.calculate_walking_time (целые минуты + 1)."""
+    minutes = np.asarray(distances, dtype=np.float64) / WALKING_SPEED_MS / 60
+    return np.floor(minutes) + 1
+
+
+def route_reach(search_radius: float, total_time_minutes: float) -> float:
+    """
+    Максимальное удаление (м) от старта, на которое может уйти маршрут plan_route:
+    не больше MAX_STOPS переходов по min(search_radius, MAX_DISTANCE) и не дальше,
+    чем можно пройти пешком за всё время прогулки.
+    """
+    by_legs = MAX_STOPS * min(search_radius, MAX_DISTANCE)
+    by_time = WALKING_SPEED_MS * total_time_minutes * 60
+    return min(by_legs, by_time)
+
+
+def score_candidates(
+    arrays: CatalogArrays,
+    position,
+    user_categories: Iterable[int],
+    search_radius: float,
+    remaining_time: Optional[float] = None,
+    max_distance: float = MAX_DISTANCE,
+    exclude: Optional[np.ndarray] = None,
+    subset: Optional[np.ndarray] = None,
+    distances: Optional[np.ndarray] = None,
+) -> CandidateScores:
+    """
+    Считает score, расстояние, время в пути и время осмотра для всех объектов
+    каталога за один проход. Условия отбора совпадают с routing.calculate_score:
+    объект должен иметь координаты, подходящую категорию и лежать не дальше
+    min(search_radius, max_distance); при заданном remaining_time дополнительно
+    travel_time + visit_time <= remaining_time.
+
+    subset — позиции объектов, среди которых ищем (по умолчанию весь каталог),
+    exclude — булева маска уже посещённых объектов по всему каталогу,
+    distances — заранее посчитанные расстояния для subset (иначе геодезические).
+
+    Результат отсортирован по убыванию score; при равенстве сохраняется порядок
+    каталога, как у устойчивой сортировки в plan_route.
+    """
+    idx = np.arange(len(arrays)) if subset is None else np.asarray(subset, dtype=np.int64)
+
+    if distances is None:
+        distances = geodesic_distances(position, arrays.lats[idx], arrays.lons[idx])
+    else:
+        distances = np.asarray(distances, dtype=np.float64)
+
+    cats = np.fromiter(user_categories, dtype=np.int64)
+    visit = arrays.visit_times[idx]
+    mask = np.isin(arrays.category_ids[idx], cats) & ~np.isnan(visit)
+    mask &= distances <= min(search_radius, max_distance)
+    if exclude is not None:
+        mask &= ~exclude[idx]
+
+    idx, distances, visit = idx[mask], distances[mask], visit[mask]
+    travel = walking_times(distances)
+    if remaining_time is not None:
+        fits = travel + visit <= remaining_time
+        idx, distances, visit, travel = idx[fits], distances[fits], visit[fits], travel[fits]
+
+    scores = 1 / (distances / 1000 + 0.1)
+    order = np.argsort(-scores, kind="stable")
+    return CandidateScores(
+        indices=idx[order],
+        scores=scores[order],
+        distances=distances[order],
+        visit_times=visit[order],
+        travel_times=travel[order],
+    )
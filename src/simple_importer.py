@@ -1,87 +1,44 @@
+import csv
+import hashlib
+import io
+import itertools
 import os
 import sys
-import uuid
-import re
-from typing import Optional, Tuple
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Iterator, Optional, Tuple
 
 import pandas as pd
 from sqlalchemy import text
 from dotenv import load_dotenv
 
+from src.catalog_store import build_from_db as build_catalog_store
+from src.coordinates import describe_malformed, malformed_rows, parse_lat_lon
 from src.db.session import SessionLocal, engine
-from src.db.models import Base, Location
+from src.db.models import Base
+from src.db.repository import bump_dataset_version
+from src.import_readers import read_chunks
+from src.tile_server import tile_cache
 
 load_dotenv()
 
 def _norm(s: Optional[str]) -> str:
     return "" if s is None else " ".join(str(s).strip().lower().split())
 
-def _pick_sheet(file_path: str, sheet_name: Optional[str | int]) -> str | int:
-    """
-    Возвращает корректный идентификатор листа для pd.read_excel:
-      1) Явно переданный sheet_name
-      2) Лист 'cultural_sites_202509191434', если есть
-      3) Первый лист в книге
-    """
-    if sheet_name is not None:
-        return sheet_name
-
-    xls = pd.ExcelFile(file_path)
-    preferred = "cultural_sites_202509191434"
-    if preferred in xls.sheet_names:
-        return preferred
-    return xls.sheet_names[0]
-
-
-def _parse_lat_lon_from_string(coord_str: str) -> Tuple[float | None, float | None]:
-    """
-    Полная копия логики из рабочего Excel-лоадера:
-
-    matches = re.findall(r"[-+]?\d*\.\d+|\d+", str(coord_str))
-    if len(matches) >= 2:
-        return float(matches[1]), float(matches[0])  # lat, lon
-    return None, None
-
-    Т.е. строка содержит два числа, первое — lon, второе — lat.
-    Мы возвращаем (lat, lon).
-    """
-    if coord_str is None:
-        return None, None
-    matches = re.findall(r"[-+]?\d*\.\d+|\d+", str(coord_str))
-    if len(matches) >= 2:
-        try:
-            lon = float(matches[0])
-            lat = float(matches[1])
-            return lat, lon
-        except Exception:
-            return None, None
-    return None, None
-
-
-def _parse_lat_lon(row: dict) -> Tuple[float | None, float | None]:
-    """
-    Унифицированный парсер:
-    - сначала пробуем явные 'lat'/'lon'
-    - затем строковые поля 'coordinate'/'coordinates'/'coords' согласно логике из Excel-лоадера
-    """
-    lat = row.get("lat")
-    lon = row.get("lon")
-    if pd.notna(lat) and pd.notna(lon):
-        try:
-            return float(lat), float(lon)
-        except Exception:
-            pass
-
-    coord_str = row.get("coordinate") or row.get("coordinates") or row.get("coords")
-    if coord_str is not None and not (isinstance(coord_str, float) and pd.isna(coord_str)):
-        return _parse_lat_lon_from_string(coord_str)
-
-    return None, None
-
-
 def create_schema_if_not_exists():
-    """Создает таблицы, если они еще не созданы."""
+    """Создает таблицы, если они еще не созданы, и добавляет новые колонки в старые."""
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+            ALTER TABLE locations
+                ADD COLUMN IF NOT EXISTS source_key varchar(32),
+                ADD COLUMN IF NOT EXISTS row_hash varchar(32)
+            """
+            )
+        )
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_locations_source_key ON locations (source_key)"))
 
 
 def create_indexes(session):
@@ -95,6 +52,15 @@ def create_indexes(session):
         """
         )
     )
+    session.execute(
+        text(
+            """
+        CREATE INDEX IF NOT EXISTS idx_locations_coordinate_geog
+        ON locations
+        USING GIST ((coordinate::geography))
+        """
+        )
+    )
     session.execute(
         text(
             """
@@ -118,10 +84,211 @@ def create_indexes(session):
         )
 
 
+# Выражения уникального ключа uq_locations_title_addr_xy6 в виде, который принимает
+# ON CONFLICT (каждое выражение в скобках)
+_LOCATION_KEY = """
+    (lower(coalesce(title,''))),
+    (lower(coalesce(address,''))),
+    (round(CAST(ST_Y(coordinate) AS numeric), 6)),
+    (round(CAST(ST_X(coordinate) AS numeric), 6))
+"""
+
+_STAGING_COLUMNS = (
+    "n", "source_key", "row_hash", "title", "description", "category_id", "address", "url", "lat", "lon"
+)
+
+# Сколько строк отправлять одной командой COPY
+COPY_CHUNK_ROWS = 50_000
+
+
+def _key_coordinate(value: float) -> str:
+    """
+    round(CAST(value AS numeric), 6) из uq_locations_title_addr_xy6: PostgreSQL
+    переводит double в numeric по 15 значащим цифрам и округляет половину от нуля.
+    """
+    return str(Decimal(f"{value:.15g}").quantize(Decimal("0.000001"), rounding=ROUND_HALF_UP))
+
+
+def _row_hashes(title: str, description, category_id: int, address: str, url, lat: float, lon: float):
+    """
+    (source_key, row_hash) нормализованной строки источника. source_key строится из
+    тех же выражений, что и uq_locations_title_addr_xy6 (lower без схлопывания
+    пробелов, координаты с округлением до 6 знаков), поэтому разные строки БД
+    никогда не получают один ключ. row_hash — вся строка, по нему видно, что объект
+    изменился; title и address входят в него как есть, чтобы правка регистра или
+    пробелов (ключ при этом тот же) тоже считалась изменением.
+    """
+    key = "\x1f".join(((title or "").lower(), (address or "").lower(), _key_coordinate(lat), _key_coordinate(lon)))
+    row = "\x1f".join((key, title or "", address or "", _norm(description), str(category_id), _norm(url)))
+    return (
+        hashlib.blake2b(key.encode(), digest_size=16).hexdigest(),
+        hashlib.blake2b(row.encode(), digest_size=16).hexdigest(),
+    )
+
+
+def _source_chunks(file_path: str, sheet_name: str | int | None) -> Iterator[pd.DataFrame]:
+    """Источник кусками по CHUNK_ROWS строк (src.import_readers) с проверкой обязательных колонок."""
+    print(f"[import] читаем {file_path}" + (f", лист: {sheet_name}" if sheet_name is not None else ""))
+    for i, chunk in enumerate(read_chunks(file_path, sheet_name=sheet_name)):
+        if i == 0:
+            for col in ("title", "category_id"):
+                if col not in chunk.columns:
+                    print(f"В источнике не найден обязательный столбец: {col}")
+                    sys.exit(1)
+        yield chunk
+
+
+def _normalized_rows(chunks: Iterable[pd.DataFrame], stats: dict) -> Iterator[tuple]:
+    """
+    Строки источника в порядке колонок staging-таблицы. Проверки те же, что были
+    у построчного импорта: category_id — целое, непустой title, координаты
+    разбираются; не прошедшие строки считаются в stats["skipped"]. Координаты
+    разбираются сразу для всего куска (src.coordinates), строки без них
+    перечисляются одним отчётом на кусок.
+    """
+    n = -1
+    for chunk in chunks:
+        coords = parse_lat_lon(chunk)
+        malformed = malformed_rows(chunk, coords)
+        if len(malformed):
+            print(f"[import] {describe_malformed(chunk, malformed)}")
+        for rowd, lat, lon in zip(chunk.to_dict("records"), coords["lat"].tolist(), coords["lon"].tolist()):
+            n += 1
+            row = _normalized_row(n, rowd, lat, lon)
+            if row is None:
+                stats["skipped"] += 1
+            else:
+                yield row
+
+
+def _normalized_row(n: int, rowd: dict, lat: float, lon: float) -> Optional[tuple]:
+    try:
+        category_id = int(rowd.get("category_id"))
+    except Exception:
+        return None
+
+    title = str(rowd.get("title", "")).strip()
+    if not title:
+        return None
+
+    if pd.isna(lat) or pd.isna(lon):
+        return None
+
+    description = None if pd.isna(rowd.get("description")) else str(rowd.get("description"))
+    address = None if pd.isna(rowd.get("address")) else str(rowd.get("address"))
+    url = None if pd.isna(rowd.get("url")) else str(rowd.get("url"))
+    address = address or ""
+    source_key, row_hash = _row_hashes(title, description, category_id, address, url, lat, lon)
+    return n, source_key, row_hash, title, description, category_id, address, url, lat, lon
+
+
+def _copy_rows(cursor, rows: Iterable[tuple], table: str, columns: Tuple[str, ...]) -> int:
+    """Отправляет строки в table через COPY ... FROM STDIN пачками по COPY_CHUNK_ROWS."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    while True:
+        chunk = list(itertools.islice(rows, COPY_CHUNK_ROWS))
+        if not chunk:
+            return total
+        buf = io.StringIO()
+        # QUOTE_STRINGS: строки (и пустая "") в кавычках, None — пустое поле без
+        # кавычек, которое COPY в формате csv читает как NULL
+        csv.writer(buf, quoting=csv.QUOTE_STRINGS).writerows(chunk)
+        buf.seek(0)
+        cursor.copy_expert(sql, buf)
+        total += len(chunk)
+
+
+def _create_staging(session):
+    session.execute(
+        text(
+            """
+        CREATE TEMP TABLE locations_staging (
+            n integer,
+            source_key varchar(32),
+            row_hash varchar(32),
+            title text,
+            description text,
+            category_id integer,
+            address text,
+            url text,
+            lat double precision,
+            lon double precision
+        ) ON COMMIT DROP
+        """
+        )
+    )
+
+
+def _stage_rows(session, rows: Iterable[tuple]) -> int:
+    cursor = session.connection().connection.cursor()
+    try:
+        return _copy_rows(cursor, iter(rows), "locations_staging", _STAGING_COLUMNS)
+    finally:
+        cursor.close()
+
+
+def _merge_staging(session) -> Tuple[int, int]:
+    """
+    Сливает locations_staging в locations одним INSERT ... ON CONFLICT по ключу
+    uq_locations_title_addr_xy6. Возвращает (добавлено, обновлено); строки с тем
+    же row_hash не трогаются.
+    """
+    # Дубликаты ключа внутри источника схлопываются (побеждает последняя строка):
+    # иначе ON CONFLICT DO UPDATE попытается изменить одну строку дважды
+    inserted, updated = session.execute(
+        text(
+            f"""
+        WITH merged AS (
+            INSERT INTO locations (id, title, description, category_id, address, url, coordinate, source_key, row_hash)
+            SELECT gen_random_uuid(), title, description, category_id, address, url,
+                   ST_SetSRID(ST_MakePoint(lon, lat), 4326), source_key, row_hash
+            FROM (
+                SELECT DISTINCT ON (
+                    lower(title), lower(address), round(CAST(lat AS numeric), 6), round(CAST(lon AS numeric), 6)
+                ) *
+                FROM locations_staging
+                ORDER BY lower(title), lower(address), round(CAST(lat AS numeric), 6),
+                         round(CAST(lon AS numeric), 6), n DESC
+            ) AS deduped
+            ON CONFLICT ({_LOCATION_KEY}) DO UPDATE
+            SET title = EXCLUDED.title,
+                address = EXCLUDED.address,
+                description = EXCLUDED.description,
+                category_id = EXCLUDED.category_id,
+                url = EXCLUDED.url,
+                source_key = EXCLUDED.source_key,
+                row_hash = EXCLUDED.row_hash
+            WHERE locations.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM merged
+        """
+        )
+    ).one()
+    return int(inserted), int(updated)
+
+
+def _finish_import(changed: bool):
+    """После коммита: хранилище каталога и кэш тайлов должны соответствовать новой версии."""
+    if changed:
+        tile_cache.clear()
+    build_catalog_store()
+
+
 def import_from_excel(file_path: str, sheet_name: str | int | None = None):
     """
-    Импортирует данные из Excel в таблицу locations.
+    Импортирует данные из файла в таблицу locations. Форматы — Excel, CSV, GeoJSON,
+    Parquet (src.import_readers); файл читается потоком кусками по CHUNK_ROWS строк.
     Ожидаемые поля: title, description, category_id, address, url, coordinate (или lat/lon).
+
+    Строки проходят проверку, потоком уходят через COPY во временную staging-таблицу
+    и одним INSERT ... ON CONFLICT по ключу uq_locations_title_addr_xy6 сливаются
+    в locations: новые объекты добавляются, у существующих обновляются описание,
+    категория и ссылка. Всё выполняется в одной транзакции, поэтому импорт можно
+    запускать повторно на заполненной таблице. Объекты, которых нет в источнике,
+    остаются — удаляет их только import_delta.
     """
     if not os.path.exists(file_path):
         print(f"Файл {file_path} не найден")
@@ -129,105 +296,108 @@ def import_from_excel(file_path: str, sheet_name: str | int | None = None):
 
     create_schema_if_not_exists()
 
-    sheet_to_use = _pick_sheet(file_path, sheet_name)
-    print(f"[import] читаем Excel: {file_path}, лист: {sheet_to_use}")
-    df = pd.read_excel(file_path, sheet_name=sheet_to_use)
+    started = time.perf_counter()
+    stats = {"skipped": 0}
+    version = None
+    with SessionLocal() as session:
+        # ON CONFLICT опирается на уникальный индекс — он должен существовать до слияния
+        create_indexes(session)
+        _create_staging(session)
+        staged = _stage_rows(session, _normalized_rows(_source_chunks(file_path, sheet_name), stats))
+        inserted, updated = _merge_staging(session)
+        if inserted or updated:
+            version = bump_dataset_version(session)
+        session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Импорт завершен. Строк: {staged}, добавлено: {inserted}, обновлено: {updated}, "
+        f"без изменений: {staged - inserted - updated}, пропущено: {stats['skipped']}; "
+        f"{elapsed:.2f} с ({staged / max(elapsed, 1e-9):.0f} строк/с)"
+        + (f", версия данных: {version}" if version is not None else "")
+    )
+    _finish_import(version is not None)
 
-    df.columns = [str(c).strip().lower() for c in df.columns]
 
-    required = ["title", "category_id"]
-    for col in required:
-        if col not in df.columns:
-            print(f"В Excel не найден обязательный столбец: {col}")
-            sys.exit(1)
+def import_delta(file_path: str, sheet_name: str | int | None = None):
+    """
+    Инкрементальный импорт: источник считается полным снимком каталога.
+    Для каждой строки считаются source_key и row_hash (_row_hashes) и сверяются с
+    сохранёнными в locations. В БД уходят только новые и изменившиеся строки (тем же
+    слиянием, что и в import_from_excel), а объекты, ключей которых в источнике больше
+    нет, удаляются. Если что-то изменилось, версия набора данных (dataset_version)
+    увеличивается — по ней приложение сбрасывает кэши каталога.
+
+    Объекты, импортированные до появления хэшей, сопоставляются по ключу
+    uq_locations_title_addr_xy6 и получают хэши при первом инкрементальном импорте.
+    """
+    if not os.path.exists(file_path):
+        print(f"Файл {file_path} не найден")
+        sys.exit(1)
 
-    inserted, skipped, with_geom = 0, 0, 0
+    create_schema_if_not_exists()
 
+    started = time.perf_counter()
+    stats = {"skipped": 0}
+    version = None
     with SessionLocal() as session:
-        has_any = session.execute(text("SELECT 1 FROM locations LIMIT 1")).first() is not None
-        if has_any:
-            print("[import] В таблице уже есть данные — импорт пропущен (одноразовая загрузка).")
-            return
-
-        sheet_to_use = _pick_sheet(file_path, sheet_name)
-        print(f"[import] читаем Excel: {file_path}, лист: {sheet_to_use}")
-        df = pd.read_excel(file_path, sheet_name=sheet_to_use)
-
-        df.columns = [str(c).strip().lower() for c in df.columns]
-
-        required = ["title", "category_id"]
-
-        for col in required:
-            if col not in df.columns:
-                print(f"В Excel не найден обязательный столбец: {col}")
-                sys.exit(1)
-
-        inserted, skipped, with_geom = 0, 0, 0
-        for _, row in df.iterrows():
-            rowd = row.to_dict()
-
-
-            try:
-                category_id = int(rowd.get("category_id"))
-            except Exception:
-                skipped += 1
-                continue
-
-            title = str(rowd.get("title", "")).strip()
-            if not title:
-                skipped += 1
-                continue
-
-            description = None if pd.isna(rowd.get("description")) else str(rowd.get("description"))
-            address = None if pd.isna(rowd.get("address")) else str(rowd.get("address"))
-            url = None if pd.isna(rowd.get("url")) else str(rowd.get("url"))
-
-            lat, lon = _parse_lat_lon(rowd)
-            if lat is None or lon is None:
-                skipped += 1
-                continue
-
-            loc = Location(
-                id=uuid.uuid4(),
-                title=title,
-                description=description,
-                category_id=category_id,
-                address=address or "",
-                url=url,
-            )
-            session.add(loc)
-            session.flush()
-
-            wkt_point = f"POINT({lon} {lat})"
-            session.execute(
-                text(
-                    """
-                    UPDATE locations
-                    SET coordinate = ST_GeomFromText(:wkt, 4326)
-                    WHERE id = :id
-                    """
-                ),
-                {"wkt": wkt_point, "id": loc.id},
-            )
-            with_geom += 1
-            inserted += 1
-
         create_indexes(session)
+        stored = dict(
+            session.execute(text("SELECT source_key, row_hash FROM locations WHERE source_key IS NOT NULL")).all()
+        )
+
+        # Источник читается потоком: в памяти только множество ключей, в staging
+        # уходят лишь новые и изменившиеся строки
+        source_keys = set()
+
+        def changed_rows():
+            for row in _normalized_rows(_source_chunks(file_path, sheet_name), stats):
+                source_keys.add(row[1])
+                if stored.get(row[1]) != row[2]:
+                    yield row
 
+        _create_staging(session)
+        changed = _stage_rows(session, changed_rows())
+        inserted, updated = _merge_staging(session)
+        removed = [(key,) for key in stored.keys() - source_keys]
+
+        session.execute(text("CREATE TEMP TABLE locations_removed (source_key varchar(32)) ON COMMIT DROP"))
+        cursor = session.connection().connection.cursor()
+        try:
+            _copy_rows(cursor, iter(removed), "locations_removed", ("source_key",))
+        finally:
+            cursor.close()
+        # Старые строки без хэшей, не совпавшие ни с одной строкой источника, тоже удаляются
+        deleted = session.execute(
+            text(
+                """
+            DELETE FROM locations
+            WHERE source_key IS NULL
+               OR source_key IN (SELECT source_key FROM locations_removed)
+            """
+            )
+        ).rowcount
+
+        if inserted or updated or deleted:
+            version = bump_dataset_version(session)
         session.commit()
 
-    print(f"Импорт завершен. Добавлено: {inserted}, с геометрией: {with_geom}, пропущено: {skipped}")
+    elapsed = time.perf_counter() - started
+    print(
+        f"Инкрементальный импорт завершен. Строк: {len(source_keys)}, добавлено: {inserted}, обновлено: {updated}, "
+        f"удалено: {deleted}, без изменений: {len(source_keys) - changed}, пропущено: {stats['skipped']}; "
+        f"{elapsed:.2f} с ({len(source_keys) / max(elapsed, 1e-9):.0f} строк/с)"
+        + (f", версия данных: {version}" if version is not None else ", изменений нет")
+    )
+    _finish_import(version is not None)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 2:
-        path = sys.argv[1]
-        sheet = sys.argv[2]
-    elif len(sys.argv) > 1:
-        path = sys.argv[1]
-        sheet = None
-    else:
-        path = "data_/cultural_objects_mnn.xlsx"
-        sheet = None
+    args = [a for a in sys.argv[1:] if a != "--delta"]
+    path = args[0] if args else "data_/cultural_objects_mnn.xlsx"
+    sheet = args[1] if len(args) > 1 else None
 
-    import_from_excel(path, sheet_name=sheet)
+    if "--delta" in sys.argv[1:]:
+        import_delta(path, sheet_name=sheet)
+    else:
+        import_from_excel(path, sheet_name=sheet)
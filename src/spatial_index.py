@@ -0,0 +1,94 @@
+import math
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.scoring import CatalogArrays, geodesic_distances
+
+# Нижние оценки длины градуса, чтобы рамка запроса гарантированно покрывала круг
+_MIN_M_PER_DEG_LAT = 110_574.0
+_M_PER_DEG_LON_EQUATOR = 111_320.0
+
+
+class GridIndex:
+    """
+    Пространственный индекс каталога — равномерная сетка в градусах.
+
+    Ячейки имеют размер примерно cell_size × cell_size метров на средней широте
+    каталога. Точки отсортированы по ключу ячейки, поэтому запрос по радиусу
+    просматривает только столбцы сетки внутри ограничивающей рамки (двоичный поиск
+    по каждому столбцу) и уточняет расстояния лишь для найденных точек.
+
+    Позиции, которые возвращает индекс, — это номера строк DataFrame, из которого
+    построены arrays.
+    """
+
+    def __init__(self, arrays: CatalogArrays, cell_size: float = 500.0):
+        self.arrays = arrays
+        self.cell_size = float(cell_size)
+
+        valid = np.flatnonzero(~np.isnan(arrays.lats) & ~np.isnan(arrays.lons))
+        lats, lons = arrays.lats[valid], arrays.lons[valid]
+
+        ref_lat = float(lats.mean()) if len(valid) else 0.0
+        self._lat_step = self.cell_size / _MIN_M_PER_DEG_LAT
+        self._lon_step = self.cell_size / (_M_PER_DEG_LON_EQUATOR * max(math.cos(math.radians(ref_lat)), 0.01))
+        self._lat0 = float(lats.min()) if len(valid) else 0.0
+        self._lon0 = float(lons.min()) if len(valid) else 0.0
+
+        cx = np.floor((lons - self._lon0) / self._lon_step).astype(np.int64)
+        cy = np.floor((lats - self._lat0) / self._lat_step).astype(np.int64)
+        self._nx = int(cx.max()) + 1 if len(valid) else 0
+        self._ny = int(cy.max()) + 1 if len(valid) else 0
+
+        keys = cx * self._ny + cy
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._positions = valid[order]
+
+    def __len__(self) -> int:
+        return len(self.arrays)
+
+    def query(
+        self,
+        position: Tuple[float, float],
+        radius: float,
+        categories: Optional[Iterable[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Объекты не дальше radius метров от position=(lat, lon), при необходимости
+        только из заданных категорий.
+
+        Возвращает (positions, distances): позиции отсортированы по возрастанию,
+        т.е. в порядке строк каталога.
+        """
+        lat, lon = float(position[0]), float(position[1])
+        if not len(self._keys) or radius < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        dlat = radius / _MIN_M_PER_DEG_LAT
+        cos_edge = math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+        dlon = radius / (_M_PER_DEG_LON_EQUATOR * cos_edge) * 1.01
+
+        x0 = max(int(math.floor((lon - dlon - self._lon0) / self._lon_step)), 0)
+        x1 = min(int(math.floor((lon + dlon - self._lon0) / self._lon_step)), self._nx - 1)
+        y0 = max(int(math.floor((lat - dlat - self._lat0) / self._lat_step)), 0)
+        y1 = min(int(math.floor((lat + dlat - self._lat0) / self._lat_step)), self._ny - 1)
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        columns = np.arange(x0, x1 + 1, dtype=np.int64) * self._ny
+        lo = np.searchsorted(self._keys, columns + y0, side="left")
+        hi = np.searchsorted(self._keys, columns + y1, side="right")
+        found = [self._positions[a:b] for a, b in zip(lo, hi) if b > a]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        positions = np.sort(np.concatenate(found))
+        if categories is not None:
+            cats = np.fromiter(categories, dtype=np.int64)
+            positions = positions[np.isin(self.arrays.category_ids[positions], cats)]
+
+        distances = geodesic_distances((lat, lon), self.arrays.lats[positions], self.arrays.lons[positions])
+        inside = distances <= radius
+        return positions[inside], distances[inside]
@@ -0,0 +1,141 @@
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src.config import TILE_CACHE_TTL_SECONDS, TILE_SERVER_PORT
+from src.constants import TILE_CACHE_DIR, TILE_MAX_ZOOM
+from src.db.repository import fetch_locations_mvt
+from src.db.session import SessionLocal
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+_TILE_PATH = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+def parse_categories(raw: Optional[str]) -> Tuple[int, ...]:
+    """"1,2,7" -> (1, 2, 7); пусто — все категории. Некорректные значения отбрасываются."""
+    if not raw:
+        return ()
+    return tuple(sorted({int(part) for part in raw.split(",") if part.strip().isdigit()}))
+
+
+class TileCache:
+    """
+    Дисковый кэш векторных тайлов: {root}/{категории}/{z}/{x}/{y}.pbf.
+    Запись атомарная (временный файл + os.replace), поэтому несколько процессов
+    сервера могут делить один каталог. Пустые тайлы тоже кэшируются (файл нулевой
+    длины). Запись старше ttl_seconds считается промахом и перезаписывается.
+    """
+
+    def __init__(self, root: str = TILE_CACHE_DIR, ttl_seconds: float = TILE_CACHE_TTL_SECONDS):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+
+    def path(self, z: int, x: int, y: int, categories: Iterable[int] = ()) -> str:
+        cats = "-".join(str(c) for c in categories) or "all"
+        return os.path.join(self.root, cats, str(z), str(x), f"{y}.pbf")
+
+    def get(self, z: int, x: int, y: int, categories: Iterable[int] = ()) -> Optional[bytes]:
+        path = self.path(z, x, y, categories)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl_seconds:
+                with open(path, "rb") as f:
+                    return f.read()
+        except OSError:
+            pass
+        return None
+
+    def put(self, z: int, x: int, y: int, categories: Iterable[int], data: bytes):
+        path = self.path(z, x, y, categories)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+tile_cache = TileCache()
+
+
+def get_tile(z: int, x: int, y: int, categories: Iterable[int] = ()) -> bytes:
+    """Тайл из дискового кэша или из PostGIS (ST_AsMVT) с сохранением в кэш."""
+    categories = tuple(categories)
+    data = tile_cache.get(z, x, y, categories)
+    if data is None:
+        with SessionLocal() as s:
+            data = fetch_locations_mvt(s, z, x, y, categories=categories or None)
+        tile_cache.put(z, x, y, categories, data)
+    return data
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """GET /tiles/{z}/{x}/{y}.pbf?categories=1,2,7 — слой "locations" в формате MVT."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/tiles/health":
+            return self._send(200, b"ok", "text/plain")
+
+        match = _TILE_PATH.match(url.path)
+        if not match:
+            return self._send(404, b"not found", "text/plain")
+        z, x, y = (int(v) for v in match.groups())
+        if z > TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return self._send(400, b"bad tile", "text/plain")
+
+        categories = parse_categories(parse_qs(url.query).get("categories", [""])[0])
+        try:
+            data = get_tile(z, x, y, categories)
+        except Exception as e:
+            print(f"[tiles] Ошибка тайла {z}/{x}/{y}: {e}")
+            return self._send(503, b"tile unavailable", "text/plain")
+
+        if not data:
+            return self._send(204, b"", MVT_CONTENT_TYPE)
+        return self._send(200, data, MVT_CONTENT_TYPE)
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if status in (200, 204):
+            self.send_header("Cache-Control", f"public, max-age={int(TILE_CACHE_TTL_SECONDS)}")
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Каждый тайл не логируем — карта запрашивает их десятками
+        pass
+
+
+def serve(port: int = TILE_SERVER_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), TileHandler)
+    server.daemon_threads = True
+    print(f"[tiles] Сервер векторных тайлов: http://0.0.0.0:{port}/tiles/{{z}}/{{x}}/{{y}}.pbf, кэш: {tile_cache.root}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if command == "serve":
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else TILE_SERVER_PORT)
+    elif command == "clear":
+        tile_cache.clear()
+        print(f"[tiles] Кэш тайлов очищен: {tile_cache.root}")
+    else:
+        print("Использование: python -m src.tile_server [serve [port] | clear]")
+        sys.exit(1)
@@ -0,0 +1,291 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from src.config import METRICS_HOST, METRICS_PORT, TRACE_LOG_PATH
+
+# Границы корзин гистограммы длительностей (с), как у клиентов Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Исключения Streamlit, которыми он прерывает скрипт (st.rerun, новый запуск) — не ошибки
+_CONTROL_FLOW = {"RerunException", "StopException"}
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+_log = logging.getLogger("src.tracing")
+_log.propagate = False
+if TRACE_LOG_PATH:
+    _handler = logging.FileHandler(TRACE_LOG_PATH, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(_handler)
+    _log.setLevel(logging.INFO)
+
+
+class Span:
+    """Один замер: имя, длительность, связь с родителем и атрибуты."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "started")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+        self.span_id = f"{random.getrandbits(32):08x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.started = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class SpanMetrics:
+    """
+    Длительности спанов по именам: гистограмма с накопительными корзинами BUCKETS
+    (как histogram в Prometheus) и скользящее окно последних значений для p50,
+    p95 и p99.
+    """
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._recent: Dict[str, deque] = {}
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = [0] * (len(BUCKETS) + 1)
+                self._sums[name] = 0.0
+                self._errors[name] = 0
+                self._recent[name] = deque(maxlen=self.window)
+            counts = self._buckets[name]
+            counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self._sums[name] += seconds
+            self._errors[name] += int(error)
+            self._recent[name].append(seconds)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """По каждому спану: count, sum, errors, корзины и квантили (с)."""
+        with self._lock:
+            data = {
+                name: (list(self._buckets[name]), self._sums[name], self._errors[name], np.array(self._recent[name]))
+                for name in self._buckets
+            }
+        result = {}
+        for name, (counts, total, errors, recent) in data.items():
+            result[name] = {
+                "count": sum(counts),
+                "sum": total,
+                "errors": errors,
+                "buckets": list(zip(BUCKETS + (float("inf"),), np.cumsum(counts).tolist())),
+                "quantiles": dict(zip(QUANTILES, np.quantile(recent, QUANTILES).tolist())),
+            }
+        return result
+
+
+metrics = SpanMetrics()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    Замеряет блок кода. Вложенные спаны (в том числе в потоках, запущенных через
+    in_current_trace) получают trace_id внешнего: один перезапуск скрипта — одна
+    трасса. Результат пишется строкой JSON в TRACE_LOG_PATH и в metrics.
+    """
+    current = Span(name, _current.get(), attrs)
+    token = _current.set(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        if type(e).__name__ not in _CONTROL_FLOW:
+            status = "error"
+            current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current, status)
+
+
+def traced(name: str) -> Callable:
+    """Декоратор: весь вызов функции — спан name."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def in_current_trace(fn: Callable) -> Callable:
+    """fn, который выполнится в контексте текущей трассы — для передачи в пул потоков."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _finish(current: Span, status: str):
+    seconds = time.perf_counter() - current.started
+    metrics.observe(current.name, seconds, error=status == "error")
+    if _log.handlers:
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "trace_id": current.trace_id,
+            "span_id": current.span_id,
+            "parent_id": current.parent_id,
+            "name": current.name,
+            "duration_ms": round(seconds * 1000, 3),
+            "status": status,
+            **current.attrs,
+        }
+        _log.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(extra_gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """
+    Метрики в текстовом формате Prometheus: гистограмма span_duration_seconds,
+    квантили span_duration_quantile_seconds, счетчик span_errors_total и
+    дополнительные показатели extra_gauges ({метрика: {метка source: значение}}).
+    """
+    lines = [
+        "# HELP span_duration_seconds Длительность спанов трассировки",
+        "# TYPE span_duration_seconds histogram",
+    ]
+    snapshot = metrics.snapshot()
+    for name, data in sorted(snapshot.items()):
+        span_label = f'span="{_label(name)}"'
+        for bound, count in data["buckets"]:
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'span_duration_seconds_bucket{{{span_label},le="{le}"}} {count}')
+        lines.append(f"span_duration_seconds_sum{{{span_label}}} {data['sum']:.6f}")
+        lines.append(f"span_duration_seconds_count{{{span_label}}} {data['count']}")
+
+    lines += [
+        "# HELP span_duration_quantile_seconds Квантили длительности по последним спанам",
+        "# TYPE span_duration_quantile_seconds gauge",
+    ]
+    for name, data in sorted(snapshot.items()):
+        for q, value in data["quantiles"].items():
+            lines.append(f'span_duration_quantile_seconds{{span="{_label(name)}",quantile="{q}"}} {value:.6f}')
+
+    lines += ["# HELP span_errors_total Спаны, завершившиеся исключением", "# TYPE span_errors_total counter"]
+    for name, data in sorted(snapshot.items()):
+        lines.append(f'span_errors_total{{span="{_label(name)}"}} {data["errors"]}')
+
+    for metric, values in sorted((extra_gauges or {}).items()):
+        lines.append(f"# TYPE {metric} gauge")
+        for source, value in sorted(values.items()):
+            lines.append(f'{metric}{{source="{_label(source)}"}} {float(value):.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def _service_gauges() -> Dict[str, Dict[str, float]]:
+    """Счетчики клиентов и кэшей приложения: Yandex GPT, геометрия OSRM, объяснения."""
+    from src.explanation_cache import explanation_cache
+    from src.llm_client import yandex_gpt
+    from src.osrm_cache import route_geometry_cache
+
+    gauges: Dict[str, Dict[str, float]] = {}
+    sources = {"yandex_gpt": yandex_gpt.stats(), "osrm_cache": route_geometry_cache.stats(),
+               "explanation_cache": explanation_cache.stats()}
+    for source, stats in sources.items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                gauges.setdefault(f"app_{key}", {})[source] = value
+    gauges["app_circuit_open"] = {"yandex_gpt": float(sources["yandex_gpt"]["circuit"] == "open")}
+    return gauges
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text(_service_gauges()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[int]:
+    """
+    Запускает в фоне HTTP-сервер с /metrics для Prometheus на host:port (один на
+    процесс; повторные вызовы ничего не делают). port=0 — не запускать.
+    Возвращает порт или None, если сервер не запущен.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"[tracing] Сервер метрик на {host}:{port} не запущен: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return _server.server_port
+
+
+def _bench(n: int = 100_000):
+    """Накладные расходы одного спана (без записи в файл и с ней)."""
+    handlers = list(_log.handlers)
+    for label, keep in (("без журнала", False), (f"с журналом {TRACE_LOG_PATH}", True)):
+        _log.handlers = handlers if keep else []
+        started = time.perf_counter()
+        for _ in range(n):
+            with span("bench"):
+                pass
+        print(f"[tracing] Спан {label}: {(time.perf_counter() - started) / n * 1e6:.1f} мкс")
+    _log.handlers = handlers
+    print(prometheus_text().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if command == "bench":
+        _bench()
+    elif command == "serve":
+        port = start_metrics_server(int(sys.argv[2]) if len(sys.argv) > 2 else METRICS_PORT or 9108)
+        print(f"[tracing] /metrics на порту {port}")
+        threading.Event().wait()
+    else:
+        print("Использование: python -m src.tracing [serve [port] | bench]")
+        sys.exit(1)
@@ -0,0 +1,94 @@
+"""
+Объяснение маршрута через локальную заглушку Yandex GPT: время до первого текста
+при синхронном и потоковом запросе, повтор из кэша объяснений и время до
+резервного описания при деградации API.
+
+    python -m tests.bench_llm [repeats]
+"""
+
+import os
+import sys
+import time
+
+from src.llm_client import YandexGPTClient
+from src.llm_utils import build_route_prompt, start_route_explanation
+from tests.stubs import YandexGptStub
+
+
+def _median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def bench_streaming(repeats: int = 5):
+    """Время до первого текста в чате: синхронный запрос против потокового."""
+    os.environ.setdefault("YANDEXGPT_API_KEY", "bench")
+    os.environ.setdefault("YANDEXGPT_FOLDER_ID", "bench")
+
+    def bench_route(run):
+        # Свои id на каждый прогон, чтобы не попадать в кэш объяснений
+        return [{
+            "object": {"id": f"bench-{run}-{i}", "title": f"Объект {i}",
+                       "description": "Описание объекта. " * 20, "category_id": 1},
+            "travel_time": 5.0, "visit_time": 15, "distance": 400.0,
+        } for i in range(6)]
+
+    with YandexGptStub() as stub:
+        client = YandexGPTClient(url=stub.completion_url)
+        sync_ms, first_ms, full_ms, cached_ms = [], [], [], []
+        for run in range(repeats):
+            route = bench_route(run)
+            prompt = build_route_prompt(route, [1], 120, {1: "Памятники"})[0]
+            started = time.perf_counter()
+            client.generate_explanation(prompt)
+            sync_ms.append((time.perf_counter() - started) * 1000)
+
+            job = start_route_explanation(route, [1], 120, {1: "Памятники"}, (56.32, 44.0), client=client)
+            while job.first_chunk_at is None and not job.done:
+                time.sleep(0.001)
+            first_ms.append(((job.first_chunk_at or time.perf_counter()) - job.started_at) * 1000)
+            job.wait()
+            full_ms.append((time.perf_counter() - job.started_at) * 1000)
+
+            # Тот же маршрут ещё раз — ответ из кэша объяснений
+            job = start_route_explanation(route, [1], 120, {1: "Памятники"}, (56.32, 44.0), client=client)
+            job.wait()
+            cached_ms.append((time.perf_counter() - job.started_at) * 1000)
+
+    print(
+        f"[llm] Заглушка: {stub.chunks} фрагментов по {stub.delay * 1000:.0f} мс; "
+        f"синхронный запрос: текст через {_median(sync_ms):.0f} мс; "
+        f"потоковый: первый фрагмент через {_median(first_ms):.0f} мс, весь текст через {_median(full_ms):.0f} мс; "
+        f"повторный маршрут из кэша: {_median(cached_ms):.1f} мс (медианы)"
+    )
+
+
+def bench_degraded(requests_count: int = 8):
+    """
+    Время до резервного описания при деградации API: заглушка отвечает 503 или
+    не отвечает дольше таймаута чтения. Первые запросы проходят повторы, после
+    LLM_BREAKER_FAILURES неудач предохранитель отдает резервное описание сразу.
+    """
+    for label, status, hang in (("503", 503, 0.0), ("зависание", 200, 1.0)):
+        with YandexGptStub(status=status, hang=hang) as stub:
+            client = YandexGPTClient(url=stub.completion_url, read_timeout=0.3, backoff_seconds=0.1)
+            timings = []
+            for run in range(requests_count):
+                route = [{
+                    "object": {"id": f"degraded-{label}-{run}", "title": "Объект", "description": "Описание",
+                               "category_id": 1},
+                    "travel_time": 5.0, "visit_time": 15, "distance": 400.0,
+                }]
+                job = start_route_explanation(route, [1], 60, {1: "Памятники"}, (56.32, 44.0), client=client)
+                job.wait()
+                timings.append((time.perf_counter() - job.started_at) * 1000)
+        stats = client.stats()
+        print(
+            f"[llm] API {label}: до резервного описания " + ", ".join(f"{t:.0f}" for t in timings) + " мс; "
+            f"запросов: {stats['requests']}, повторов: {stats['retries']}, ошибок: {stats['failures']}, "
+            f"отказов предохранителя: {stats['short_circuits']}, состояние: {stats['circuit']}"
+        )
+
+
+if __name__ == "__main__":
+    bench_streaming(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    bench_degraded()
@@ -0,0 +1,84 @@
+"""
+Построение карты на перезапуске скрипта: прежние маркеры folium.Marker против
+кэшируемого слоя create_base_map, вместе с рендером скрипта карты, как в st_folium.
+
+    python -m tests.bench_map_layer [reruns]
+"""
+
+import sys
+import time
+
+import folium
+import numpy as np
+from streamlit_folium import _get_map_string
+
+from src.constants import CATEGORIES as categories
+from src.constants import CATEGORY_COLORS as category_colors
+from src.data_loader import load_data, load_data_version, load_spatial_index
+from src.map_utils import create_base_map, create_route_layer
+
+
+def _marker_map(df, index, selected_categories, center, markers_radius):
+    """Прежний способ для сравнения: каждый объект — отдельный folium.Marker."""
+    positions, _ = index.query(center, markers_radius, selected_categories or None)
+    m = folium.Map(location=list(center), zoom_start=14, attribution_control=False)
+    for _, row in df.iloc[positions].iterrows():
+        category_name = categories.get(row["category_id"], "Другое")
+        popup_html = f"""
+        <div style="width: 250px;">
+            <h4>{row["title"]}</h4>
+            <p><b>Категория:</b> {category_name}</p>
+            <p><b>Описание:</b> {str(row["description"])[:150]}...</p>
+        </div>
+        """
+        folium.Marker(
+            [row["lat"], row["lon"]],
+            popup=folium.Popup(popup_html, max_width=300),
+            tooltip=f"{row['title']} ({category_name})",
+            icon=folium.Icon(color=category_colors.get(row["category_id"], "gray"), icon="info-sign"),
+        ).add_to(m)
+    return m
+
+
+def _cached_map(df, index, selected_categories, center, markers_radius, version):
+    m = create_base_map(
+        df, selected_categories, center[0], center[1],
+        index=index, markers_radius=markers_radius, data_version=version,
+    )
+    m.location = list(center)
+    return m
+
+
+def main(reruns: int = 20, markers_radius: float = 25_000):
+    df = load_data()
+    index = load_spatial_index()
+    version = load_data_version()
+    cats = sorted(categories)
+    rng = np.random.default_rng(0)
+    print(f"[map] Объектов: {len(df)}, перезапусков: {reruns}")
+
+    builders = (
+        ("folium.Marker", lambda center: _marker_map(df, index, cats, center, markers_radius)),
+        ("кэшируемый слой", lambda center: _cached_map(df, index, cats, center, markers_radius, version)),
+    )
+    for name, build in builders:
+        timings, sizes = [], []
+        for _ in range(reruns):
+            center = (56.3269 + rng.uniform(-0.01, 0.01), 44.0060 + rng.uniform(-0.015, 0.015))
+            started = time.perf_counter()
+            m = build(center)
+            create_route_layer(center, 1500).add_to(m)
+            # То же, что делает st_folium на каждом перезапуске
+            m.get_root().render()
+            script = _get_map_string(m)
+            timings.append(time.perf_counter() - started)
+            sizes.append(len(script.encode("utf-8")))
+        ms = np.asarray(timings) * 1000
+        print(
+            f"[map] {name}: p50 {np.percentile(ms, 50):.0f} мс, p95 {np.percentile(ms, 95):.0f} мс, "
+            f"скрипт карты {np.mean(sizes) / 1024:.0f} КБ"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,62 @@
+"""
+Загрузка геометрии маршрута через локальную заглушку OSRM: отрезки по очереди,
+параллельно через _fetch_route_legs и с одним отрезком дольше дедлайна.
+
+    python -m tests.bench_osrm_legs [stops] [repeats]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from src import map_utils
+from src.osrm_cache import route_geometry_cache
+from tests.stubs import OsrmStub
+
+
+def main(stops: int = 6, repeats: int = 5, delay: float = 0.3, deadline: float = 1.0):
+    route_geometry_cache._db_disabled_until = float("inf")
+    rng = np.random.default_rng(0)
+
+    def random_points():
+        # Новые точки на каждом повторе, чтобы не попадать в кэш геометрии
+        lats = 56.3269 + rng.uniform(-0.02, 0.02, stops)
+        lons = 44.0060 + rng.uniform(-0.03, 0.03, stops)
+        return [route_geometry_cache.snap(p) for p in zip(lats, lons)]
+
+    with OsrmStub(delay=delay) as stub:
+        map_utils.OSRM_BASE_URL = stub.url
+
+        def sequential(points):
+            return [map_utils._fetch_osrm_route(a, b) or [a, b] for a, b in zip(points, points[1:])]
+
+        def slow_leg(points):
+            stub.delays = {points[1]: deadline * 3}
+            return map_utils._fetch_route_legs(points, deadline=deadline)
+
+        print(f"[osrm] Заглушка OSRM: ответ {delay * 1000:.0f} мс, отрезков: {stops - 1}, повторов: {repeats}")
+        scenarios = (
+            ("по очереди", sequential),
+            ("параллельно", lambda points: map_utils._fetch_route_legs(points, deadline=deadline * 10)),
+            (f"один отрезок дольше дедлайна {deadline:.1f} с", slow_leg),
+        )
+        for name, fetch in scenarios:
+            timings, straight = [], 0
+            for _ in range(repeats):
+                points = random_points()
+                started = time.perf_counter()
+                legs = fetch(points)
+                timings.append(time.perf_counter() - started)
+                straight += sum(len(leg) == 2 for leg in legs)
+            ms = np.asarray(timings) * 1000
+            print(
+                f"[osrm] {name}: p50 {np.percentile(ms, 50):.0f} мс, max {ms.max():.0f} мс, "
+                f"прямых вместо геометрии: {straight}/{repeats * (stops - 1)}"
+            )
+        # Опоздавшие отрезки дорабатывают в фоне
+        time.sleep(deadline * 3)
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
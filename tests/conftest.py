@@ -0,0 +1,23 @@
+import time
+
+import pytest
+
+from src import map_utils
+from src.osrm_cache import route_geometry_cache
+from tests.stubs import OsrmStub
+
+
+@pytest.fixture
+def osrm(monkeypatch):
+    """Заглушка OSRM; кэш геометрии пуст и работает только в памяти (без обращений к БД)."""
+    monkeypatch.setattr(route_geometry_cache, "_db_disabled_until", float("inf"))
+    route_geometry_cache.clear_memory()
+    with OsrmStub() as stub:
+        monkeypatch.setattr(map_utils, "OSRM_BASE_URL", stub.url)
+        yield stub
+        # Отрезки, опоздавшие к дедлайну, дорабатывают в фоне — ждем их до закрытия заглушки
+        stop_at = time.monotonic() + 5
+        while stub.active and time.monotonic() < stop_at:
+            time.sleep(0.01)
+        time.sleep(0.05)
+    route_geometry_cache.clear_memory()
@@ -0,0 +1,152 @@
+"""Локальные заглушки внешних HTTP-сервисов (OSRM, Yandex GPT) для тестов и бенчмарков."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+
+class _StubServer:
+    """Сервер на свободном порту 127.0.0.1 в фоновом потоке; используется как контекстный менеджер."""
+
+    def _handler(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OsrmStub(_StubServer):
+    """
+    Заглушка OSRM route/v1: на /<profile>/lon,lat;lon,lat отвечает через delay
+    секунд линией из трех точек (начало, середина, конец). delays — своя задержка
+    для отрезков, начинающихся в точке (lat, lon). Считает запросы и наибольшее
+    число одновременных запросов.
+    """
+
+    def __init__(self, delay: float = 0.0, delays: Dict[Tuple[float, float], float] = None):
+        self.delay = delay
+        self.delays = dict(delays or {})
+        self.requests = 0
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        with self._lock:
+            return self._active
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                start, end = self.path.split("/")[-1].split("?")[0].split(";")
+                (lon1, lat1), (lon2, lat2) = (map(float, p.split(",")) for p in (start, end))
+                with stub._lock:
+                    stub.requests += 1
+                    stub._active += 1
+                    stub.max_active = max(stub.max_active, stub._active)
+                try:
+                    time.sleep(stub.delays.get((lat1, lon1), stub.delay))
+                finally:
+                    with stub._lock:
+                        stub._active -= 1
+                coords = [[lon1, lat1], [(lon1 + lon2) / 2, (lat1 + lat2) / 2], [lon2, lat2]]
+                body = json.dumps({"code": "Ok", "routes": [{"geometry": {"coordinates": coords}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class YandexGptStub(_StubServer):
+    """
+    Заглушка Yandex GPT: на /completion отвечает текстом из chunks фрагментов
+    "Фрагмент i описания маршрута. " с паузой delay между ними (chunked, как
+    настоящий API; при stream — строка JSON с текстом на текущий момент после
+    каждого фрагмента), на /tokenize — словами текста. status и hang — деградация
+    API: код ответа и пауза перед ответом. Адрес для клиента — completion_url.
+    """
+
+    def __init__(self, chunks: int = 40, delay: float = 0.05, status: int = 200, hang: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.status = status
+        self.hang = hang
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def completion_url(self) -> str:
+        return f"{self.url}/completion"
+
+    @staticmethod
+    def fragment(i: int) -> str:
+        return f"Фрагмент {i} описания маршрута. "
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if self.path.endswith("/tokenize"):
+                    body = json.dumps({"tokens": [{"text": w} for w in payload["text"].split()]}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                stream = payload["completionOptions"]["stream"]
+                time.sleep(stub.hang)
+                if stub.status != 200:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                text = ""
+                for i in range(stub.chunks):
+                    time.sleep(stub.delay)
+                    text += stub.fragment(i)
+                    if stream:
+                        line = {"result": {"alternatives": [{"message": {"role": "assistant", "text": text}}]}}
+                        self._send_chunk((json.dumps(line, ensure_ascii=False) + "\n").encode())
+                if not stream:
+                    result = {"result": {"alternatives": [{"message": {"role": "assistant", "text": text}}]}}
+                    self._send_chunk(json.dumps(result, ensure_ascii=False).encode())
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
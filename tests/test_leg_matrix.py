@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+from src.leg_matrix import LegMatrix
+from src.scoring import CatalogArrays
+
+
+def _matrix(n: int, seed: int) -> LegMatrix:
+    rng = np.random.default_rng(seed)
+    arrays = CatalogArrays.from_points(56.32 + rng.uniform(0, 0.01, n), 44.0 + rng.uniform(0, 0.01, n))
+    return LegMatrix.build(arrays, radius=800)
+
+
+def test_save_switches_whole_version(tmp_path):
+    path = str(tmp_path)
+    first, second = _matrix(20, 0), _matrix(35, 1)
+    first.save(path)
+    second.save(path)
+
+    loaded = LegMatrix.load(path, mmap=False)
+    for name in ("ids", "indptr", "indices", "distances", "times"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(second, name))
+    assert LegMatrix.current_dir(path).startswith(path)
+
+
+def test_save_keeps_only_recent_versions(tmp_path):
+    path = str(tmp_path)
+    for seed in range(4):
+        _matrix(10, seed).save(path, keep_versions=2)
+
+    versions = [e for e in os.listdir(path) if e.startswith("v")]
+    assert len(versions) == 2
+    assert os.path.basename(LegMatrix.current_dir(path)) in versions
+
+
+def test_missing_matrix(tmp_path):
+    assert LegMatrix.current_dir(str(tmp_path)) is None
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from src import llm_utils
+from src.explanation_cache import explanation_cache
+from src.llm_client import YandexGPTClient
+from src.llm_utils import start_route_explanation
+from tests.stubs import YandexGptStub
+
+CATEGORIES = {1: "Памятники"}
+
+
+@pytest.fixture(autouse=True)
+def memory_only(monkeypatch):
+    """Кэш объяснений пуст и работает только в памяти, короткие описания из БД не читаются."""
+    monkeypatch.setattr(explanation_cache, "_db_disabled_until", float("inf"))
+    monkeypatch.setattr(llm_utils, "load_location_summaries", lambda: {})
+    explanation_cache.clear_memory()
+    yield
+    explanation_cache.clear_memory()
+
+
+def _route(name: str):
+    return [{
+        "object": {"id": f"{name}-{i}", "title": f"Объект {i}", "description": "Описание объекта.",
+                   "category_id": 1},
+        "travel_time": 5.0, "visit_time": 15, "distance": 400.0,
+    } for i in range(3)]
+
+
+def _client(stub: YandexGptStub) -> YandexGPTClient:
+    return YandexGPTClient(url=stub.completion_url, api_key="test", folder_id="test", max_retries=0)
+
+
+def test_chunks_arrive_in_order():
+    with YandexGptStub(chunks=8, delay=0.02) as stub:
+        job = start_route_explanation(_route("order"), [1], 60, CATEGORIES, (56.32, 44.0), client=_client(stub))
+        seen = []
+        while not job.done:
+            seen.append(job.text)
+            time.sleep(0.005)
+        assert job.wait(5)
+
+    expected = "".join(stub.fragment(i) for i in range(stub.chunks))
+    assert job.text == expected
+    assert job.used_llm and job.error is None
+    # Текст только дописывается: каждое промежуточное состояние — начало итогового
+    partial = [text for text in seen if text and text != expected]
+    assert partial, "ответ пришел одним куском"
+    assert all(expected.startswith(text) for text in partial)
+    assert job.started_at < job.first_chunk_at
+
+
+def test_fallback_without_credentials(monkeypatch):
+    monkeypatch.delenv("YANDEXGPT_API_KEY", raising=False)
+    monkeypatch.delenv("YANDEXGPT_FOLDER_ID", raising=False)
+    with YandexGptStub() as stub:
+        client = YandexGPTClient(url=stub.completion_url, max_retries=0)
+        job = start_route_explanation(_route("fallback"), [1], 60, CATEGORIES, (56.32, 44.0), client=client)
+
+        # Задача готова сразу, запрос к API не отправлялся
+        assert job.done
+        assert stub.requests == 0
+    assert not job.used_llm
+    assert "Объект 0" in job.text
+
+
+def test_api_error_sets_job_error():
+    with YandexGptStub(status=500) as stub:
+        job = start_route_explanation(_route("error"), [1], 60, CATEGORIES, (56.32, 44.0), client=_client(stub))
+        assert job.wait(5)
+        assert stub.requests == 1
+    assert job.error and "500" in job.error
+    assert not job.used_llm
+    assert "Объект 0" in job.text
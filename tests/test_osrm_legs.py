@@ -0,0 +1,49 @@
+import time
+
+from src.map_utils import _fetch_route_legs
+from src.osrm_cache import route_geometry_cache
+
+
+def _points(n: int):
+    return [route_geometry_cache.snap((56.32 + i * 0.001, 44.0 + i * 0.001)) for i in range(n)]
+
+
+def test_legs_are_fetched_concurrently(osrm):
+    osrm.delay = 0.3
+    points = _points(6)
+
+    started = time.perf_counter()
+    legs = _fetch_route_legs(points, deadline=5)
+    elapsed = time.perf_counter() - started
+
+    assert osrm.requests == 5
+    assert osrm.max_active > 1
+    # По очереди это заняло бы 5 × 0.3 с
+    assert elapsed < 1.0
+    assert all(len(leg) == 3 for leg in legs)
+
+
+def test_leg_slower_than_deadline_falls_back_to_straight_line(osrm):
+    points = _points(4)
+    osrm.delays[points[1]] = 2.0
+
+    started = time.perf_counter()
+    legs = _fetch_route_legs(points, deadline=0.5)
+
+    assert time.perf_counter() - started < 1.5
+    assert legs[1] == [points[1], points[2]]
+    assert len(legs[0]) == 3 and len(legs[2]) == 3
+
+
+def test_leg_order_is_kept(osrm):
+    points = _points(5)
+    # Первые отрезки отвечают последними
+    for i, point in enumerate(points[:-1]):
+        osrm.delays[point] = 0.05 * (len(points) - i)
+
+    legs = _fetch_route_legs(points, deadline=5)
+
+    assert len(legs) == len(points) - 1
+    for i, leg in enumerate(legs):
+        assert tuple(leg[0]) == points[i]
+        assert tuple(leg[-1]) == points[i + 1]
@@ -0,0 +1,48 @@
+import itertools
+import time
+
+from src.route_cache import RouteCache
+from src.route_model import Route
+
+
+def _planner(delay: float = 0.0):
+    counter = itertools.count()
+
+    def plan():
+        n = next(counter)
+        time.sleep(delay)
+        return Route(ids=(str(n),), positions=(0,), travel_times=(1.0,), visit_times=(10,), distances=(5.0,))
+
+    return plan, counter
+
+
+def test_pool_fills_with_one_planner_call_per_request():
+    cache = RouteCache(pool_size=3, fill_seconds=10)
+    plan, counter = _planner()
+    key = cache.key((56.3, 44.0), [1], 60, 1000)
+
+    first = [cache.get_or_plan(key, plan).ids for _ in range(3)]
+    assert first == [("0",), ("1",), ("2",)]
+    for _ in range(5):
+        assert cache.get_or_plan(key, plan).ids in first
+    assert next(counter) == 3
+
+
+def test_fill_stops_after_time_budget():
+    cache = RouteCache(pool_size=10, fill_seconds=0.05)
+    plan, counter = _planner(delay=0.03)
+    key = cache.key((56.3, 44.0), [1], 60, 1000)
+
+    for _ in range(6):
+        cache.get_or_plan(key, plan)
+    assert next(counter) == 2
+
+
+def test_single_route_pool():
+    cache = RouteCache(pool_size=4)
+    plan, counter = _planner()
+    key = cache.key((56.3, 44.0), [1], 60, 1000, mode="optimized")
+
+    for _ in range(3):
+        cache.get_or_plan(key, plan, pool_size=1)
+    assert next(counter) == 1